@@ -5,12 +5,26 @@ import matplotlib.gridspec as gridspec
 import matplotlib.ticker as ticker
 from matplotlib import rcParams
 from datetime import timedelta
+import functools
 
 import numpy as np
 
+import plotRendering
+
 __author__ = 'Ben Dichter'
 
 
+def main_axis_contains_point(big_ax, axs, point, radius=None):
+    """only the legend and the space between the segments belong to the main axis big_ax"""
+    legend = big_ax.get_legend()
+    # legend frame from the last draw, the legend position itself depends on this function (via annotations)
+    if legend is not None and legend.get_visible() and legend.legendPatch.contains_point(point):
+        return True
+    if any(ax.patch.contains_point(point, radius) for ax in axs):
+        return False
+    return type(big_ax.patch).contains_point(big_ax.patch, point, radius)
+
+
 class BrokenAxes:
     def __init__(self, xlims=None, ylims=None, d=.01, tilt=45,
                  subplot_spec=None, fig=None, despine=True,
@@ -105,7 +119,7 @@ class BrokenAxes:
         gs = gridspec.GridSpec(*args, **kwargs)
         self.big_ax = self.fig.gca()
 
-        self.old_lines = self.fig.axes[0].get_lines()
+        self.old_lines = list(self.fig.axes[0].get_lines())
 
         xlabel = self.big_ax.get_xlabel()
         ylabel = self.big_ax.get_ylabel()
@@ -173,12 +187,15 @@ class BrokenAxes:
         # Set common x/y lim for ax in the same col/row
         # and share x and y between them
         for i, ax in enumerate(self.axs):
+            # Grouper.join isn't available for shared axes anymore (matplotlib >= 3.8), use sharex/sharey
             if ylims is not None:
                 ax.set_ylim(ylims[::-1][i // ncols])
-                ax.get_shared_y_axes().join(ax, self.first_col[i // ncols])
+                if ax is not self.first_col[i // ncols]:
+                    ax.sharey(self.first_col[i // ncols])
             if xlims is not None:
                 ax.set_xlim(xlims[i % ncols])
-                ax.get_shared_x_axes().join(ax, self.last_row[i % ncols])
+                if ax is not self.last_row[i % ncols]:
+                    ax.sharex(self.last_row[i % ncols])
                 ax.set_yticks(yticks)
                 ax.set_ylim(ymin, ymax)
         self.standardize_ticks()
@@ -186,17 +203,16 @@ class BrokenAxes:
             self.draw_diags()
         if despine:
             self.set_spines()
-        self.new_lines = []
-        for ax in self.axs:
-            self.new_lines.append([])
-            for line in self.old_lines:
-                new_line, = ax.plot(line.get_xdata(), line.get_ydata(), lw=line.get_lw(), ls=line.get_ls(),
-                                    c=line.get_c(), label=line.get_label())
-                new_line.set_marker(line.get_marker())
-                new_line.set_markersize(line.get_markersize())
-                new_line.set_markerfacecolor(line.get_markerfacecolor())
-                new_line.set_markeredgecolor(line.get_markeredgecolor())
-                self.new_lines[-1].append(new_line)
+        # the lines are moved into the first segment, so that the line objects (and all references to them) stay the
+        # same; the other segments draw the data of these lines without copying it
+        self.new_lines = [[]]
+        for line in self.old_lines:
+            self.axs[0].add_line(line)
+            line.set_transform(self.axs[0].transData)
+            line.set_clip_path(self.axs[0].patch)
+            self.new_lines[0].append(line)
+        for ax in self.axs[1:]:
+            self.new_lines.append([plotRendering.SharedLine(ax, line) for line in self.old_lines])
 
         self.big_ax.legend(
             self.axs[0].get_legend_handles_labels(),
@@ -214,6 +230,11 @@ class BrokenAxes:
             self.axs[l].set_zorder(l)
         self.big_ax.set_zorder(l + 1)
 
+        # the main axis is on top of the segments (because of the legend), mouse events (picking, moving spectra) have
+        # to belong to the segments nevertheless
+        # (module function instead of a method, so that the figure can still be pickled)
+        self.big_ax.patch.contains_point = functools.partial(main_axis_contains_point, self.big_ax, self.axs)
+
     @staticmethod
     def draw_diag(ax, xpos, xlen, ypos, ylen, **kwargs):
         return ax.plot((xpos - xlen, xpos + xlen), (ypos - ylen, ypos + ylen), label='_nolegend_',
@@ -396,7 +417,7 @@ class BrokenAxes:
         return self.big_ax.get_figure()
 
     def legend(self, *args, **kwargs):
-        h, l = self.axs[1].get_legend_handles_labels()
+        h, l = self.axs[0].get_legend_handles_labels()
         return self.big_ax.legend(h, l, *args, **kwargs)
 
     def axis(self, *args, **kwargs):
@@ -1,5 +1,8 @@
+import numpy as np
 from PyQt5 import QtGui, QtCore, QtWidgets
 
+import dataExport
+
 
 class ConvertUnitDialog(QtWidgets.QMainWindow):
     closeSignal = QtCore.pyqtSignal()
@@ -90,3 +93,570 @@ class ConvertUnitDialog(QtWidgets.QMainWindow):
         self.unit = str(self.unit_box.currentText())
         self.closeSignal.emit()
         self.close()
+
+
+class ExportOptionsDialog(QtWidgets.QMainWindow):
+    closeSignal = QtCore.pyqtSignal()
+
+    def __init__(self, parent, csv=False):
+        """
+        options dialog for the text export of the spreadsheet
+
+        Parameters
+        ----------
+        parent: spreadsheet window object
+        csv: True if the data is saved as csv file, the default delimiter is a comma then
+        """
+        super(ExportOptionsDialog, self).__init__(parent=parent)
+        self.parent = parent
+
+        self.precision_box = None
+        self.delimiter_box = None
+        self.missing_box = None
+        self.header_box = None
+        self.main_layout = None
+        self.ok_button = None
+        self.cancel_button = None
+        # keyword arguments for dataExport.write_columns, None if the dialog was cancelled
+        self.options = None
+
+        self.create_dialog(csv)
+
+    def create_dialog(self, csv):
+        dialog_layout = QtWidgets.QGridLayout()
+
+        precision_label = QtWidgets.QLabel("Decimals")
+        dialog_layout.addWidget(precision_label, 0, 0)
+        self.precision_box = QtWidgets.QSpinBox()
+        self.precision_box.setRange(0, 15)
+        self.precision_box.setValue(5)
+        dialog_layout.addWidget(self.precision_box, 0, 1)
+
+        delimiter_label = QtWidgets.QLabel("Delimiter")
+        dialog_layout.addWidget(delimiter_label, 1, 0)
+        self.delimiter_box = QtWidgets.QComboBox()
+        self.delimiter_box.addItems(list(dataExport.delimiters.keys()))
+        self.delimiter_box.setCurrentText("Comma" if csv else "Tab")
+        dialog_layout.addWidget(self.delimiter_box, 1, 1)
+
+        missing_label = QtWidgets.QLabel("Missing values")
+        dialog_layout.addWidget(missing_label, 2, 0)
+        self.missing_box = QtWidgets.QComboBox()
+        self.missing_box.addItems(["empty", "nan"])
+        dialog_layout.addWidget(self.missing_box, 2, 1)
+
+        self.header_box = QtWidgets.QCheckBox("Header (name, long name, unit, comments)")
+        self.header_box.setChecked(True)
+        dialog_layout.addWidget(self.header_box, 3, 0, 1, 2)
+
+        # cancel and ok button
+        button_layout = QtWidgets.QHBoxLayout()
+
+        self.ok_button = QtWidgets.QPushButton("Ok")
+        self.ok_button.clicked.connect(self.apply_ok)
+        button_layout.addWidget(self.ok_button)
+
+        self.cancel_button = QtWidgets.QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.apply_cancel)
+        button_layout.addWidget(self.cancel_button)
+
+        # put main layout together
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.main_layout.addLayout(dialog_layout)
+        self.main_layout.addLayout(button_layout)
+
+        # create placeholder widget
+        widget = QtWidgets.QWidget()
+        widget.setLayout(self.main_layout)
+        self.setCentralWidget(widget)
+
+        self.setWindowTitle("Export options")
+        self.setWindowModality(QtCore.Qt.ApplicationModal)
+
+    def apply_cancel(self):
+        self.close()
+
+    def closeEvent(self, event):
+        # closing the window is the same as cancel
+        self.closeSignal.emit()
+        super(ExportOptionsDialog, self).closeEvent(event)
+
+    def apply_ok(self):
+        """ ok was clicked"""
+        self.options = {
+            "precision": self.precision_box.value(),
+            "delimiter": dataExport.delimiters[self.delimiter_box.currentText()],
+            "missing_text": "" if self.missing_box.currentText() == "empty" else "nan",
+            "header": self.header_box.isChecked()
+        }
+        self.close()
+
+
+class ResampleDialog(QtWidgets.QMainWindow):
+    closeSignal = QtCore.pyqtSignal()
+
+    def __init__(self, parent, method_names, range_policies, step=1.0):
+        """
+        options dialog for resampling spreadsheet columns onto a common x axis
+
+        Parameters
+        ----------
+        parent: spreadsheet window object
+        method_names: names of the resampling methods
+        range_policies: names of the range policies (e.g. Intersection, Union)
+        step: start value of the grid step
+        """
+        super(ResampleDialog, self).__init__(parent=parent)
+        self.parent = parent
+
+        self.method_box = None
+        self.step_box = None
+        self.range_box = None
+        self.main_layout = None
+        self.ok_button = None
+        self.cancel_button = None
+        # selected method, step and range policy, None if the dialog was cancelled
+        self.options = None
+
+        self.create_dialog(method_names, range_policies, step)
+
+    def create_dialog(self, method_names, range_policies, step):
+        dialog_layout = QtWidgets.QGridLayout()
+
+        method_label = QtWidgets.QLabel("Method")
+        dialog_layout.addWidget(method_label, 0, 0)
+        self.method_box = QtWidgets.QComboBox()
+        self.method_box.addItems(method_names)
+        dialog_layout.addWidget(self.method_box, 0, 1)
+
+        step_label = QtWidgets.QLabel("Step")
+        dialog_layout.addWidget(step_label, 1, 0)
+        self.step_box = QtWidgets.QDoubleSpinBox()
+        self.step_box.setDecimals(4)
+        self.step_box.setRange(0.0001, 1000000)
+        self.step_box.setValue(step)
+        dialog_layout.addWidget(self.step_box, 1, 1)
+
+        range_label = QtWidgets.QLabel("Range")
+        dialog_layout.addWidget(range_label, 2, 0)
+        self.range_box = QtWidgets.QComboBox()
+        self.range_box.addItems(range_policies)
+        self.range_box.setToolTip("Intersection: overlap of all x ranges\n"
+                                  "Union: whole x range, missing values are NaN")
+        dialog_layout.addWidget(self.range_box, 2, 1)
+
+        # cancel and ok button
+        button_layout = QtWidgets.QHBoxLayout()
+
+        self.ok_button = QtWidgets.QPushButton("Ok")
+        self.ok_button.clicked.connect(self.apply_ok)
+        button_layout.addWidget(self.ok_button)
+
+        self.cancel_button = QtWidgets.QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.apply_cancel)
+        button_layout.addWidget(self.cancel_button)
+
+        # put main layout together
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.main_layout.addLayout(dialog_layout)
+        self.main_layout.addLayout(button_layout)
+
+        # create placeholder widget
+        widget = QtWidgets.QWidget()
+        widget.setLayout(self.main_layout)
+        self.setCentralWidget(widget)
+
+        self.setWindowTitle("Resample")
+        self.setWindowModality(QtCore.Qt.ApplicationModal)
+
+    def apply_cancel(self):
+        self.close()
+
+    def closeEvent(self, event):
+        # closing the window is the same as cancel
+        self.closeSignal.emit()
+        super(ResampleDialog, self).closeEvent(event)
+
+    def apply_ok(self):
+        """ ok was clicked"""
+        self.options = {
+            "method": self.method_box.currentText(),
+            "step": self.step_box.value(),
+            "range_policy": self.range_box.currentText()
+        }
+        self.close()
+
+
+class RowFilterDialog(QtWidgets.QMainWindow):
+    closeSignal = QtCore.pyqtSignal()
+
+    def __init__(self, parent, column_names, limits, column=0):
+        """
+        dialog to show only the spreadsheet rows with values of a column inside a range
+
+        Parameters
+        ----------
+        parent: spreadsheet window object
+        column_names: names of all columns
+        limits: minimum and maximum of every column, used as start values
+        column: index of the column selected at the start
+        """
+        super(RowFilterDialog, self).__init__(parent=parent)
+        self.parent = parent
+        self.limits = limits
+
+        self.column_box = None
+        self.low_edit = None
+        self.high_edit = None
+        self.main_layout = None
+        self.ok_button = None
+        self.cancel_button = None
+        # selected column, lower and upper limit, None if the dialog was cancelled
+        self.options = None
+
+        self.create_dialog(column_names, column)
+
+    def create_dialog(self, column_names, column):
+        dialog_layout = QtWidgets.QGridLayout()
+
+        column_label = QtWidgets.QLabel("Column")
+        dialog_layout.addWidget(column_label, 0, 0)
+        self.column_box = QtWidgets.QComboBox()
+        self.column_box.addItems(column_names)
+        dialog_layout.addWidget(self.column_box, 0, 1)
+
+        low_label = QtWidgets.QLabel("From")
+        dialog_layout.addWidget(low_label, 1, 0)
+        self.low_edit = QtWidgets.QLineEdit()
+        dialog_layout.addWidget(self.low_edit, 1, 1)
+
+        high_label = QtWidgets.QLabel("To")
+        dialog_layout.addWidget(high_label, 2, 0)
+        self.high_edit = QtWidgets.QLineEdit()
+        dialog_layout.addWidget(self.high_edit, 2, 1)
+
+        self.column_box.currentIndexChanged.connect(self.show_limits)
+        self.column_box.setCurrentIndex(column)
+        self.show_limits(column)
+
+        # cancel and ok button
+        button_layout = QtWidgets.QHBoxLayout()
+
+        self.ok_button = QtWidgets.QPushButton("Ok")
+        self.ok_button.clicked.connect(self.apply_ok)
+        button_layout.addWidget(self.ok_button)
+
+        self.cancel_button = QtWidgets.QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.apply_cancel)
+        button_layout.addWidget(self.cancel_button)
+
+        # put main layout together
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.main_layout.addLayout(dialog_layout)
+        self.main_layout.addLayout(button_layout)
+
+        # create placeholder widget
+        widget = QtWidgets.QWidget()
+        widget.setLayout(self.main_layout)
+        self.setCentralWidget(widget)
+
+        self.setWindowTitle("Filter rows")
+        self.setWindowModality(QtCore.Qt.ApplicationModal)
+
+    def show_limits(self, column):
+        """show minimum and maximum of the selected column"""
+        low, high = self.limits[column]
+        self.low_edit.setText(str(low))
+        self.high_edit.setText(str(high))
+
+    def apply_cancel(self):
+        self.close()
+
+    def closeEvent(self, event):
+        # closing the window is the same as cancel
+        self.closeSignal.emit()
+        super(RowFilterDialog, self).closeEvent(event)
+
+    def apply_ok(self):
+        """ ok was clicked"""
+        try:
+            low = float(self.low_edit.text())
+            high = float(self.high_edit.text())
+        except ValueError:
+            self.parent.mw.show_statusbar_message("Please enter numbers as limits", 4000)
+            return
+        self.options = {
+            "column": self.column_box.currentIndex(),
+            "low": min(low, high),
+            "high": max(low, high)
+        }
+        self.close()
+
+
+class DecompositionDialog(QtWidgets.QMainWindow):
+    closeSignal = QtCore.pyqtSignal()
+
+    def __init__(self, parent, method_names, max_components, n_components=2):
+        """
+        dialog to choose the method and the number of components of a PCA or NMF
+
+        Parameters
+        ----------
+        parent: spreadsheet window object
+        method_names: names of the methods
+        max_components: maximal number of components
+        n_components: start value of the number of components
+        """
+        super(DecompositionDialog, self).__init__(parent=parent)
+        self.parent = parent
+
+        self.method_box = None
+        self.components_box = None
+        self.main_layout = None
+        self.ok_button = None
+        self.cancel_button = None
+        # selected method and number of components, None if the dialog was cancelled
+        self.options = None
+
+        self.create_dialog(method_names, max_components, n_components)
+
+    def create_dialog(self, method_names, max_components, n_components):
+        dialog_layout = QtWidgets.QGridLayout()
+
+        method_label = QtWidgets.QLabel("Method")
+        dialog_layout.addWidget(method_label, 0, 0)
+        self.method_box = QtWidgets.QComboBox()
+        self.method_box.addItems(method_names)
+        dialog_layout.addWidget(self.method_box, 0, 1)
+
+        components_label = QtWidgets.QLabel("Number of components")
+        dialog_layout.addWidget(components_label, 1, 0)
+        self.components_box = QtWidgets.QSpinBox()
+        self.components_box.setRange(1, max_components)
+        self.components_box.setValue(min(n_components, max_components))
+        self.components_box.setToolTip("For PCA this is the maximal number of components, the components used can be "
+                                       "chosen with the explained variance after the fit")
+        dialog_layout.addWidget(self.components_box, 1, 1)
+
+        # cancel and ok button
+        button_layout = QtWidgets.QHBoxLayout()
+
+        self.ok_button = QtWidgets.QPushButton("Ok")
+        self.ok_button.clicked.connect(self.apply_ok)
+        button_layout.addWidget(self.ok_button)
+
+        self.cancel_button = QtWidgets.QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.apply_cancel)
+        button_layout.addWidget(self.cancel_button)
+
+        # put main layout together
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.main_layout.addLayout(dialog_layout)
+        self.main_layout.addLayout(button_layout)
+
+        # create placeholder widget
+        widget = QtWidgets.QWidget()
+        widget.setLayout(self.main_layout)
+        self.setCentralWidget(widget)
+
+        self.setWindowTitle("Decomposition")
+        self.setWindowModality(QtCore.Qt.ApplicationModal)
+
+    def apply_cancel(self):
+        self.close()
+
+    def closeEvent(self, event):
+        # closing the window is the same as cancel
+        self.closeSignal.emit()
+        super(DecompositionDialog, self).closeEvent(event)
+
+    def apply_ok(self):
+        """ ok was clicked"""
+        self.options = {
+            "method": self.method_box.currentText(),
+            "n_components": self.components_box.value()
+        }
+        self.close()
+
+
+class DecompositionResultDialog(QtWidgets.QMainWindow):
+    closeSignal = QtCore.pyqtSignal()
+
+    def __init__(self, parent, result):
+        """
+        shows the explained variance of the components of a fitted PCA or NMF, the loadings and scores of the chosen
+        number of components can be inserted into spreadsheets (also several times, without fitting again)
+
+        Parameters
+        ----------
+        parent: spreadsheet window object
+        result: spectraDecomposition.DecompositionResult
+        """
+        super(DecompositionResultDialog, self).__init__(parent=parent)
+        self.parent = parent
+        self.result = result
+
+        self.variance_table = None
+        self.components_box = None
+        self.main_layout = None
+
+        self.create_dialog()
+
+    def create_dialog(self):
+        ratio = self.result.explained_variance_ratio
+        cumulative = np.cumsum(ratio)
+        self.variance_table = QtWidgets.QTableWidget(len(ratio), 2)
+        self.variance_table.setHorizontalHeaderLabels(["Explained variance", "Cumulative"])
+        self.variance_table.setVerticalHeaderLabels([str(i + 1) for i in range(len(ratio))])
+        self.variance_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        for r in range(len(ratio)):
+            self.variance_table.setItem(r, 0, QtWidgets.QTableWidgetItem("{:.3%}".format(ratio[r])))
+            self.variance_table.setItem(r, 1, QtWidgets.QTableWidgetItem("{:.3%}".format(cumulative[r])))
+        self.variance_table.cellClicked.connect(lambda row, col: self.components_box.setValue(row + 1))
+
+        components_layout = QtWidgets.QHBoxLayout()
+        components_layout.addWidget(QtWidgets.QLabel("Components used"))
+        self.components_box = QtWidgets.QSpinBox()
+        self.components_box.setRange(1, self.result.n_components)
+        self.components_box.setValue(self.result.components_for(0.95))
+        components_layout.addWidget(self.components_box)
+
+        button_layout = QtWidgets.QHBoxLayout()
+        loadings_button = QtWidgets.QPushButton("Insert loadings")
+        loadings_button.setToolTip("Add the components as new columns to the spreadsheet")
+        loadings_button.clicked.connect(lambda: self.parent.insert_loadings(self.result.truncate(
+            self.components_box.value())))
+        button_layout.addWidget(loadings_button)
+        scores_button = QtWidgets.QPushButton("Show scores")
+        scores_button.setToolTip("Open the scores of every spectrum in a new spreadsheet")
+        scores_button.clicked.connect(lambda: self.parent.show_scores(self.result.truncate(
+            self.components_box.value())))
+        button_layout.addWidget(scores_button)
+        close_button = QtWidgets.QPushButton("Close")
+        close_button.clicked.connect(self.close)
+        button_layout.addWidget(close_button)
+
+        # put main layout together
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.main_layout.addWidget(self.variance_table)
+        self.main_layout.addLayout(components_layout)
+        self.main_layout.addLayout(button_layout)
+
+        # create placeholder widget
+        widget = QtWidgets.QWidget()
+        widget.setLayout(self.main_layout)
+        self.setCentralWidget(widget)
+
+        self.setWindowTitle(self.result.method)
+
+    def closeEvent(self, event):
+        self.closeSignal.emit()
+        super(DecompositionResultDialog, self).closeEvent(event)
+
+
+class StackPlotDialog(QtWidgets.QMainWindow):
+    closeSignal = QtCore.pyqtSignal()
+
+    colormaps = ["viridis", "plasma", "inferno", "magma", "cividis", "turbo", "coolwarm", "jet", "rainbow", "Greys"]
+
+    def __init__(self, parent, color_sources, options):
+        """
+        dialog with the options of a stack plot (many spectra drawn as one collection with a colorbar)
+
+        Parameters
+        ----------
+        parent: spreadsheet or stack plot window object
+        color_sources: names of the values, which can be mapped to the colormap
+        options: start values, dictionary with the keys 'color by', 'colormap', 'offset' and 'line width'
+        """
+        super(StackPlotDialog, self).__init__(parent=parent)
+        self.parent = parent
+
+        self.color_box = None
+        self.colormap_box = None
+        self.offset_box = None
+        self.linewidth_box = None
+        self.main_layout = None
+        self.ok_button = None
+        self.cancel_button = None
+        # selected options, None if the dialog was cancelled
+        self.options = None
+
+        self.create_dialog(color_sources, options)
+
+    def create_dialog(self, color_sources, options):
+        dialog_layout = QtWidgets.QGridLayout()
+
+        color_label = QtWidgets.QLabel("Color by")
+        dialog_layout.addWidget(color_label, 0, 0)
+        self.color_box = QtWidgets.QComboBox()
+        self.color_box.addItems(color_sources)
+        self.color_box.setCurrentText(options["color by"])
+        self.color_box.setToolTip("Long names, comments and file names can be used, if every entry contains a number")
+        dialog_layout.addWidget(self.color_box, 0, 1)
+
+        colormap_label = QtWidgets.QLabel("Colormap")
+        dialog_layout.addWidget(colormap_label, 1, 0)
+        self.colormap_box = QtWidgets.QComboBox()
+        self.colormap_box.addItems(self.colormaps)
+        self.colormap_box.setEditable(True)
+        self.colormap_box.setCurrentText(options["colormap"])
+        dialog_layout.addWidget(self.colormap_box, 1, 1)
+
+        offset_label = QtWidgets.QLabel("Offset between spectra")
+        dialog_layout.addWidget(offset_label, 2, 0)
+        self.offset_box = QtWidgets.QDoubleSpinBox()
+        self.offset_box.setRange(-1e12, 1e12)
+        self.offset_box.setDecimals(4)
+        self.offset_box.setValue(options["offset"])
+        dialog_layout.addWidget(self.offset_box, 2, 1)
+
+        linewidth_label = QtWidgets.QLabel("Line width")
+        dialog_layout.addWidget(linewidth_label, 3, 0)
+        self.linewidth_box = QtWidgets.QDoubleSpinBox()
+        self.linewidth_box.setRange(0.1, 20)
+        self.linewidth_box.setSingleStep(0.5)
+        self.linewidth_box.setValue(options["line width"])
+        dialog_layout.addWidget(self.linewidth_box, 3, 1)
+
+        # cancel and ok button
+        button_layout = QtWidgets.QHBoxLayout()
+
+        self.ok_button = QtWidgets.QPushButton("Ok")
+        self.ok_button.clicked.connect(self.apply_ok)
+        button_layout.addWidget(self.ok_button)
+
+        self.cancel_button = QtWidgets.QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.apply_cancel)
+        button_layout.addWidget(self.cancel_button)
+
+        # put main layout together
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.main_layout.addLayout(dialog_layout)
+        self.main_layout.addLayout(button_layout)
+
+        # create placeholder widget
+        widget = QtWidgets.QWidget()
+        widget.setLayout(self.main_layout)
+        self.setCentralWidget(widget)
+
+        self.setWindowTitle("Stack plot")
+        self.setWindowModality(QtCore.Qt.ApplicationModal)
+
+    def apply_cancel(self):
+        self.close()
+
+    def closeEvent(self, event):
+        # closing the window is the same as cancel
+        self.closeSignal.emit()
+        super(StackPlotDialog, self).closeEvent(event)
+
+    def apply_ok(self):
+        """ ok was clicked"""
+        self.options = {
+            "color by": self.color_box.currentText(),
+            "colormap": self.colormap_box.currentText(),
+            "offset": self.offset_box.value(),
+            "line width": self.linewidth_box.value()
+        }
+        self.close()
@@ -1,4 +1,5 @@
 # author: Simon Brehm
+import contextlib
 import io
 import json
 import math
@@ -6,15 +7,13 @@ import matplotlib
 import matplotlib.colors as mcolors
 import matplotlib.patches as mpatches
 import numpy as np
-import operator
 import os
 import pickle
 import prettytable
-import rampy as rp
-import re
 import scipy
 import sys
 import glob
+import time
 
 import setuptools.namespaces
 from matplotlib.figure import Figure
@@ -29,17 +28,24 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QTableWidget, QMessageBo
 from matplotlib.backends.qt_editor import _formlayout as formlayout
 from scipy import signal, stats
 from scipy.optimize import curve_fit
-from sklearn import decomposition
 
 # Import files
 import myfigureoptions
 import databaseMeasurements
 import analysisRoutine
-from BrokenAxes import brokenaxes
 import databaseSpectra
 import analysisMethods
 import peakFitting
 import DialogClasses
+import parallelAnalysis
+import formulaEngine
+import dataExport
+import spreadsheetTools
+import undoStack
+import spectraDecomposition
+import plotRendering
+import plotInteraction
+import figureBuilder
 
 
 # This file essentially consists of four parts:
@@ -221,7 +227,7 @@ class MainWindow(QMainWindow):
 
     def __init__(self, parent=None):
         super(MainWindow, self).__init__(parent)
-        self.window_types = ['Folder', 'Spreadsheet', 'Plotwindow', 'Textwindow']
+        self.window_types = ['Folder', 'Spreadsheet', 'Plotwindow', 'Textwindow', 'Stackplot', 'Heatmap']
         self.window = {}  # dictionary with windows
         self.windowWidget = {}
         for j in self.window_types:
@@ -236,6 +242,17 @@ class MainWindow(QMainWindow):
         self.treeWidget = RamanTreeWidget(self)  # Qtreewidget, to control open windows
         self.tabWidget = QtWidgets.QTabWidget()
         self.statusBar = QtWidgets.QStatusBar()
+        # shared memory segments and analysis jobs of the windows
+        self.shared_memory = parallelAnalysis.SharedMemoryRegistry()
+        # worker processes for all analysis operations, started as soon as the event loop runs
+        self.worker_pool = parallelAnalysis.AnalysisWorkerPool()
+        QtCore.QTimer.singleShot(0, self.worker_pool.start)
+        # text exports running in background threads
+        self.export_threads = []
+        # exports with more values are written in a background thread
+        self.background_export_size = 200000
+        # memory budget of the undo stack of every spreadsheet and plot window in MB
+        self.undo_memory_budget = 256
 
         self.create_mainwindow()
 
@@ -287,10 +304,110 @@ class MainWindow(QMainWindow):
 
         menu_tools = menu.addMenu("Tools")
         menu_tools.addAction("Database for measurements", self.execute_database_measurements)
+        menu_tools.addAction("Number of worker processes", self.set_worker_pool_size)
+        menu_tools.addAction("Check worker processes", self.check_worker_pool)
+        menu_tools.addAction("Memory limit for undo", self.set_undo_memory_budget)
 
     def show_statusbar_message(self, message, time, error_sound=False):
         self.statusBar.showMessage(message, time)
 
+    def set_worker_pool_size(self):
+        n_workers, ok = QtWidgets.QInputDialog.getInt(
+            self, "Worker processes", "Number of worker processes for the analysis (0 = no parallel processing)",
+            value=self.worker_pool.n_workers, min=0, max=os.cpu_count() or 1)
+        if ok:
+            self.worker_pool.resize(n_workers)
+            self.show_statusbar_message("{} worker processes".format(self.worker_pool.n_workers), 3000)
+
+    def check_worker_pool(self):
+        if self.worker_pool.health_check():
+            self.show_statusbar_message("All {} worker processes are running".format(self.worker_pool.n_workers), 3000)
+        else:
+            self.show_statusbar_message("The worker processes didn't respond and were restarted", 4000)
+
+    def set_undo_memory_budget(self):
+        budget, ok = QtWidgets.QInputDialog.getInt(
+            self, "Undo", "Memory limit for the undo history of every window in MB (the oldest steps are removed "
+                          "first)", value=self.undo_memory_budget, min=1, max=100000)
+        if not ok:
+            return
+        self.undo_memory_budget = budget
+        for window_type in ["Spreadsheet", "Plotwindow"]:
+            for window in self.window[window_type].values():
+                window.undo_stack.set_memory_budget(budget * 1024 ** 2)
+
+    def run_analysis_job(self, owner, kind, method, params, x, y_stack):
+        """
+        analysis of a stack of spectra with the same x data, large stacks are processed by the worker pool,
+        the GUI stays responsive while waiting
+        @param owner: window which started the job, the job is cancelled when the window is closed
+        @param kind: 'baseline', 'smoothing' or 'fit' (see parallelAnalysis.StackJob)
+        @param method: name of the method
+        @param params: parameters of the method
+        @param x: x data, shape (m,)
+        @param y_stack: y data, shape (n, m)
+        @return: list of result arrays or None if the job was cancelled
+        """
+        executor = self.worker_pool if self.worker_pool.use_for(len(y_stack)) else None
+        job = parallelAnalysis.StackJob(self.shared_memory, owner, kind, method, params, x, y_stack,
+                                        executor=executor)
+        # wait for the job, the GUI stays responsive; the done callback runs in a thread of the executor, so quit is
+        # queued to the GUI thread
+        loop = QtCore.QEventLoop()
+        job.add_done_callback(
+            lambda _job: QtCore.QMetaObject.invokeMethod(loop, "quit", QtCore.Qt.QueuedConnection))
+        if not job.done():
+            loop.exec_()
+        try:
+            results = job.result()
+        except parallelAnalysis.BrokenProcessPool:
+            job.cancel()
+            self.show_statusbar_message("A worker process crashed, the worker processes are restarted", 4000)
+            self.worker_pool.restart()
+            job = parallelAnalysis.StackJob(self.shared_memory, owner, kind, method, params, x, y_stack)
+            results = job.result()
+        if job.errors:
+            self.show_statusbar_message("{} of {} spectra failed ({})".format(len(job.failed), len(y_stack),
+                                                                             job.errors[0]), 4000)
+            print("\n".join(sorted(set(job.errors))))
+        elif job.failed:
+            self.show_statusbar_message("{} of {} spectra failed".format(len(job.failed), len(y_stack)), 4000)
+        return results
+
+    def export_columns(self, file_name, columns, **options):
+        """
+        write numeric columns into a text file, large exports run in a background thread with progress in the
+        status bar
+        @param file_name: name of the file
+        @param columns: list of 1D arrays, the columns can have different lengths
+        @param options: keyword arguments of dataExport.write_columns (header, precision, delimiter, ...)
+        """
+        n_values = sum(len(c) for c in columns)
+        if n_values <= self.background_export_size:
+            try:
+                dataExport.write_columns(file_name, columns, **options)
+            except Exception as e:
+                self.show_statusbar_message(str(e), 4000)
+                print(e)
+            return
+
+        thread = dataExport.ExportThread(file_name, columns, parent=self, **options)
+        file_base_name = os.path.basename(file_name)
+        thread.progress.connect(lambda percent: self.show_statusbar_message(
+            "Saving {} ... {} %".format(file_base_name, percent), 0))
+        thread.failed.connect(lambda message: print(message))
+
+        def export_finished():
+            self.export_threads.remove(thread)
+            if thread.completed:
+                self.show_statusbar_message("{} saved".format(file_base_name), 3000)
+            else:
+                self.show_statusbar_message("{} could not be saved".format(file_base_name), 4000)
+
+        thread.finished.connect(export_finished)
+        self.export_threads.append(thread)
+        thread.start()
+
     def keyPressEvent(self, event):
         """
         A few shortcuts
@@ -394,6 +511,8 @@ class MainWindow(QMainWindow):
                     window_content = self.get_save_data_plotwindow(window)
                 elif win_type == "Textwindow":
                     window_content = window.text
+                elif win_type in ["Stackplot", "Heatmap"]:
+                    window_content = window.get_save_data()
                 save_dict[key].append([win_name, win_type, window_content])
 
         # save with json
@@ -590,7 +709,8 @@ class MainWindow(QMainWindow):
                 window_data[idx]["line options"]["error bar line width"] = caplines[0].get_markeredgewidth()
                 window_data[idx]["line options"]["error bar color"] = error_color
 
-        figure_settings = {"general": general, "axis options": axis_options, "legend": legend}
+        figure_settings = {"general": general, "axis options": axis_options, "legend": legend,
+                           "rasterization": plotRendering.rasterization_settings(fig)}
         save_data = [window_data, {"figure settings": figure_settings, "annotations": annotations}]
 
         return save_data
@@ -607,7 +727,7 @@ class MainWindow(QMainWindow):
 
     def activate_window(self, item):
         text = item.text(0)
-        winTypInt = item.type()  # 0 - Folder, 1 - Spreadsheet, 2 - Plotwindow, 3 - Textwindow
+        winTypInt = item.type()  # 0 - Folder, 1 - Spreadsheet, 2 - Plotwindow, 3 - Textwindow, 4 - Stackplot, 5 - Heatmap
 
         if winTypInt == 0:  #
             self.tabWidget.setCurrentWidget(self.folder[text][1])
@@ -659,6 +779,8 @@ class MainWindow(QMainWindow):
                         data = [window_type, [window.data.copy(), fig_copy]]
                     elif window_type == "Textwindow":
                         data = [window_type, window.text]
+                    elif window_type in ["Stackplot", "Heatmap"]:
+                        data = [window_type, window.get_save_data()]
                     else:
                         return
                     folder_name = self.tabWidget.tabText(self.tabWidget.currentIndex())
@@ -774,142 +896,7 @@ class MainWindow(QMainWindow):
             self.tabWidget.currentWidget().tileSubWindows()
 
     def create_figure(self, settings_dictionary, data):
-        fig = Figure(figsize=(15, 9))
-        ax = fig.add_subplot(111)
-
-        figure_settings = settings_dictionary["figure settings"]
-
-        # Set general figure settings
-        general = figure_settings["general"]
-
-        ax.set_title(general["title"])
-        ax.title.set_fontsize(general["title font size"])
-
-        ax.set_xlabel(general["x label"])
-        ax.xaxis.labelpad = general["x label pad"]
-        ax.set_ylabel(general["y label"])
-        ax.yaxis.labelpad = general["y label pad"]
-        ax.xaxis.label.set_size(general["label font size"])
-        ax.yaxis.label.set_size(general["label font size"])
-
-        axis_option = figure_settings["axis options"]
-
-        if ax.get_xscale() != axis_option["x scale"]:
-            ax.set_xscale(axis_option["x scale"])
-        if ax.get_yscale() != axis_option["y scale"]:
-            ax.set_yscale(axis_option["y scale"])
-
-        if axis_option["x tick step size"] is not None:
-            x_tick = axis_option["x tick step size"]
-            xtick_space_start = math.ceil(axis_option["x lower limit"] / x_tick) * x_tick
-            ax.xaxis.set_ticks(np.arange(xtick_space_start, axis_option["x upper limit"], x_tick))
-            ax.xaxis.set_ticks(np.arange(xtick_space_start, axis_option["x upper limit"], x_tick))
-        else:
-            ax.xaxis.set_ticks([])
-        ax.set_xlim(axis_option["x lower limit"], axis_option["x upper limit"])
-        ax.xaxis.set_tick_params(labelsize=general["tick size"])
-
-        if axis_option["y tick step size"] is not None:
-            y_tick = axis_option["y tick step size"]
-            ytick_space_start = math.ceil(axis_option["y lower limit"] / y_tick) * y_tick
-            ax.yaxis.set_ticks(np.arange(ytick_space_start, axis_option["y upper limit"], y_tick))
-        else:
-            ax.yaxis.set_ticks([])
-        ax.set_ylim(axis_option["y lower limit"], axis_option["y upper limit"])
-        ax.yaxis.set_tick_params(labelsize=general["tick size"])
-
-        ax.grid(general["grid"])
-
-        # plot data in figure
-        for d in data:
-            if d["yerr"] is not None:  # errorbars
-                if d["plot type"] is None:
-                    d["plot type"] = "o"
-                (spect, caplines, barlinecol) = ax.errorbar(d["x"], d["y"], yerr=d["yerr"], fmt=d["plot type"],
-                                                            picker=True, pickradius=5, capsize=3,
-                                                            label="_Hidden errorbar {}".format(d["label"]))
-                spect.set_label(d["label"])
-                if "line options" in d.keys():
-                    if "error bar line width" in d["line options"].keys():
-                        dlo = d["line options"]
-                        for capline in caplines:
-                            capline.set_markersize(dlo["error bar cap size"])
-                            capline.set_markeredgewidth(dlo["error bar line width"])
-                            capline.set_markerfacecolor(dlo["error bar color"])
-                            capline.set_markeredgecolor(dlo["error bar color"])
-                        barlinecol[0].set_linewidth(dlo["error bar line width"])
-                        barlinecol[0].set_color(dlo["error bar color"])
-                else:
-                    print("no line options")
-
-            else:
-                try:
-                    spect, = ax.plot(d["x"], d["y"], d["plot type"], label=d["label"], picker=True, pickradius=5)
-                except ValueError as e:
-                    print(e)
-                    print(d["label"])
-                    if d["plot type"] is None:
-                        d["plot type"] = "-"
-                        spect, = ax.plot(d["x"], d["y"], d["plot type"], label=d["label"], picker=True, pickradius=5)
-            if "line options" in d.keys():
-                line_options = d["line options"]
-                spect.set_linestyle(line_options["line style"])
-                spect.set_drawstyle(line_options["draw style"])
-                spect.set_linewidth(line_options["line width"])
-                rgba = mcolors.to_rgba(line_options["color"])
-                spect.set_alpha(None)
-                spect.set_color(rgba)
-                if line_options["marker style"] != "none":
-                    spect.set_marker(line_options["marker style"])
-                    spect.set_markersize(line_options["marker size"])
-                    spect.set_markerfacecolor(line_options["marker face color"])
-                    spect.set_markeredgecolor(line_options["marker edge color"])
-            else:
-                print("no line options in dict")
-            d["line"] = spect
-
-        if axis_option["axis break"]:
-            baxes = brokenaxes(xlims=((axis_option["x lower limit"], axis_option["x upper limit"]),
-                                      (axis_option["x lower limit 2"], axis_option["x upper limit 2"])), fig=fig)
-            for d in data:
-                for ol, nl in zip(baxes.old_lines, baxes.new_lines[0]):
-                    if ol == d["line"]:
-                        d["line"] = nl
-
-            handles, labels = fig.axes[2].get_legend_handles_labels()
-        else:
-            handles, labels = ax.get_legend_handles_labels()
-
-        # Set legend
-        legend = figure_settings["legend"]
-
-        new_legend = ax.legend(handles, labels,
-                               ncol=legend["columns"],
-                               fontsize=float(legend["font size"]),
-                               frameon=legend["frame"],
-                               shadow=legend["shadow"],
-                               framealpha=legend["alpha"],
-                               fancybox=legend["fancy box"])
-
-        new_legend.set_visible(legend["visible"])
-        new_legend.set_picker(legend["picker"])
-        new_legend.set_draggable(legend["draggable"])
-
-        # insert text and arrows
-        for a in settings_dictionary["annotations"]["arrows"]:
-            arrow = mpatches.FancyArrowPatch(a["posA"], a["posB"], mutation_scale=10, picker=50)
-            arrow.set_linewidth(a["line width"])
-            arrow.set_linestyle(a["line style"])
-            arrow.set_color(a["color"])
-            if a["style"] != '-':
-                arrow.set_arrowstyle(a["style"], head_length=a["head length"], head_width=a["head width"])
-            else:
-                arrow.set_arrowstyle(a["style"])
-            arrow.set_figure(fig)
-            ax.add_patch(arrow)
-        for t in settings_dictionary["annotations"]["text"]:
-            ax.annotate(t["text"], t["position"], picker=True, fontsize=t["font size"], color=t["color"])
-        return fig
+        return figureBuilder.create_figure(settings_dictionary, data)
 
     def new_window(self, folder_name, window_type, window_content, title):
 
@@ -971,6 +958,18 @@ class MainWindow(QMainWindow):
             txt = window_content
             self.window[window_type][title] = TextWindow(self, txt)
             icon = QIcon(os.path.dirname(os.path.realpath(__file__)) + "/Icons/Icon_textwindow.png")
+        elif window_type == "Stackplot":
+            window_type_int = 4
+            window_content["x"] = [np.asarray(x, dtype=float) for x in window_content["x"]]
+            window_content["y"] = [np.asarray(y, dtype=float) for y in window_content["y"]]
+            self.window[window_type][title] = StackPlotWindow(self, window_content)
+            icon = QIcon(os.path.dirname(os.path.realpath(__file__)) + "/Icons/Icon_plotwindow.png")
+        elif window_type == "Heatmap":
+            window_type_int = 5
+            window_content["x"] = [np.asarray(x, dtype=float) for x in window_content["x"]]
+            window_content["y"] = [np.asarray(y, dtype=float) for y in window_content["y"]]
+            self.window[window_type][title] = HeatmapWindow(self, window_content)
+            icon = QIcon(os.path.dirname(os.path.realpath(__file__)) + "/Icons/Icon_plotwindow.png")
         else:
             return
 
@@ -1014,6 +1013,7 @@ class MainWindow(QMainWindow):
         self.window['Plotwindow'][pw_name].add_plot(plotData)
 
     def close_window(self, windowtype, title):
+        self.shared_memory.release(self.window[windowtype][title])
         del self.window[windowtype][title]
         del self.windowWidget[windowtype][title]
         items = self.treeWidget.findItems(title, Qt.MatchFixedString | Qt.MatchRecursive)
@@ -1061,6 +1061,11 @@ class MainWindow(QMainWindow):
         close = close.exec_()
 
         if close == QMessageBox.Yes:
+            # running exports are finished before quitting
+            for thread in self.export_threads:
+                thread.wait()
+            self.shared_memory.release_all()
+            self.worker_pool.shutdown()
             event.accept()
         else:
             event.ignore()
@@ -1341,14 +1346,19 @@ class DataImportDialog(QMainWindow):
         names = self.get_names()
         comments = self.get_comments()
         header = []
+        # several files are read in parallel by the worker pool
+        worker_pool = self.parent.mw.worker_pool
+        if len(self.file_names) > 1 and worker_pool.n_workers > 0:
+            file_jobs = [worker_pool.submit(parallelAnalysis.load_text_file, f, delimiter, skip_header, names,
+                                            comments) for f in self.file_names]
+        else:
+            file_jobs = None
         for j in range(len(self.file_names)):
             try:
-                if comments is not None and comments != "":
-                    dat = np.genfromtxt(self.file_names[j], delimiter=delimiter, skip_header=skip_header, names=names,
-                                        dtype=float, comments=comments)
+                if file_jobs is not None:
+                    dat = file_jobs[j].result()
                 else:
-                    dat = np.genfromtxt(self.file_names[j], delimiter=delimiter, skip_header=skip_header, names=names,
-                                        dtype=float)
+                    dat = parallelAnalysis.load_text_file(self.file_names[j], delimiter, skip_header, names, comments)
                 header.append(dat.dtype.names)
             except Exception as e:
                 self.parent.mw.show_statusbar_message("The file couldn't be imported", 4000)
@@ -1406,92 +1416,6 @@ class DataImportDialog(QMainWindow):
         self.close()
 
 
-class FormulaInterpreter:
-    """
-    class to analyse formulas typed in the formula field of the Spreadsheet header
-    written by Christopher Tao
-    source: https://levelup.gitconnected.com/how-to-write-a-formula-string-parser-in-python-5362210afeab
-    """
-
-    def __init__(self, data):
-        self.data = data
-        self.ops = {
-            "+": operator.add,
-            "-": operator.sub,
-            "*": operator.mul,
-            "/": operator.truediv}
-
-    def interpret_formula(self, f):
-        if re.match(r'\ACol\([0-9]+\)\Z', f):
-            col_formula = int(re.findall(r'\b\d+\b', f)[0])
-            if col_formula >= len(self.data):
-                # in case there are not enough columns
-                print('There is something wrong with the formula')
-                return np.full(len(self.data[0]['data']), 0)
-            return self.data[col_formula]['data']
-        elif re.match(r'\A\(.+\)\Z', f) and self.parentheses_enclosed(f):  # e.g. '(Col(1)-Col(2))'
-            return self.interpret_formula(f[1:-1])
-        elif f.replace('.', '', 1).isdigit():  # constant numbers: e.g. '2+3*Col(0)'
-            return float(f)
-        elif '+' in f or '-' in f or '*' in f or '/' in f:
-            rest_f = self.remove_matched_parentheses(f)
-            # not combine it with '+' and '-' because  multiplication and division first, then addition and subtraction
-            if '+' in rest_f or '-' in rest_f:
-                split_f = re.compile(r'[\+\-]').split(f)
-            else:
-                split_f = re.compile(r'[\*\/]').split(f)
-
-            if split_f[0].count('(') != split_f[0].count(')'):
-                nested_level = split_f[0].count('(') - split_f[0].count(')')
-                pos = len(split_f[0])
-                for sf in split_f[1:]:
-                    if '(' in sf:
-                        nested_level += sf.count('(')
-                    if ')' in sf:
-                        nested_level -= sf.count(')')
-                    pos += len(sf) + 1  # +1 because of the operator inside parenthesis
-                    if nested_level == 0:
-                        break
-            else:
-                pos = len(split_f[0])
-
-            left = f[:pos]  # left component
-            right = f[pos + 1:]  # right component
-            op = f[pos]  # the operator
-            return self.ops[op](self.interpret_formula(left), self.interpret_formula(right))
-        else:
-            print('There is something wrong with the formula')
-            return np.full(len(self.data[0]['data']), 0)
-
-    def parentheses_enclosed(self, s):
-        paren_order = re.findall(r'[\(\)]', s)
-
-        if paren_order.count('(') != paren_order.count(')'):
-            return False
-
-        curr_levels = []
-        nest_lv = 0
-        for p in paren_order:
-            if p == '(':
-                nest_lv += 1
-            else:
-                nest_lv -= 1
-            curr_levels.append(nest_lv)
-        if 0 in curr_levels[:-1]:
-            return False
-        else:
-            return True
-
-    def remove_matched_parentheses(self, formula):
-        if re.search(r"(?<!Col)\(", formula):
-            match_end_par = re.search(r"(?<!Col\(\d)\)", formula)
-            end_par = match_end_par.start()  # index of first )
-            start_par = [m.start() for m in re.finditer(r"(?<!Col)\(", formula[:end_par])][-1]  # index of last (
-            return self.remove_matched_parentheses(formula[:start_par] + formula[end_par + 1:])
-        else:
-            return formula
-
-
 class RamanSpreadSheet(QTableWidget):
     """ A reimplementation of the QTableWidget"""
 
@@ -1559,12 +1483,30 @@ class SpreadSheetWindow(QMainWindow):
         else:
             self.data = data
         self.mw = parent
+        # X, Y and Yerr assignment of the columns
+        self.column_roles = spreadsheetTools.ColumnRoleIndex([d["type"] for d in self.data])
         self.cols = len(self.data)  # number of columns
         if not self.data:
             self.rows = 0
         else:
             self.rows = max([len(d["data"]) for d in self.data])  # number of rows
         self.pHomeTxt = None  # path of Txt-File
+        # changed columns are collected during batch_update and the formula columns are recomputed at the end
+        self.batch_depth = 0
+        self.changed_columns = set()
+        # undo and redo of changes of the data
+        self.undo_stack = undoStack.UndoStack(self.mw.undo_memory_budget * 1024 ** 2)
+        # sort order and row filters, the table shows the rows in this order without rebuilding its items
+        self.row_view = spreadsheetTools.RowView()
+        self.find_text = None  # value searched with find_value
+        # cached statistics of the columns shown in statistics_dock
+        self.column_statistics = spreadsheetTools.ColumnStatistics()
+        self.statistics_dock = None
+        self.statistics_table = None
+        # fitted PCA and NMF models
+        self.decomposition_cache = spectraDecomposition.ModelCache()
+        self.decomposition_thread = None
+        self.decomposition_result_dialog = None
 
         self.central_widget = QWidget()
         self.header_table = Header(5, self.cols, parent=self)  # table header
@@ -1588,6 +1530,7 @@ class SpreadSheetWindow(QMainWindow):
 
         self.create_table_items()
         self.create_header_items(start=0, end=self.cols)
+        self.create_statistics_panel()
         self.create_menubar()
         self.create_col_header()
         self.create_row_header()
@@ -1607,6 +1550,44 @@ class SpreadSheetWindow(QMainWindow):
                      "formula": formula}
         return data_dict
 
+    def create_statistics_panel(self):
+        """side panel showing the statistics of every column, hidden at the start"""
+        self.statistics_dock = QtWidgets.QDockWidget("Column statistics", self)
+        self.statistics_table = QTableWidget(0, len(spreadsheetTools.ColumnStatistics.names))
+        self.statistics_table.setHorizontalHeaderLabels(spreadsheetTools.ColumnStatistics.names)
+        self.statistics_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.statistics_dock.setWidget(self.statistics_table)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.statistics_dock)
+        self.statistics_dock.hide()
+        self.statistics_dock.visibilityChanged.connect(lambda visible: visible and self.update_statistics_panel())
+
+    def update_statistics_panel(self, columns=None):
+        """
+        show the statistics of the columns, only columns changed since the last update are computed
+        @param columns: indices of the columns, which have to be updated, None for all columns
+        """
+        if self.statistics_dock is None or self.statistics_dock.isHidden():
+            return
+        all_statistics = self.column_statistics.get(self.data)
+        if columns is None or self.statistics_table.rowCount() != len(self.data):
+            columns = range(len(self.data))
+            self.statistics_table.setRowCount(len(self.data))
+            self.statistics_table.setVerticalHeaderLabels(['{} ({})'.format(d['shortname'], d['type'])
+                                                           for d in self.data])
+        for r in columns:
+            statistics = all_statistics[r]
+            for c, name in enumerate(spreadsheetTools.ColumnStatistics.names):
+                value = statistics[name]
+                if isinstance(value, str):
+                    text = value
+                elif name == "Step deviation":
+                    text = "" if np.isnan(value) else "{:.2%}".format(value)
+                elif isinstance(value, int):
+                    text = str(value)
+                else:
+                    text = "" if np.isnan(value) else "{:.6g}".format(value)
+                self.statistics_table.setItem(r, c, QTableWidgetItem(text))
+
     def create_table_items(self):
         """ fill the table items with data """
         for c in range(self.cols):
@@ -1628,6 +1609,213 @@ class SpreadSheetWindow(QMainWindow):
                 self.header_table.setItem(r, c, header_item)
         self.header_table.itemChanged.connect(self.update_header)
 
+    @contextlib.contextmanager
+    def batch_update(self):
+        """
+        collect all data changes inside the with-block, the depending formula columns are recomputed only once at
+        the end (e.g. if a file with many rows is imported)
+        """
+        self.batch_depth += 1
+        try:
+            yield
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0 and self.changed_columns:
+                changed = self.changed_columns
+                self.changed_columns = set()
+                updated = self.recompute_formulas(changed)
+                self.update_statistics_panel(changed.union(updated))
+
+    def data_changed(self, columns):
+        """
+        has to be called, if the data of columns is changed, to update the formula columns depending on them
+        @param columns: indices of the changed columns
+        """
+        self.row_view.invalidate([self.data[c] for c in columns])
+        self.column_statistics.invalidate([self.data[c] for c in columns])
+        self.decomposition_cache.invalidate([self.data[c] for c in columns])
+        with self.batch_update():
+            self.changed_columns.update(columns)
+
+    def columns_removed(self, columns_data):
+        """
+        has to be called, if columns are removed, so that the caches don't keep their data
+        @param columns_data: data dictionaries of the removed columns
+        """
+        self.row_view.invalidate(columns_data)
+        self.column_statistics.invalidate(columns_data)
+        self.decomposition_cache.invalidate(columns_data)
+
+    def recompute_formulas(self, columns, include_changed=False):
+        """
+        recompute the formula columns depending on columns in topological order
+        @param columns: indices of the changed columns
+        @param include_changed: True if the formula columns in columns have to be recomputed too
+        @return: indices of the recomputed columns
+        """
+        try:
+            updated, messages = formulaEngine.recompute(self.data, columns, include_changed)
+        except formulaEngine.FormulaError as e:
+            print(e)
+            self.mw.show_statusbar_message(str(e), 6000)
+            return []
+        for message in messages:
+            print(message)
+        if messages:
+            self.mw.show_statusbar_message(messages[0], 6000)
+        self.row_view.invalidate([self.data[c] for c in updated])
+        self.column_statistics.invalidate([self.data[c] for c in updated])
+        self.decomposition_cache.invalidate([self.data[c] for c in updated])
+        for col in updated:
+            self.update_column_items(col)
+        return updated
+
+    def update_column_items(self, col):
+        """write the data of column col into the table without triggering update_data"""
+        column_data = self.data[col]["data"]
+        self.data_table.blockSignals(True)
+        if len(column_data) > self.rows:
+            self.rows = len(column_data)
+            self.data_table.setRowCount(self.rows)
+        # str() of Python floats is much faster than str() of numpy scalars and gives the same text
+        for r, text in enumerate(map(str, np.asarray(column_data).tolist())):
+            self.data_table.setItem(r, col, QTableWidgetItem(text))
+        for r in range(len(column_data), self.rows):
+            self.data_table.takeItem(r, col)
+        self.data_table.blockSignals(False)
+        self.data_table.viewport().update()
+
+    def refresh_columns(self, columns_data):
+        """
+        update the table after the data of some columns was restored by undo or redo
+        @param columns_data: data dictionaries of the changed columns
+        """
+        # the columns could have been moved in the meantime
+        columns = [c for c, d in enumerate(self.data) if any(d is cd for cd in columns_data)]
+        rows = max([len(d["data"]) for d in self.data], default=0)
+        if rows > self.rows:
+            self.rows = rows
+            self.data_table.setRowCount(self.rows)
+        with self.batch_update():
+            for col in columns:
+                self.update_column_items(col)
+            self.data_changed(columns)
+
+    def refresh_column_count(self):
+        """update the table after columns were added to or removed from the end of self.data (e.g. by undo)"""
+        cols_before = self.cols
+        self.cols = len(self.data)
+        self.column_roles.rebuild([d["type"] for d in self.data])
+        self.data_table.setColumnCount(self.cols)
+        self.header_table.setColumnCount(self.cols)
+        self.header_table.setHorizontalHeaderLabels(['{} ({})'.format(d['shortname'], d['type']) for d in self.data])
+        # header items of the added columns, without triggering update_header
+        self.header_table.blockSignals(True)
+        for c in range(cols_before, self.cols):
+            for r, key in enumerate(["longname", "axis label", "unit", "comments", "formula"]):
+                header_item = QTableWidgetItem(self.data[c][key])
+                header_item.setBackground(QtGui.QColor(255, 255, 200))  # color: light yellow
+                self.header_table.setItem(r, c, header_item)
+        self.header_table.blockSignals(False)
+        if self.cols < cols_before:
+            self.update_statistics_panel()
+
+    def undo(self):
+        text = self.undo_stack.undo()
+        if text is None:
+            self.mw.show_statusbar_message("Nothing to undo", 3000)
+        else:
+            self.mw.show_statusbar_message("Undo: {}".format(text), 3000)
+
+    def redo(self):
+        text = self.undo_stack.redo()
+        if text is None:
+            self.mw.show_statusbar_message("Nothing to redo", 3000)
+        else:
+            self.mw.show_statusbar_message("Redo: {}".format(text), 3000)
+
+    def copy_cells(self):
+        """copy the selected cells as tab separated text into the clipboard, in the shown order of the rows"""
+        selected = self.data_table.selectedIndexes()
+        if not selected:
+            return
+        row_header = self.data_table.verticalHeader()
+        rows = sorted(set(i.row() for i in selected if not self.data_table.isRowHidden(i.row())),
+                      key=row_header.visualIndex)
+        cols = sorted(set(self.data_table.visualColumn(i.column()) for i in selected))
+        if not rows:
+            return
+        values = np.stack([spreadsheetTools.column_values(self.data[c], self.rows)[rows] for c in cols], axis=1)
+        # cells inside the bounding rectangle, which aren't selected, are empty
+        is_selected = np.zeros(values.shape, dtype=bool)
+        row_position = {r: idx for idx, r in enumerate(rows)}
+        col_position = {c: idx for idx, c in enumerate(cols)}
+        for i in selected:
+            if i.row() in row_position:
+                is_selected[row_position[i.row()], col_position[self.data_table.visualColumn(i.column())]] = True
+        values[~is_selected] = np.nan
+        QtWidgets.QApplication.clipboard().setText(spreadsheetTools.format_table(values))
+
+    def paste_cells(self):
+        """
+        paste a block of numbers from the clipboard, the upper left cell is the current cell
+        The block is written into the following rows of the data (not the shown order, if the rows are sorted),
+        missing rows and columns are added.
+        """
+        try:
+            block = spreadsheetTools.parse_table(QtWidgets.QApplication.clipboard().text())
+        except ValueError as e:
+            self.mw.show_statusbar_message(str(e), 6000)
+            return
+        if block.size == 0:
+            return
+        start_row = max(self.data_table.currentRow(), 0)
+        start_col = max(self.data_table.visualColumn(self.data_table.currentColumn()), 0)
+        n_rows, n_cols = block.shape
+        end_row = start_row + n_rows
+
+        if end_row > self.rows:
+            self.rows = end_row
+            self.data_table.setRowCount(self.rows)
+        columns = list(range(start_col, min(start_col + n_cols, self.cols)))
+        columns_data = [self.data[c] for c in columns]
+        # columns right of the table are added
+        new_columns = []
+        for idx in range(len(columns), n_cols):
+            column = np.full(self.rows, np.nan)
+            column[start_row:end_row] = block[:, idx]
+            short_name = str(chr(ord('A') + len(self.data) + len(new_columns)))
+            new_columns.append(self.create_data(data_content=column, shortname=short_name))
+
+        def refresh():
+            self.refresh_column_count()
+            self.columns_removed([d for d in new_columns if not any(d is e for e in self.data)])
+            self.refresh_columns(columns_data + new_columns)
+
+        with self.undo_stack.record("Paste", refresh) as change:
+            for idx, d in enumerate(columns_data):
+                change.save(d, "data")
+                old = np.asarray(d["data"], dtype=float)
+                # the column is grown in one allocation
+                new = np.full(max(len(old), end_row), np.nan)
+                new[:len(old)] = old
+                new[start_row:end_row] = block[:, idx]
+                d["data"] = new
+            if new_columns:
+                # a new list of columns (copy-on-write), so that undo removes the added columns again
+                change.save(vars(self), "data")
+                self.data = self.data + new_columns
+
+        if new_columns:
+            self.refresh_column_count()
+            columns = columns + list(range(self.cols - len(new_columns), self.cols))
+
+        with self.batch_update():
+            for c in columns:
+                self.update_column_items(c)
+            self.data_changed(columns)
+        self.mw.show_statusbar_message("{} x {} cells pasted".format(n_rows, n_cols), 3000)
+
     def create_menubar(self):
         """ create the menubar """
         self.menubar = self.menuBar()
@@ -1639,10 +1827,19 @@ class SpreadSheetWindow(QMainWindow):
 
         # 2. menu item: Edit
         editMenu = self.menubar.addMenu('&Edit')
+        editMenu.addAction('Undo', self.undo, QtGui.QKeySequence.Undo)
+        editMenu.addAction('Redo', self.redo, QtGui.QKeySequence.Redo)
+        editMenu.addAction('Copy', self.copy_cells, QtGui.QKeySequence.Copy)
+        editMenu.addAction('Paste', self.paste_cells, QtGui.QKeySequence.Paste)
         editMenu.addAction('New Column', self.new_col)
         editMenu.addAction("Select all X columns", lambda: self.select_all_("X"))
         editMenu.addAction("Select all Y columns", lambda: self.select_all_("Y"))
         editMenu.addAction("Resample", self.resample_x_axis)
+        editMenu.addSeparator()
+        editMenu.addAction("Filter rows", lambda: self.filter_rows())
+        editMenu.addAction("Show all rows", self.show_all_rows)
+        editMenu.addAction("Find value", self.find_value, QtGui.QKeySequence.Find)
+        editMenu.addAction("Find next", lambda: self.find_next(), QtGui.QKeySequence.FindNext)
 
         # 3. menu item: Plot
         plotMenu = self.menubar.addMenu('&Plot')
@@ -1653,11 +1850,16 @@ class SpreadSheetWindow(QMainWindow):
         for j in self.mw.window['Plotwindow'].keys():
             plotAdd.addAction(j, self.get_plot_data)
         plotMenu.addAction('Plot all', lambda: self.get_plot_data(plot_all=True))
+        plotMenu.addAction('Plot all as stack', self.plot_stack)
+        plotMenu.addAction('Plot all as heatmap', self.plot_heatmap)
 
         # 4. menu item: Analysis
         analysis_menu = self.menubar.addMenu("&Analysis")
         analysis_menu.addAction("Principal component analysis", self.pca_nmf)
         analysis_menu.addAction("Non-negative matrix factorization", self.pca_nmf)
+        statistics_action = self.statistics_dock.toggleViewAction()
+        statistics_action.setText("Column statistics")
+        analysis_menu.addAction(statistics_action)
 
     def update_menubar(self):
         self.menubar.clear()
@@ -1709,6 +1911,7 @@ class SpreadSheetWindow(QMainWindow):
         self.data[vis_col]["shortname"] = newHeader
         self.header_table.horizontalHeaderItem(log_col).setText(
             '{} ({})'.format(self.data[vis_col]["shortname"], self.data[vis_col]["type"]))
+        self.update_statistics_panel()
 
     def show_header_context_menu(self, position):
         selected_column = self.headers.logicalIndexAt(position)
@@ -1724,6 +1927,9 @@ class SpreadSheetWindow(QMainWindow):
         set_xy.triggered[QAction].connect(lambda QAction: self.set_column_type(QAction, selected_column))
         header_menu.addAction("Convert unit", lambda: self.convert_column_unit(selected_column))
         header_menu.addAction("Flip column", lambda: self.flip_column(selected_column))
+        header_menu.addAction("Sort ascending", lambda: self.sort_rows(selected_column))
+        header_menu.addAction("Sort descending", lambda: self.sort_rows(selected_column, descending=True))
+        header_menu.addAction("Filter rows", lambda: self.filter_rows(selected_column))
         mov_col = header_menu.addMenu("Move column")
         mov_col.addAction("Move left")
         mov_col.addAction("Move right")
@@ -1735,11 +1941,14 @@ class SpreadSheetWindow(QMainWindow):
         if ac == delete_column:
             # Get the index of all selected columns in reverse order, so that last column is deleted first
             selCol = sorted(set(index.column() for index in self.header_table.selectedIndexes()), reverse=True)
+            self.columns_removed([self.data[j] for j in selCol])
             for j in selCol:
                 del self.data[j]  # Delete data
                 self.data_table.removeColumn(j)  # Delete column
                 self.header_table.removeColumn(j)
                 self.cols = self.cols - 1
+            self.column_roles.rebuild([d["type"] for d in self.data])
+            self.update_statistics_panel()
 
     def convert_column_unit(self, selected_column):
 
@@ -1761,17 +1970,24 @@ class SpreadSheetWindow(QMainWindow):
         if unit == "cm\u207B\u00B9 to nm":
             unit_text = "nm"
             axis_text = "Wavelength"
-            formula = f"{wl0}/(1-Col({selected_column})*0.0000001*{wl0})"
+            conversion = lambda x: wl0 / (1 - x * 0.0000001 * wl0)
         elif unit == "nm to cm\u207B\u00B9":
             unit_text = "cm^-1"
             axis_text = "Raman Shift"
-            formula = f"((1/{wl0})-(1/Col({selected_column})))*10000000"
+            conversion = lambda x: ((1 / wl0) - (1 / x)) * 10000000
         else:
             return
 
+        # the conversion is applied once to the data, a formula referencing the column itself would be circular
+        column_data = self.data[self.header_table.visualColumn(selected_column)]
+        with self.undo_stack.record("Convert unit", lambda: self.refresh_columns([column_data])) as change:
+            change.save(column_data, "data")
+            with np.errstate(divide="ignore", invalid="ignore"):
+                column_data["data"] = conversion(np.asarray(column_data["data"], dtype=float))
+        self.refresh_columns([column_data])
+
         self.header_table.item(2, selected_column).setText(unit_text)
         self.header_table.item(1, selected_column).setText(axis_text)
-        self.header_table.item(4, selected_column).setText(formula.format(wl0=wl0, selected_column=selected_column))
 
     def flip_column(self, selected_column):
         """
@@ -1780,52 +1996,189 @@ class SpreadSheetWindow(QMainWindow):
         @return:
         """
         selected_column = self.header_table.visualColumn(selected_column)
-        self.data[selected_column]["data"] = np.flip(self.data[selected_column]["data"])
-        self.create_table_items()
+        column_data = self.data[selected_column]
+        with self.undo_stack.record("Flip column", lambda: self.refresh_columns([column_data])) as change:
+            change.save(column_data, "data")
+            column_data["data"] = np.flip(column_data["data"]).copy()
+        with self.batch_update():
+            self.create_table_items()
+            self.data_changed([selected_column])
+
+    def apply_row_view(self):
+        """show the rows in the order of self.row_view, only the visual order of the rows is changed"""
+        rows = self.row_view.rows(self.data, self.rows)
+        hidden = np.ones(self.rows, dtype=bool)
+        hidden[rows] = False
+        # visible rows first, hidden rows keep their original order behind them
+        order = np.concatenate([rows, np.flatnonzero(hidden)])
+
+        row_header = self.data_table.verticalHeader()
+        self.data_table.setUpdatesEnabled(False)
+        if row_header.sectionsMoved() or self.row_view.sort_column is not None:
+            for visual, logical in enumerate(order.tolist()):
+                current = row_header.visualIndex(logical)
+                if current != visual:
+                    row_header.swapSections(visual, current)
+        for r in range(self.rows):
+            if self.data_table.isRowHidden(r) != hidden[r]:
+                self.data_table.setRowHidden(r, bool(hidden[r]))
+        self.data_table.setUpdatesEnabled(True)
+        if self.row_view.is_active():
+            self.mw.show_statusbar_message("{} of {} rows shown".format(len(rows), self.rows), 4000)
+
+    def sort_rows(self, selected_column, descending=False):
+        """
+        sort the rows by the selected column
+        @param selected_column: logical index of selected column
+        @param descending: True for descending order
+        """
+        selected_column = self.header_table.visualColumn(selected_column)
+        self.row_view.sort(self.data[selected_column], descending)
+        self.apply_row_view()
+
+    def filter_rows(self, selected_column=None):
+        """
+        show only the rows with values of a column inside a range
+        @param selected_column: logical index of selected column
+        """
+        if not self.data:
+            return
+        if selected_column is None:
+            selected_column = self.data_table.currentColumn() if self.data_table.currentColumn() >= 0 else 0
+        selected_column = self.header_table.visualColumn(selected_column)
+        names = ['{} ({})'.format(d['shortname'], d['type']) for d in self.data]
+        limits = []
+        for d in self.data:
+            values = spreadsheetTools.column_values(d, self.rows)
+            values = values[np.isfinite(values)]
+            limits.append((np.min(values), np.max(values)) if values.size else (0, 0))
+        filter_dialog = DialogClasses.RowFilterDialog(self, names, limits, selected_column)
+        filter_dialog.show()
+
+        # loop stops code until user selects options
+        loop = QtCore.QEventLoop()
+        filter_dialog.closeSignal.connect(loop.quit)
+        loop.exec_()
+        if filter_dialog.options is None:
+            return
+        options = filter_dialog.options
+        self.row_view.add_filter(self.data[options["column"]], options["low"], options["high"])
+        self.apply_row_view()
+
+    def show_all_rows(self):
+        """remove sort order and row filters"""
+        self.row_view.reset()
+        self.apply_row_view()
+
+    def find_value(self):
+        """search a value in all columns, the first match is selected"""
+        text, ok = QtWidgets.QInputDialog.getText(self, "Find value", "Value:", text=self.find_text or "")
+        if not ok or not text.strip():
+            return
+        self.find_text = text
+        self.find_next(from_start=True)
+
+    def find_next(self, from_start=False):
+        """
+        select the next cell with the searched value in the shown order of the rows
+        @param from_start: True to start at the first shown cell instead of the current cell
+        """
+        if self.find_text is None:
+            self.find_value()
+            return
+        try:
+            rows, cols = spreadsheetTools.find_value(self.data, self.find_text, self.rows)
+        except ValueError:
+            self.mw.show_statusbar_message("Only numbers can be found", 4000)
+            return
+
+        # position of the matches in the shown order, hidden rows are skipped
+        row_header = self.data_table.verticalHeader()
+        visual_rows = np.array([row_header.visualIndex(r) for r in rows.tolist()], dtype=int)
+        shown = np.array([not self.data_table.isRowHidden(r) for r in rows.tolist()], dtype=bool)
+        visual_rows, rows, cols = visual_rows[shown], rows[shown], cols[shown]
+        if rows.size == 0:
+            self.mw.show_statusbar_message("{} not found".format(self.find_text), 4000)
+            return
+        position = visual_rows * self.cols + cols
+        current_row, current_col = self.data_table.currentRow(), self.data_table.currentColumn()
+        if from_start or current_row < 0:
+            current = -1
+        else:
+            current = row_header.visualIndex(current_row) * self.cols + self.data_table.visualColumn(current_col)
+        later = np.flatnonzero(position > current)
+        # continue at the top after the last match
+        idx = later[np.argmin(position[later])] if later.size else np.argmin(position)
+        self.data_table.setCurrentCell(int(rows[idx]), self.data_table.horizontalHeader().logicalIndex(int(cols[idx])))
+        self.mw.show_statusbar_message("{} cells contain {}".format(rows.size, self.find_text), 4000)
 
     def resample_x_axis(self):
+        """resample the selected Y columns onto a common x axis, the result is shown in a new spreadsheet"""
         idx_y = sorted(set(self.headers.visualIndex(idx.column()) for idx in self.header_table.selectedIndexes()))
         # get indices of corresponding x columns
         idx_x = [self.get_assigned_x_column(i) for i in idx_y]
+        if not idx_y or None in idx_x:
+            return
+
+        resampling = analysisMethods.ResamplingMethods()
+        resample_dialog = DialogClasses.ResampleDialog(self, list(resampling.methods.keys()),
+                                                       resampling.range_policies)
+        resample_dialog.show()
+
+        # loop stops code until user selects options
+        loop = QtCore.QEventLoop()
+        resample_dialog.closeSignal.connect(loop.quit)
+        loop.exec_()
+        if resample_dialog.options is None:
+            return
 
-        # create new array for x data
-        x_min = min(self.data[idx_x[0]]["data"])
-        x_max = max(self.data[idx_x[0]]["data"])
-        for ix in idx_x:
-            x_min = max(x_min, min(self.data[ix]["data"]))
-            x_max = min(x_max, max(self.data[ix]["data"]))
-
-        # create new arrays for y data with shared x-axis
-        x_new = np.arange(x_min, x_max, 1.0)
-        data_new = [self.create_data(x_new,
-                                     shortname=self.data[idx_x[0]]["shortname"],
-                                     column_type=self.data[idx_x[0]]["type"],
-                                     filename=self.data[idx_x[0]]["filename"],
-                                     long_name=self.data[idx_x[0]]["longname"],
-                                     axis_label=self.data[idx_x[0]]["axis label"],
-                                     unit=self.data[idx_x[0]]["unit"],
-                                     comments=self.data[idx_x[0]]["comments"],
-                                     formula=self.data[idx_x[0]]["formula"])]
+        # Y columns sharing the same X column are resampled together
+        groups = {}
         for ix, iy in zip(idx_x, idx_y):
-            y_new = rp.resample(self.data[ix]["data"], self.data[iy]["data"], x_new)
-            data_new.append(self.create_data(y_new,
-                                             shortname=self.data[iy]["shortname"],
-                                             column_type=self.data[iy]["type"],
-                                             filename=self.data[iy]["filename"],
-                                             long_name=self.data[iy]["longname"],
-                                             axis_label=self.data[iy]["axis label"],
-                                             unit=self.data[iy]["unit"],
-                                             comments=self.data[iy]["comments"],
-                                             formula=self.data[iy]["formula"]))
+            groups.setdefault(ix, []).append(iy)
+        stacks = []
+        for ix, group in groups.items():
+            x = self.data[ix]["data"]
+            y_stack = np.full((len(group), len(x)), np.nan)
+            for row, iy in enumerate(group):
+                y = self.data[iy]["data"][:len(x)]
+                y_stack[row, :len(y)] = y
+            stacks.append((x, y_stack))
+        x_new, y_new = resampling.resample(stacks, **resample_dialog.options)
+        if x_new is None:
+            self.mw.show_statusbar_message("The x ranges of the selected columns don't overlap", 4000)
+            return
+
+        # create new columns with the metadata of the old ones
+        idx_y = [iy for group in groups.values() for iy in group]
+        data_new = [dict(self.data[idx_x[0]], data=x_new)]
+        for row, iy in enumerate(idx_y):
+            data_new.append(dict(self.data[iy], data=y_new[row]))
+
+        # column indices in the formulas have to refer to the new spreadsheet, formulas using columns, which are not
+        # copied, are removed
+        mapping = {ix: 0 for ix in groups}
+        mapping.update({iy: c + 1 for c, iy in enumerate(idx_y)})
+        for d in data_new:
+            if d["formula"]:
+                try:
+                    d["formula"] = formulaEngine.remap_references(d["formula"], mapping)
+                except formulaEngine.FormulaError:
+                    d["formula"] = None
+        try:
+            messages = formulaEngine.recompute(data_new, range(len(data_new)), include_changed=True)[1]
+        except formulaEngine.FormulaError as e:
+            messages = [str(e)]
+        for message in messages:
+            print(message)
         self.mw.new_window(None, "Spreadsheet", data_new, None)
 
     def select_all_(self, column_type):
-        for c in range(self.cols):
-            if self.data[c]["type"] == column_type:
-                self.header_table.item(0, c).setSelected(True)
+        for c in self.column_roles.columns(column_type):
+            self.header_table.item(0, c).setSelected(True)
 
     def pca_nmf(self):
-        """principal component analysis with all selected y values"""
+        """principal component analysis or non-negative matrix factorization of all selected y columns"""
         selected_columns = sorted(set(self.headers.visualIndex(idx.column()) for idx in
                                       self.header_table.selectedIndexes()))
 
@@ -1850,26 +2203,85 @@ class SpreadSheetWindow(QMainWindow):
             self.mw.show_statusbar_message("Data has to have same length!", 4000)
             return
 
-        n_comp, ok = QtWidgets.QInputDialog().getInt(self, "Number of components", "Number of components", value=2,
-                                                     min=2, max=len(y_all), step=1)
-        # stack all y data
-        all_samples = np.stack(y_all, axis=0)
-
         action_text = self.sender().text()
         if action_text == "Principal component analysis":
-            # do the PCA analysis
-            pca = decomposition.PCA(n_components=n_comp)
-            y_transformed = pca.fit_transform(all_samples.T).T
-            analysis_name = "PCA"
-        elif action_text == "Non-negative matrix factorization":
-            # do the NMF analysis
-            nmf = decomposition.NMF(n_components=n_comp)
-            y_transformed = nmf.fit_transform(all_samples.T).T
-            analysis_name = "NMF"
-
-        # insert data in table
-        for idx, y_i in enumerate(y_transformed):
-            self.new_col(data_content=y_i, short_name="{} {}".format(analysis_name, idx + 1))
+            method_names = [m for m in spectraDecomposition.methods if m.startswith("PCA")]
+            n_components = 10
+        else:
+            method_names = [m for m in spectraDecomposition.methods if m.startswith("NMF")]
+            n_components = 2
+        max_components = min(len(y_all), len_y)
+        decomposition_dialog = DialogClasses.DecompositionDialog(self, method_names, max_components, n_components)
+        decomposition_dialog.show()
+
+        # loop stops code until user selects options
+        loop = QtCore.QEventLoop()
+        decomposition_dialog.closeSignal.connect(loop.quit)
+        loop.exec_()
+        if decomposition_dialog.options is None:
+            return
+        method = decomposition_dialog.options["method"]
+        n_components = decomposition_dialog.options["n_components"]
+
+        # fitted models are reused until one of the columns changes
+        columns_data = [self.data[n] for n in selected_columns]
+        result = self.decomposition_cache.get(columns_data, method, n_components)
+        if result is None:
+            result = self.fit_decomposition(y_all, method, n_components)
+            if result is None:
+                return
+            self.decomposition_cache.add(columns_data, result)
+        if result.message is not None:
+            self.mw.show_statusbar_message(result.message, 6000)
+        self.decomposition_result_dialog = DialogClasses.DecompositionResultDialog(self, result)
+        self.decomposition_result_dialog.show()
+
+    def fit_decomposition(self, y_all, method, n_components):
+        """
+        fit a PCA or NMF in a background thread, the spectra are processed in chunks from a memory-mapped file
+        @param y_all: list of the spectra
+        @param method: name of the method (see spectraDecomposition.methods)
+        @param n_components: number of components
+        @return: spectraDecomposition.DecompositionResult or None if the fit failed or was cancelled
+        """
+        thread = spectraDecomposition.DecompositionThread(y_all, method, n_components, parent=self)
+        thread.progress.connect(lambda percent: self.mw.show_statusbar_message(
+            "{} ... {} %".format(method, percent), 0))
+        thread.failed.connect(lambda message: self.mw.show_statusbar_message(message, 6000))
+        thread.failed.connect(lambda message: print(message))
+        self.decomposition_thread = thread
+
+        # wait for the thread, the GUI stays responsive
+        loop = QtCore.QEventLoop()
+        thread.finished.connect(loop.quit)
+        thread.start()
+        loop.exec_()
+        self.decomposition_thread = None
+        if thread.result is not None:
+            self.mw.show_statusbar_message("{} finished".format(method), 3000)
+        return thread.result
+
+    def insert_loadings(self, result):
+        """
+        add the loadings (components) of a PCA or NMF as new columns
+        @param result: spectraDecomposition.DecompositionResult
+        """
+        analysis_name = result.method.split()[0]
+        for idx, component in enumerate(result.components):
+            self.new_col(data_content=component, short_name="{} {}".format(analysis_name, idx + 1))
+
+    def show_scores(self, result):
+        """
+        open the scores of a PCA or NMF in a new spreadsheet, one row for every spectrum
+        @param result: spectraDecomposition.DecompositionResult
+        """
+        analysis_name = result.method.split()[0]
+        data = [self.create_data(np.arange(1, len(result.scores) + 1, dtype=float), shortname="Spectrum",
+                                 column_type="X")]
+        for idx, score in enumerate(result.scores.T):
+            data.append(self.create_data(score, shortname="{} score {}".format(analysis_name, idx + 1),
+                                         long_name="{} score {}".format(analysis_name, idx + 1)))
+        self.mw.new_window(None, "Spreadsheet", data, None)
 
     def set_column_type(self, qaction, log_col):
         """
@@ -1881,8 +2293,10 @@ class SpreadSheetWindow(QMainWindow):
         col_type = qaction.text()
         vis_col = self.header_table.visualColumn(log_col)
         self.data[vis_col]["type"] = col_type
+        self.column_roles.set_type(vis_col, col_type)
         self.header_table.horizontalHeaderItem(log_col).setText(
             "{}({})".format(self.data[vis_col]["shortname"], col_type))
+        self.update_statistics_panel()
 
     def move_column(self, qaction, selected_column):
         old_idx = self.headers.visualIndex(selected_column)
@@ -1897,6 +2311,8 @@ class SpreadSheetWindow(QMainWindow):
         self.headers.moveSection(old_idx, new_idx)
         self.data_table.horizontalHeader().moveSection(old_idx, new_idx)
         self.data.insert(new_idx, self.data.pop(old_idx))
+        self.column_roles.move(old_idx, new_idx)
+        self.update_statistics_panel()
 
     def create_row_header(self):
         """opens header_menu with right mouse click on header"""
@@ -1913,15 +2329,25 @@ class SpreadSheetWindow(QMainWindow):
         if ac == delete_row:
             # Get the index of all selected rows in reverse order, so that last row is deleted first
             selected_row = sorted(set(index.row() for index in self.data_table.selectedIndexes()), reverse=True)
-            for c in range(self.cols):
-                for r in selected_row:
-                    try:
-                        self.data[c]["data"] = np.delete(self.data[c]["data"], r)  # Delete data
-                    except IndexError as e:
-                        print(e)
+            columns_data = list(self.data)
+            with self.undo_stack.record("Delete rows", lambda: self.refresh_columns(columns_data)) as change:
+                for c in range(self.cols):
+                    change.save(self.data[c], "data")
+                    for r in selected_row:
+                        try:
+                            self.data[c]["data"] = np.delete(self.data[c]["data"], r)  # Delete data
+                        except IndexError as e:
+                            print(e)
             for k in selected_row:
                 self.data_table.removeRow(k)  # Delete row
                 self.rows = self.rows - 1
+            # the row indices changed
+            self.row_view.invalidate()
+            self.column_statistics.invalidate()
+            self.decomposition_cache.invalidate()
+            self.update_statistics_panel()
+            if self.row_view.is_active():
+                self.apply_row_view()
 
     def keyPressEvent(self, event):
         # A few shortcuts
@@ -1950,36 +2376,39 @@ class SpreadSheetWindow(QMainWindow):
 
     def file_save(self):
         """
-        save data from spreadsheet in txt-file
+        save data from spreadsheet in txt-file, columns of different lengths are padded
         """
 
         # get file name
-        file_name = QtWidgets.QFileDialog.getSaveFileName(self, 'Save File', self.pHomeTxt)
-        if file_name[0] != '':
-            file_name = file_name[0]
-        else:
+        file_name, file_filter = QtWidgets.QFileDialog.getSaveFileName(
+            self, 'Save File', self.pHomeTxt, "Text Files (*.txt);;CSV Files (*.csv);;All Files (*)")
+        if file_name == '':
             return
 
-        # get data
-        save_data = [self.data[0]["data"]]
-        for c in range(1, self.cols):
-            save_data.append(self.data[c]["data"])
+        if file_filter.startswith("CSV") and not file_name.endswith('.csv'):
+            file_name = '{}.csv'.format(file_name)
+        elif not file_filter.startswith("CSV") and os.path.splitext(file_name)[1] == '':
+            file_name = '{}.txt'.format(file_name)
 
-        # check if all columns have same length to avoid problems with numpy savetxt
-        n = len(self.data[0]["data"])
-        if all(len(x) == n for x in save_data):
-            pass
-        else:
-            self.mw.show_statusbar_message('The columns have different lengths!', 4000)
-            return
+        export_dialog = DialogClasses.ExportOptionsDialog(self, csv=file_name.endswith('.csv'))
+        export_dialog.show()
 
-        # save data
-        if file_name[-4:] != '.txt':
-            file_name = '{}.txt'.format(file_name)
+        # loop stops code until user selects options
+        loop = QtCore.QEventLoop()
+        export_dialog.closeSignal.connect(loop.quit)
+        loop.exec_()
+        if export_dialog.options is None:
+            return
 
         self.pHomeTxt = file_name
 
-        np.savetxt(file_name, np.transpose(save_data), fmt='%.5f')
+        options = dict(export_dialog.options)
+        if options.pop("header"):
+            options["header"] = [["{}({})".format(d["shortname"], d["type"]) for d in self.data],
+                                 [d["longname"] for d in self.data],
+                                 [d["unit"] for d in self.data],
+                                 [d["comments"] for d in self.data]]
+        self.mw.export_columns(file_name, [d["data"] for d in self.data], **options)
 
     def load_file(self):
         """
@@ -1999,6 +2428,7 @@ class SpreadSheetWindow(QMainWindow):
 
         self.data = di.data
         cols_before = di.cols_before
+        self.column_roles.rebuild([d["type"] for d in self.data])
 
         self.cols = len(self.data)
         self.rows = max([len(d["data"]) for d in self.data])
@@ -2006,16 +2436,20 @@ class SpreadSheetWindow(QMainWindow):
         self.data_table.setRowCount(self.rows)
         self.header_table.setColumnCount(self.cols)
 
-        # set header
-        headers = ['{} ({})'.format(d["shortname"], d["type"]) for d in self.data]
-        self.header_table.setHorizontalHeaderLabels(headers)
-        self.create_header_items(cols_before, self.cols)
-
-        # set data
-        for c in range(cols_before, self.cols):
-            for r in range(len(self.data[c]["data"])):
-                new_cell = QTableWidgetItem(str(self.data[c]["data"][r]))
-                self.data_table.setItem(r, c, new_cell)
+        # the formula columns are recomputed once after all cells are set
+        with self.batch_update():
+            # set header
+            headers = ['{} ({})'.format(d["shortname"], d["type"]) for d in self.data]
+            self.header_table.setHorizontalHeaderLabels(headers)
+            self.create_header_items(cols_before, self.cols)
+
+            # set data
+            for c in range(cols_before, self.cols):
+                for r in range(len(self.data[c]["data"])):
+                    new_cell = QTableWidgetItem(str(self.data[c]["data"][r]))
+                    self.data_table.setItem(r, c, new_cell)
+            # imported columns can replace existing ones or be referenced by name
+            self.data_changed(range(self.cols))
 
         # self.pHomeTxt = FileName[0]
 
@@ -2027,13 +2461,22 @@ class SpreadSheetWindow(QMainWindow):
         if new_cell_content == '':
             self.data_table.takeItem(row, col)
             new_cell_content = np.nan
-        try:
-            self.data[col]["data"][row] = new_cell_content
-        except IndexError:  # occurs if index is out of bounds
-            self.data[col]["data"] = np.append(self.data[col]["data"], new_cell_content)
-        except ValueError:
-            self.mw.show_statusbar_message("Only numbers please", 5000)
-            item.setText("")
+        column_data = self.data[col]
+        with self.undo_stack.record("Edit cell", lambda: self.refresh_columns([column_data])) as change:
+            try:
+                if row < len(column_data["data"]):
+                    # only the changed value is stored for undo
+                    change.save_values(column_data, "data", row)
+                else:
+                    change.save(column_data, "data")
+                column_data["data"][row] = new_cell_content
+            except IndexError:  # occurs if index is out of bounds
+                column_data["data"] = np.append(column_data["data"], new_cell_content)
+            except ValueError:
+                self.mw.show_statusbar_message("Only numbers please", 5000)
+                item.setText("")
+                return
+        self.data_changed([col])
 
     def update_header(self, item):
         """if header is changed, self.data is changed too"""
@@ -2054,22 +2497,8 @@ class SpreadSheetWindow(QMainWindow):
             if content is None or content == '':
                 return
             else:
-                Interpreter = FormulaInterpreter(self.data)
-                try:
-                    new_data = Interpreter.interpret_formula(content)
-                except Exception as e:
-                    print(e)
-                    new_data = None
-                if new_data is None:
-                    return
-                elif isinstance(new_data, float):
-                    self.data[col]["data"] = np.full(len(self.data[col]), new_data)
-                else:
-                    self.data[col]["data"] = new_data
-
-                for r in range(len(self.data[col]["data"])):
-                    new_cell = QTableWidgetItem(str(self.data[col]["data"][r]))
-                    self.data_table.setItem(r, col, new_cell)
+                # recompute this column and all formula columns depending on it
+                self.update_statistics_panel(self.recompute_formulas([col], include_changed=True))
 
     def new_col(self, data_content=None, short_name=None):
         # adds a new column at end of table
@@ -2085,6 +2514,7 @@ class SpreadSheetWindow(QMainWindow):
         self.data_table.setColumnCount(self.cols)
         self.header_table.setColumnCount(self.cols)
         self.data.append(self.create_data(data_content=data_content, shortname=short_name))
+        self.column_roles.append(self.data[-1]["type"])
         headers = [d["shortname"] + '(' + d["type"] + ')' for d in self.data]
         self.header_table.setHorizontalHeaderLabels(headers)
         for i in range(self.rows):
@@ -2095,6 +2525,7 @@ class SpreadSheetWindow(QMainWindow):
         for r in range(5):
             self.header_table.setItem(r, self.cols - 1, QTableWidgetItem())
             self.header_table.item(r, self.cols - 1).setBackground(QtGui.QColor(255, 255, 200))
+        self.update_statistics_panel()
 
     def get_assigned_x_column(self, idx_y):
         # idx_y = index of selected y column
@@ -2102,17 +2533,10 @@ class SpreadSheetWindow(QMainWindow):
         if self.data[idx_y]["type"] != 'Y':
             self.mw.show_statusbar_message('Please only select Y-columns!', 4000)
             return
-        else:
-            idx_x = idx_y - 1
-            while idx_x >= 0:
-                if self.data[idx_x]["type"] == 'X':
-                    return idx_x
-                else:
-                    idx_x -= 1
-
-            if idx_x == -1:
-                self.mw.show_statusbar_message("At least one dataset Y has no assigned X dataset.", 4000)
-                return
+        idx_x = self.column_roles.x_column(idx_y)
+        if idx_x is None:
+            self.mw.show_statusbar_message("At least one dataset Y has no assigned X dataset.", 4000)
+        return idx_x
 
     def get_plot_data(self, plot_all=False):
         """ get data from selected columns and prepares data for plot """
@@ -2129,7 +2553,7 @@ class SpreadSheetWindow(QMainWindow):
                         }
 
         if plot_all is True:
-            selCol = [idx for idx, d in enumerate(self.data) if d["type"] == "Y"]
+            selCol = self.column_roles.columns("Y")
         else:
             # get visual index of selected columns in sorted order
             selCol = sorted(set(self.headers.visualIndex(idx.column()) for idx in self.header_table.selectedIndexes()))
@@ -2148,49 +2572,34 @@ class SpreadSheetWindow(QMainWindow):
             if self.data[c]["type"] != 'Y':
                 self.mw.show_statusbar_message('Please only select Y-columns!', 4000)
                 return
-            else:
-                k = c - 1
-                while k >= 0:
-                    if self.data[k]["type"] == 'X':
-                        # label for plot legende
-                        if self.data[c]["longname"] is None or self.data[c]["longname"] == '':
-                            label = self.data[c]["shortname"]
-                        else:
-                            label = self.data[c]["longname"]
-
-                        m = c + 1
-                        yerr = None
-                        while m <= self.cols:
-                            if m == self.cols:
-                                yerr = None
-                                m = self.cols + 1
-                            elif self.data[m]["type"] == 'Yerr':
-                                yerr = self.data[m]["data"]
-                                m = self.cols + 1
-                            else:
-                                m = m + 1
-                        self.plot_data.append(plot_content.copy())
-                        self.plot_data[-1]["x"] = self.data[k]["data"]
-                        self.plot_data[-1]["y"] = self.data[c]["data"]
-                        self.plot_data[-1]["filename"] = self.data[c]["filename"]
-                        self.plot_data[-1]["label"] = label
-                        self.plot_data[-1]["plot type"] = plot_type
-                        self.plot_data[-1]["yerr"] = yerr
-                        if self.data[k]["axis label"] is not None and self.data[k]["axis label"] != '':
-                            self.plot_data[-1]["xaxis"] = self.data[k]["axis label"]
-                            if self.data[k]["unit"] is not None and self.data[k]["unit"] != '':
-                                self.plot_data[-1]["xaxis"] += " / {}".format(self.data[k]["unit"])
-                        if self.data[c]["axis label"] is not None and self.data[c]["axis label"] != '':
-                            self.plot_data[-1]["yaxis"] = self.data[c]["axis label"]
-                            if self.data[c]["unit"] is not None and self.data[c]["unit"] != "":
-                                self.plot_data[-1]["yaxis"] += " / {}".format(self.data[c]["unit"])
-                        k = -2
-                    else:
-                        k = k - 1
+            k = self.column_roles.x_column(c)
+            if k is None:
+                self.mw.show_statusbar_message("At least one dataset Y has no assigned X dataset.", 4000)
+                return
 
-                if k == -1:
-                    self.mw.show_statusbar_message("At least one dataset Y has no assigned X dataset.", 4000)
-                    return
+            # label for plot legende
+            if self.data[c]["longname"] is None or self.data[c]["longname"] == '':
+                label = self.data[c]["shortname"]
+            else:
+                label = self.data[c]["longname"]
+
+            m = self.column_roles.yerr_column(c)
+            yerr = None if m is None else self.data[m]["data"]
+            self.plot_data.append(plot_content.copy())
+            self.plot_data[-1]["x"] = self.data[k]["data"]
+            self.plot_data[-1]["y"] = self.data[c]["data"]
+            self.plot_data[-1]["filename"] = self.data[c]["filename"]
+            self.plot_data[-1]["label"] = label
+            self.plot_data[-1]["plot type"] = plot_type
+            self.plot_data[-1]["yerr"] = yerr
+            if self.data[k]["axis label"] is not None and self.data[k]["axis label"] != '':
+                self.plot_data[-1]["xaxis"] = self.data[k]["axis label"]
+                if self.data[k]["unit"] is not None and self.data[k]["unit"] != '':
+                    self.plot_data[-1]["xaxis"] += " / {}".format(self.data[k]["unit"])
+            if self.data[c]["axis label"] is not None and self.data[c]["axis label"] != '':
+                self.plot_data[-1]["yaxis"] = self.data[c]["axis label"]
+                if self.data[c]["unit"] is not None and self.data[c]["unit"] != "":
+                    self.plot_data[-1]["yaxis"] += " / {}".format(self.data[c]["unit"])
 
         # check that x and y have same length to avoid problems later:
         # append Spreadsheet instance
@@ -2251,6 +2660,80 @@ class SpreadSheetWindow(QMainWindow):
         else:
             self.add_pw_signal.emit(action.text())
 
+    def get_stack_data(self):
+        """
+        all Y columns as stack of spectra for stack plots and heatmaps
+        @return: dictionary with the spectra ('x', 'y'), their 'labels', the numeric values of the columns (index, long
+        names, ...) as 'sources' and the axis labels, None if the columns can't be plotted
+        """
+        columns = self.column_roles.columns("Y")
+        if not columns:
+            self.mw.show_statusbar_message("There are no Y columns to plot", 4000)
+            return None
+        x_all, y_all, labels = [], [], []
+        for c in columns:
+            k = self.column_roles.x_column(c)
+            if k is None:
+                self.mw.show_statusbar_message("At least one dataset Y has no assigned X dataset.", 4000)
+                return None
+            try:
+                x = np.asarray(self.data[k]["data"], dtype=float)
+                y = np.asarray(self.data[c]["data"], dtype=float)
+            except (TypeError, ValueError):
+                self.mw.show_statusbar_message("It seems there is a strange data typ in one column.", 4000)
+                return None
+            if len(x) != len(y):
+                self.mw.show_statusbar_message("X and Y have different lengths", 4000)
+                return None
+            valid = np.isfinite(x) & np.isfinite(y)
+            x_all.append(x[valid])
+            y_all.append(y[valid])
+            if self.data[c]["longname"] is None or self.data[c]["longname"] == "":
+                labels.append(self.data[c]["shortname"])
+            else:
+                labels.append(self.data[c]["longname"])
+
+        # numeric values of the columns, which can be used for colors or as axis
+        sources = {"Spectrum index": list(range(len(columns)))}
+        for name, key in [("Long name", "longname"), ("Comments", "comments"), ("File name", "filename")]:
+            values = spreadsheetTools.metadata_values([self.data[c] for c in columns], key)
+            if values is not None and len(np.unique(values)) > 1:
+                sources[name] = values.tolist()
+
+        return {"x": x_all, "y": y_all, "labels": labels, "sources": sources,
+                "xaxis": self.data[self.column_roles.x_column(columns[0])]["axis label"],
+                "yaxis": self.data[columns[0]]["axis label"], "spreadsheet title": self.windowTitle()}
+
+    def plot_stack(self):
+        """plot all Y columns in a stack plot window: one collection of lines colored with a colormap"""
+        content = self.get_stack_data()
+        if content is None:
+            return
+        content["color sources"] = content.pop("sources")
+
+        options = {"color by": "Spectrum index", "colormap": "viridis", "offset": 0.0, "line width": 1.0}
+        stack_dialog = DialogClasses.StackPlotDialog(self, list(content["color sources"].keys()), options)
+        stack_dialog.show()
+
+        # loop stops code until user selects options
+        loop = QtCore.QEventLoop()
+        stack_dialog.closeSignal.connect(loop.quit)
+        loop.exec_()
+        if stack_dialog.options is None:
+            return
+
+        content.update(stack_dialog.options)
+        self.mw.new_window(None, "Stackplot", content, None)
+
+    def plot_heatmap(self):
+        """show all Y columns as image in a heatmap window"""
+        content = self.get_stack_data()
+        if content is None:
+            return
+        content["y sources"] = content.pop("sources")
+        content.update({"y axis source": "Spectrum index", "colormap": "viridis", "color limits": None})
+        self.mw.new_window(None, "Heatmap", content, None)
+
     def closeEvent(self, event):
         close = QMessageBox()
         close.setWindowTitle("Quit")
@@ -2259,6 +2742,9 @@ class SpreadSheetWindow(QMainWindow):
         close = close.exec_()
 
         if close == QMessageBox.Yes:
+            if self.decomposition_thread is not None:
+                self.decomposition_thread.requestInterruption()
+                self.decomposition_thread.wait()
             self.closeWindowSignal.emit('Spreadsheet', self.windowTitle())
             event.accept()
         else:
@@ -2282,6 +2768,7 @@ class LineBuilder(matplotlib.lines.Line2D):
         self.loop = loop
         self.move_line = False
         self.parent = parent
+        self.blit_manager = plotInteraction.blit_manager(self.canvas)
 
         # set event connections
         self.cid_pick = self.canvas.mpl_connect("pick_event", self)
@@ -2301,6 +2788,7 @@ class LineBuilder(matplotlib.lines.Line2D):
         if event.name == "pick_event":
             if event.artist == self:
                 self.move_line = True
+                self.blit_manager.start(self)
         elif event.name == "button_press_event":
             if event.button == 3:
                 self.remove_line()
@@ -2316,10 +2804,12 @@ class LineBuilder(matplotlib.lines.Line2D):
         if xs is None:
             return
 
-        self.set_xdata(xs)
-        self.canvas.draw()
+        self.set_xdata([xs] * len(self.get_xdata()))
+        self.blit_manager.update()
 
     def on_release(self, event):
+        if self.move_line:
+            self.blit_manager.stop(self)
         self.move_line = False
 
     def remove_line(self):
@@ -2330,6 +2820,7 @@ class LineBuilder(matplotlib.lines.Line2D):
         c.mpl_disconnect(self.cid_press)
         c.mpl_disconnect(self.cid_key)
 
+        self.blit_manager.stop(self)
         self.remove()
         c.draw()
 
@@ -2349,13 +2840,18 @@ class MoveSpectra:
         self.scaling = scaling
         self.canvas = self.parent.fig.canvas
         self.move_line = None
+        self.blit_manager = plotInteraction.blit_manager(self.canvas)
         self.cid1 = self.canvas.mpl_connect('pick_event', self.on_pick)
         self.cid2 = self.canvas.mpl_connect('motion_notify_event', self.on_move)
         self.cid3 = self.canvas.mpl_connect('button_release_event', self.on_release)
 
     def on_pick(self, event):
+        if self.move_line is not None:
+            # several artists can be picked with one click
+            self.blit_manager.stop(self.move_line)
         if event.artist in [d["line"] for d in self.parent.data]:
             self.move_line = event.artist
+            self.blit_manager.start(self.move_line)
         else:
             self.move_line = None
 
@@ -2368,11 +2864,10 @@ class MoveSpectra:
         if x_click is None or y_click is None:
             return
 
-        x = self.move_line.get_xdata()
         y = self.move_line.get_ydata()
 
         # get index of nearest point
-        ind = min(range(len(x)), key=lambda i: abs(x[i] - x_click))
+        ind = plotInteraction.picking_index(self.move_line).nearest_x(x_click)
 
         if not self.scaling:
             shift_factor = y_click - y[ind]
@@ -2382,10 +2877,11 @@ class MoveSpectra:
             y = y * scale_factor
 
         self.move_line.set_ydata(y)
-        self.canvas.draw()
+        self.blit_manager.update()
 
     def on_release(self, event):
         if self.move_line is not None:
+            self.blit_manager.stop(self.move_line)
             self.move_line = None
 
     def stop(self):
@@ -2437,6 +2933,7 @@ class LineDrawer:
 
         self.pickedPoint = None
         self.arrow.set_picker(5)
+        self.blit_manager = plotInteraction.blit_manager(self.c)
 
         self.c.mpl_connect('pick_event', self.pickpoint)
         self.c.mpl_connect('motion_notify_event', self.movepoint)
@@ -2456,7 +2953,7 @@ class LineDrawer:
                 return
             self.selectedPoint, = self.ax.plot(self.pickedPoint[0], self.pickedPoint[1], 'o', ms=12, alpha=0.4,
                                                color='yellow')
-            self.c.draw()
+            self.blit_manager.start(self.arrow, self.selectedPoint)
         elif event.artist == self.arrow and event.mouseevent.button == 3:
             self.options()
         else:
@@ -2476,14 +2973,14 @@ class LineDrawer:
                 return
             self.pickedPoint = [event.xdata, event.ydata]
             self.arrow.set_positions(self.posA, self.posB)
-            self.selectedPoint.set_data(self.pickedPoint)
-            self.c.draw()
+            self.selectedPoint.set_data([self.pickedPoint[0]], [self.pickedPoint[1]])
+            self.blit_manager.update()
 
     def unpickpoint(self, event):
         if self.pickedPoint and event.button == 1:
             self.pickedPoint = None
+            self.blit_manager.stop(self.arrow, self.selectedPoint)
             self.selectedPoint.remove()
-            self.c.draw()
         else:
             return
 
@@ -2574,6 +3071,7 @@ class InsertText:
         elif event.artist == self.text_annotation and event.mouseevent.button == 1:
             self.cid2 = self.fig.canvas.mpl_connect("button_release_event", self.on_release)
             self.cid3 = self.fig.canvas.mpl_connect("motion_notify_event", self.on_motion)
+            plotInteraction.blit_manager(self.fig.canvas).start(self.text_annotation)
         elif event.artist == self.text_annotation and event.mouseevent.button == 3:
             self.text_options()
         else:
@@ -2601,13 +3099,16 @@ class InsertText:
         self.fig.canvas.draw()
 
     def on_motion(self, event):
+        if event.xdata is None or event.ydata is None:
+            return
         self.position = (event.xdata, event.ydata)
         self.text_annotation.set_position(self.position)
-        self.fig.canvas.draw()
+        plotInteraction.blit_manager(self.fig.canvas).update()
 
     def on_release(self, event):
         self.fig.canvas.mpl_disconnect(self.cid2)
         self.fig.canvas.mpl_disconnect(self.cid3)
+        plotInteraction.blit_manager(self.fig.canvas).stop(self.text_annotation)
 
     def text_options(self):
         """Option dialog"""
@@ -2650,7 +3151,8 @@ class DataPointPicker:
         self.selected, = self.fig.axes[0].plot(self.xs[a], self.ys[a], 'o',
                                                ms=12, alpha=0.4,
                                                color='yellow')  # Yellow point to mark selected Data points
-        self.fig.canvas.draw()
+        self.blit_manager = plotInteraction.blit_manager(self.fig.canvas)
+        self.blit_manager.start(self.selected)
         self.fig.canvas.setFocusPolicy(QtCore.Qt.ClickFocus)
         self.fig.canvas.setFocus()
 
@@ -2660,28 +3162,25 @@ class DataPointPicker:
         self.fig.canvas.start_event_loop(timeout=10000)
 
     def onpick(self, event):
-        N = len(event.ind)
-        if not N:
+        if event.artist != self.line or not len(event.ind):
             return True
 
-        # the click locations
-        x = event.mouseevent.xdata
-        y = event.mouseevent.ydata
-        distances = np.hypot(x - self.xs[event.ind], y - self.ys[event.ind])
-        indmin = distances.argmin()
-        self.idx = int(event.ind[indmin])
+        idx = plotInteraction.picked_point(event)
+        if idx is None:
+            return True
+        self.idx = idx
 
-        self.selected.set_data(self.xs[self.idx], self.ys[self.idx])
+        self.selected.set_data([self.xs[self.idx]], [self.ys[self.idx]])
         self.selected.set_visible(True)
-        self.fig.canvas.draw()
+        self.blit_manager.update()
 
     def onpress(self, event):
         if event.key == 'enter':
             self.fig.canvas.mpl_disconnect(self.cid1)
             self.fig.canvas.mpl_disconnect(self.cid2)
             self.fig.canvas.stop_event_loop(self)
+            self.blit_manager.stop(self.selected)
             self.selected.remove()
-            self.fig.canvas.draw()
             return
         elif event.key == 'right':
             inc = 1
@@ -2690,8 +3189,8 @@ class DataPointPicker:
         else:
             return
         self.idx += inc
-        self.selected.set_data(self.xs[self.idx], self.ys[self.idx])
-        self.fig.canvas.draw()
+        self.selected.set_data([self.xs[self.idx]], [self.ys[self.idx]])
+        self.blit_manager.update()
 
 
 class DataSetSelecter(QtWidgets.QMainWindow):
@@ -2777,7 +3276,7 @@ class DataSetSelecter(QtWidgets.QMainWindow):
 
 class MyCustomToolbar(NavigationToolbar2QT):
     signal_remove_line = QtCore.pyqtSignal(object)
-    signal_axis_break = QtCore.pyqtSignal(list, list)
+    signal_figure_saved = QtCore.pyqtSignal(str, float)  # file name, time needed for the export in s
 
     toolitems = [t for t in NavigationToolbar2QT.toolitems]
 
@@ -2805,8 +3304,36 @@ class MyCustomToolbar(NavigationToolbar2QT):
         figureoptions.figure_edit(axes, self)
 
     def save_figure(self, *args):
-        # keep the default behaviour
-        super(MyCustomToolbar, self).save_figure(*args)
+        """
+        save the figure like NavigationToolbar2QT, dense lines are rasterized in vector formats, if this is switched
+        on in the figure options
+        """
+        filetypes = sorted(self.canvas.get_supported_filetypes_grouped().items())
+        default_filetype = self.canvas.get_default_filetype()
+        startpath = os.path.expanduser(matplotlib.rcParams['savefig.directory'])
+        start = os.path.join(startpath, self.canvas.get_default_filename())
+        filters = []
+        selected_filter = None
+        for name, exts in filetypes:
+            file_filter = '{} ({})'.format(name, " ".join(['*.{}'.format(ext) for ext in exts]))
+            if default_filetype in exts:
+                selected_filter = file_filter
+            filters.append(file_filter)
+
+        file_name, _ = QFileDialog.getSaveFileName(self.canvas.parent(), "Choose a filename to save to", start,
+                                                   ';;'.join(filters), selected_filter)
+        if not file_name:
+            return
+        if startpath != "":
+            matplotlib.rcParams['savefig.directory'] = os.path.dirname(file_name)
+        figure = self.canvas.figure
+        try:
+            start_time = time.perf_counter()
+            plotRendering.rasterize_dense_lines(figure)
+            figure.savefig(file_name, dpi=plotRendering.export_dpi(figure, file_name))
+            self.signal_figure_saved.emit(file_name, time.perf_counter() - start_time)
+        except Exception as e:
+            QMessageBox.critical(self, "Error saving file", str(e))
 
     # def _icon(self, name, *args):
     #    if name == 'Layer.png':
@@ -2836,6 +3363,8 @@ class PlotWindow(QMainWindow):
         self.drawn_line = []  # Storage for lines and arrows drawn in the plot
         self.peak_positions = {}  # dict to store Line2D object marking peak positions
         self.selectedData = []
+        # undo and redo of changes of the data
+        self.undo_stack = undoStack.UndoStack(self.mw.undo_memory_budget * 1024 ** 2)
 
         # classes
         self.move_spectra = None
@@ -2846,6 +3375,7 @@ class PlotWindow(QMainWindow):
         self.line_action = None
 
         self.plot()
+        self.redraw_scheduler = plotRendering.RedrawScheduler(self.canvas)
         self.create_statusbar()
         self.create_menubar()
         self.create_sidetoolbar()
@@ -2905,10 +3435,14 @@ class PlotWindow(QMainWindow):
             self.ax.get_legend()
         toolbar = MyCustomToolbar(self.canvas)
         toolbar.signal_remove_line.connect(self.remove_line)
-        toolbar.signal_axis_break.connect(self.axis_break)
+        toolbar.signal_figure_saved.connect(self.figure_saved)
         self.addToolBar(toolbar)
         self.ax.get_legend().set_picker(5)
 
+        # long spectra are drawn decimated to the resolution of the screen
+        for d in self.data:
+            plotRendering.enable_decimation(d["line"])
+
     def add_plot(self, new_data):
         ls = self.data[0]["line"].get_linestyle()
         ma = self.data[0]["line"].get_marker()
@@ -2923,7 +3457,7 @@ class PlotWindow(QMainWindow):
                 spect.set_label(d["label"])
             else:
                 spect, = self.ax.plot(d["x"], d["y"], label=d["label"], picker=True, pickradius=5)
-                d["line"] = spect
+                d["line"] = plotRendering.enable_decimation(spect)
             spect.set_linestyle(ls)
             spect.set_marker(ma)
             if ls is not None:
@@ -2932,7 +3466,7 @@ class PlotWindow(QMainWindow):
                 d["plot type"] = ma
         handles, labels = self.ax.get_legend_handles_labels()
         self.update_legend(handles, labels)
-        self.canvas.draw()
+        self.redraw_scheduler.request()
 
     def remove_line(self, line):
         """
@@ -2948,13 +3482,11 @@ class PlotWindow(QMainWindow):
         except IndexError:
             pass
 
-    def axis_break(self, old_lines, new_lines):
-        """in case of axis breaks, new line objects (Line2D) are created, this function replaces old line objects in
-        data with new one"""
-        for d in self.data:
-            for ol, nl in zip(old_lines, new_lines[0]):
-                if ol == d["line"]:
-                    d["line"] = nl
+    def figure_saved(self, file_name, duration):
+        """report time needed for the export and the size of the file"""
+        size = os.path.getsize(file_name) / 1024 ** 2
+        self.mw.show_statusbar_message("Figure saved in {:.2f} s ({:.2f} MB): {}".format(duration, size, file_name),
+                                       8000)
 
     def pickEvent(self, event):
         if event.mouseevent.dblclick is True and event.artist == self.ax.get_legend():
@@ -2987,7 +3519,7 @@ class PlotWindow(QMainWindow):
                         new_labels.append(labels[i])
 
             self.update_legend(new_handles, new_labels)
-            self.canvas.draw()
+            self.redraw_scheduler.request()
         elif event.artist in [d["line"] for d in self.data] and event.mouseevent.button == 3:
             line_dialog = QMenu()
             line_dialog.addAction("Go to Spreadsheet", lambda: self.go_to_spreadsheet(event.artist))
@@ -3042,6 +3574,8 @@ class PlotWindow(QMainWindow):
 
         # 2. menu item: Edit
         edit_menu = menubar.addMenu('&Edit')
+        edit_menu.addAction('Undo', self.undo, QtGui.QKeySequence.Undo)
+        edit_menu.addAction('Redo', self.redo, QtGui.QKeySequence.Redo)
 
         # editDelete = editMenu.addMenu('Delete broken pixel - LabRam')
         # editDelete.addAction("532nm")
@@ -3099,9 +3633,11 @@ class PlotWindow(QMainWindow):
 
         # 3.3 Analysis baseline correction
         analysis_menu.addAction('Baseline Corrections', self.baseline)
+        analysis_menu.addAction('Baseline correction of several spectra at once', self.baseline_multiple)
 
         # 3.3 Smoothing
         analysis_menu.addAction("Smooth spectrum", self.smoothing)
+        analysis_menu.addAction("Smooth several spectra at once", self.smoothing_multiple)
 
         # add later
         # 3.4 Analysis find peaks
@@ -3279,7 +3815,12 @@ class PlotWindow(QMainWindow):
 
         try:
             if isinstance(data, (np.ndarray, np.generic)):
-                np.savetxt(file_name, data, fmt='%.5f', header=header)
+                data = np.asarray(data)
+                if data.ndim == 1:
+                    data = data.reshape(-1, 1)
+                header_rows = [[line] for line in header.split("\n")] if header else None
+                self.mw.export_columns(file_name, list(data.T), header=header_rows, precision=5, delimiter=" ",
+                                       missing_text="nan", comments="# ")
             elif isinstance(data, list):
                 np.savetxt(file_name, data, fmt="%s", header=header)
             else:
@@ -3290,16 +3831,40 @@ class PlotWindow(QMainWindow):
             self.mw.show_statusbar_message(str(e), 3000)
             print(e)
 
+    def undo(self):
+        text = self.undo_stack.undo()
+        if text is None:
+            self.mw.show_statusbar_message("Nothing to undo", 3000)
+        else:
+            self.mw.show_statusbar_message("Undo: {}".format(text), 3000)
+
+    def redo(self):
+        text = self.undo_stack.redo()
+        if text is None:
+            self.mw.show_statusbar_message("Nothing to redo", 3000)
+        else:
+            self.mw.show_statusbar_message("Redo: {}".format(text), 3000)
+
+    def refresh_lines(self):
+        """update all lines with the data stored in self.data, e.g. after undo"""
+        for d in self.data:
+            d["line"].set_data(d["x"], d["y"])
+        self.redraw_scheduler.request()
+
     def del_datapoint(self):
         self.select_data_set()
-        for j in self.selectedDatasetNumber:
-            pickDP = DataPointPicker(self.data[j]["line"], 0)
-            idx = pickDP.idx
-            self.data[j]["x"] = np.delete(self.data[j]["x"], idx)
-            self.data[j]["y"] = np.delete(self.data[j]["y"], idx)
-            self.data[j]["line"].set_data(self.data[j]["x"], self.data[j]["y"])
-            self.setFocus()
-            self.canvas.draw()
+        with self.redraw_scheduler.batch("Delete data point"):
+            for j in self.selectedDatasetNumber:
+                pickDP = DataPointPicker(self.data[j]["line"], 0)
+                idx = pickDP.idx
+                with self.undo_stack.record("Delete data point", self.refresh_lines) as change:
+                    change.save(self.data[j], "x")
+                    change.save(self.data[j], "y")
+                    self.data[j]["x"] = np.delete(self.data[j]["x"], idx)
+                    self.data[j]["y"] = np.delete(self.data[j]["y"], idx)
+                self.data[j]["line"].set_data(self.data[j]["x"], self.data[j]["y"])
+                self.setFocus()
+                self.redraw_scheduler.request()
 
     def del_broken_pixel(self, action):
         """
@@ -3307,95 +3872,84 @@ class PlotWindow(QMainWindow):
         """
         data_idx_diff = {'532nm': 957, '633nm': 924}
         self.select_data_set()
-        for j in self.selectedDatasetNumber:
-            data_idx = 629  # index of first broken data point
-            border = 6
-            print('Following data points of {} were deleted'.format(self.data[j]["label"]))
-            while data_idx <= len(self.data[j]["x"]):
-                data_min_idx = np.argmin(self.data[j]["y"][data_idx - border:data_idx + border])
-                if data_min_idx == 0 or data_min_idx == 2 * border:
-                    QMessageBox.about(self, "Title",
-                                      "Please select this data point manually (around {} in the data set {})".format(
-                                          self.data[j]["x"][data_idx], self.data[j]["y"]))
-                    pickDP = DataPointPicker(self.data[j]["line"], data_idx)
-                    data_idx = pickDP.idx
-                else:
-                    data_idx += data_min_idx - border
+        with self.redraw_scheduler.batch("Delete broken pixel"):
+            for j in self.selectedDatasetNumber:
+                data_idx = 629  # index of first broken data point
+                border = 6
+                print('Following data points of {} were deleted'.format(self.data[j]["label"]))
+                with self.undo_stack.record("Delete broken pixel", self.refresh_lines) as change:
+                    change.save(self.data[j], "x")
+                    change.save(self.data[j], "y")
+                    while data_idx <= len(self.data[j]["x"]):
+                        data_min_idx = np.argmin(self.data[j]["y"][data_idx - border:data_idx + border])
+                        if data_min_idx == 0 or data_min_idx == 2 * border:
+                            message = "Please select this data point manually (around {} in the data set {})".format(
+                                self.data[j]["x"][data_idx], self.data[j]["y"])
+                            QMessageBox.about(self, "Title", message)
+                            pickDP = DataPointPicker(self.data[j]["line"], data_idx)
+                            data_idx = pickDP.idx
+                        else:
+                            data_idx += data_min_idx - border
 
-                print(self.data[j]["x"][data_idx], self.data[j]["y"][data_idx])
-                self.data[j]["x"] = np.round(np.delete(self.data[j]["x"], data_idx), 5)
-                self.data[j]["y"] = np.delete(self.data[j]["y"], data_idx)
-                data_idx += data_idx_diff[action.text()]
+                        print(self.data[j]["x"][data_idx], self.data[j]["y"][data_idx])
+                        self.data[j]["x"] = np.round(np.delete(self.data[j]["x"], data_idx), 5)
+                        self.data[j]["y"] = np.delete(self.data[j]["y"], data_idx)
+                        data_idx += data_idx_diff[action.text()]
 
-            self.data[j]["line"].set_data(self.data[j]["x"], self.data[j]["y"])
-            self.setFocus()
-            self.canvas.draw()
+                self.data[j]["line"].set_data(self.data[j]["x"], self.data[j]["y"])
+                self.setFocus()
+                self.redraw_scheduler.request()
 
-            # Save data without defective data points
-            startFileDirName = os.path.dirname(self.data[j]["filename"])
-            startFileName = startFileDirName + '/' + self.data[j]["label"]
-            save_data = [self.data[j]["x"], self.data[j]["y"]]
-            save_data = np.transpose(save_data)
-            self.save_to_file('Save data without deleted data points in file', startFileName, save_data)
+                # Save data without defective data points
+                startFileDirName = os.path.dirname(self.data[j]["filename"])
+                startFileName = startFileDirName + '/' + self.data[j]["label"]
+                save_data = [self.data[j]["x"], self.data[j]["y"]]
+                save_data = np.transpose(save_data)
+                self.save_to_file('Save data without deleted data points in file', startFileName, save_data)
 
     def remove_cosmic_spikes(self):
         """
-        Remove cosmic spikes from Raman spectra
+        Remove cosmic spikes from Raman spectra, either within every spectrum (Whitaker-Hayes) or by comparison with
+        neighboring spectra (repeated acquisitions, maps). Spikes are replaced by linear interpolation.
         Whitaker, Darren A., and Kevin Hayes. "A simple algorithm for despiking Raman spectra."
         Chemometrics and Intelligent Laboratory Systems 179 (2018): 82-84.
-        @return: spectrum without spikes
         """
         self.select_data_set()
-        for n in self.selectedDatasetNumber:
-            y = self.data[n]["y"]
-            y_diff = np.diff(y)
-            z = (y_diff - np.median(y_diff)) / scipy.stats.median_abs_deviation(y_diff)
-            z = np.append(z, 0)
-
-            threshold = 8
-            z = (abs(z) > threshold) * 1
-            spikes = np.where(z == 1)
-            ma = 5
-
-            if spikes[0].size > 1:
-                print("{} contains cosmic spikes".format(self.data[n]["label"]))
-
-            for i in spikes[0]:
-                w = np.arange(start=max([1, i - ma]), stop=min([len(y), i + ma]), step=1)
-                w = w[np.where(z[w] == 0)]
-                y[i] = np.mean(np.array(y)[w])
-
-            self.data[n]["line"].set_ydata(y)
-            self.data[n]["y"] = y
-            self.data[n]["y"] = y
-        self.canvas.draw()
+        if not self.selectedDatasetNumber:
+            return
+        data_sets = [self.data[n] for n in self.selectedDatasetNumber]
+        spike_dialog = analysisMethods.SpikeRemovalDialog(self, data_sets, analysisMethods.SpikeRemovalMethods())
+        spike_dialog.show()
 
     def normalize(self, select_peak=False):
         """
         normalize spectrum regarding the highest peak or regarding the selected peak
         """
         self.select_data_set()
-        for n in self.selectedDatasetNumber:
-            norm_factor = np.amax(self.data[n]["y"])
-            if select_peak:
-                dpp = DataPointPicker(self.data[n]["line"], np.where(self.data[n]["y"] == norm_factor))
-                idx = dpp.idx
-                norm_factor = self.data[n]["y"][idx]
-
-            self.data[n]["y"] = self.data[n]["y"] / norm_factor
-            self.data[n]["line"].set_data(self.data[n]["x"], self.data[n]["y"])
-            self.canvas.draw()
-            # Save normalized data
-            # if self.data[n]["filename"] is not None:
-            #    (fileBaseName, fileExtension) = os.path.splitext(self.data[n]["label"])
-            #     startFileDirName = os.path.dirname(self.data[n]["filename"])
-            #     startFileBaseName = startFileDirName + '/' + fileBaseName
-            #     startFileName = startFileBaseName + '_norm.txt'
-            # else:
-            #     startFileName = None
-            # save_data = [self.data[n]["x"], self.data[n]["y"]]
-            # save_data = np.transpose(save_data)
-            # self.save_to_file('Save normalized data in file', startFileName, save_data)
+        with self.redraw_scheduler.batch("Normalize"):
+            with self.undo_stack.record("Normalize", self.refresh_lines) as change:
+                for n in self.selectedDatasetNumber:
+                    norm_factor = np.amax(self.data[n]["y"])
+                    if select_peak:
+                        dpp = DataPointPicker(self.data[n]["line"], np.where(self.data[n]["y"] == norm_factor))
+                        idx = dpp.idx
+                        norm_factor = self.data[n]["y"][idx]
+
+                    change.save(self.data[n], "y")
+                    self.data[n]["y"] = self.data[n]["y"] / norm_factor
+                    self.data[n]["line"].set_data(self.data[n]["x"], self.data[n]["y"])
+                    self.redraw_scheduler.request()
+                    # Save normalized data
+                    # if self.data[n]["filename"] is not None:
+                    #    (fileBaseName, fileExtension) = os.path.splitext(self.data[n]["label"])
+                    #     startFileDirName = os.path.dirname(self.data[n]["filename"])
+                    #     startFileBaseName = startFileDirName + '/' + fileBaseName
+                    #     startFileName = startFileBaseName + '_norm.txt'
+                    # else:
+                    #     startFileName = None
+                    # save_data = [self.data[n]["x"], self.data[n]["y"]]
+                    # save_data = np.transpose(save_data)
+                    # self.save_to_file('Save normalized data in file', startFileName, save_data)
 
     def add_subtract_spectra(self):
         """
@@ -3463,7 +4017,7 @@ class PlotWindow(QMainWindow):
         line, = self.ax.plot(x1, y, label=line_label, linestyle=line_style)
         self.data.append(self.create_data(x1, y, label=line_label, style=line_style, line=line))
 
-        self.canvas.draw()
+        self.redraw_scheduler.request()
 
     def convert_unit(self):
         """convert units of the x-axis from wavelength to wavenumber and vice versa"""
@@ -3507,17 +4061,18 @@ class PlotWindow(QMainWindow):
         self.ax.xaxis.set_major_locator(loc)
         self.ax.set_xlabel(axis_label)
 
-        self.canvas.draw()
+        self.redraw_scheduler.request()
 
     def quick_fit(self, q):
-        """fit one peak without opening the fit dialog"""
+        """fit one peak without opening the fit dialog, spectra with the same x data are fitted together"""
         self.select_data_set()
         if self.selectedDatasetNumber:
             x_min, x_max = self.SelectArea()
-            self.fit_functions.n_fit_fct[q.text()] = 1
         else:
             return
 
+        # start parameters
+        fit_data = []
         for j in self.selectedDatasetNumber:
             xs = self.data[j]["line"].get_xdata()
             ys = self.data[j]["line"].get_ydata()
@@ -3534,30 +4089,40 @@ class PlotWindow(QMainWindow):
                 self.mw.show_statusbar_message("Couldn't find good start parameters \n"
                                                "Use Fit Dialog please", 4000)
                 return
-            p_start = [background, p, h, w]
-
-            try:
-                popt, pcov = curve_fit(self.fit_functions.FctSumme, x, y, p0=p_start)
-            except RuntimeError or ValueError as e:
-                self.mw.show_statusbar_message(str(e), 4000)
-                self.fit_functions.n_fit_fct = dict.fromkeys(self.fit_functions.n_fit_fct, 0)
-                return
-            x1 = np.linspace(min(x), max(x), 1000)
-            y1 = self.fit_functions.FctSumme(x1, *popt)
-            line, = self.ax.plot(x1, y1, '-r')
-            label = line.get_label()
-            self.data.append(self.create_data(x1, y1, label=label, style='-r', line=line))
-            self.canvas.draw()
-
-            # print parameter
-            print_table = prettytable.PrettyTable()
-            print_table.field_names = ["Parameters", "Values"]
-            parameter_name = ["Background", "Raman Shift in cm^-1", "Intensity", "FWHM", "Additional Parameter"]
-            for idx, po in enumerate(popt):
-                print_table.add_row([parameter_name[idx], po])
+            fit_data.append({"index": j, "x": np.asarray(x, dtype=float), "y": y, "p_start": [background, p, h, w]})
+
+        self.fit_functions.n_fit_fct[q.text()] = 1
+        with self.redraw_scheduler.batch("Quick fit"):
+            for group in parallelAnalysis.group_by_x(fit_data, lambda fd: fd["x"]):
+                x = group["x"]
+                fits = group["spectra"]
+                fit_parameter = {"n_fit_fct": {q.text(): 1}, "p0": [fd["p_start"] for fd in fits]}
+                results = self.mw.run_analysis_job(self, "fit", None, fit_parameter, x, [fd["y"] for fd in fits])
+                if results is None:
+                    break
 
-            print("\n {} {}".format(self.data[j]["line"].get_label(), q.text()))
-            print(print_table)
+                for fd, popt in zip(fits, results[0]):
+                    j = fd["index"]
+                    if np.isnan(popt).all():
+                        self.mw.show_statusbar_message(
+                            "Fit of {} failed".format(self.data[j]["line"].get_label()), 4000)
+                        continue
+                    x1 = np.linspace(min(x), max(x), 1000)
+                    y1 = self.fit_functions.FctSumme(x1, *popt)
+                    line, = self.ax.plot(x1, y1, '-r')
+                    label = line.get_label()
+                    self.data.append(self.create_data(x1, y1, label=label, style='-r', line=line))
+
+                    # print parameter
+                    print_table = prettytable.PrettyTable()
+                    print_table.field_names = ["Parameters", "Values"]
+                    parameter_name = ["Background", "Raman Shift in cm^-1", "Intensity", "FWHM", "Additional Parameter"]
+                    for idx, po in enumerate(popt):
+                        print_table.add_row([parameter_name[idx], po])
+
+                    print("\n {} {}".format(self.data[j]["line"].get_label(), q.text()))
+                    print(print_table)
+            self.redraw_scheduler.request()
 
         # set number of fit functions to 0 again
         self.fit_functions.n_fit_fct = dict.fromkeys(self.fit_functions.n_fit_fct, 0)
@@ -3614,7 +4179,7 @@ class PlotWindow(QMainWindow):
         x_min = line_1.get_xdata()  # lower limit
         x_max = line_2.get_xdata()  # upper limit
 
-        self.canvas.draw()
+        self.redraw_scheduler.request()
         self.ax.autoscale(True)
         return x_min, x_max
 
@@ -3642,15 +4207,18 @@ class PlotWindow(QMainWindow):
 
     def shift_spectrum_to_zero(self):
         self.select_data_set()
-        for n in self.selectedDatasetNumber:
-            spct = self.data[n]["line"]
-            xs = spct.get_xdata()
-            ys = spct.get_ydata()
-            min_y = min(ys)
-            y_shifted = ys - min_y
-            spct.set_ydata(y_shifted)
-            self.data[n]["y"] = y_shifted
-            self.canvas.draw()
+        with self.redraw_scheduler.batch("Shift spectrum to zero line"):
+            with self.undo_stack.record("Shift spectrum to zero line", self.refresh_lines) as change:
+                for n in self.selectedDatasetNumber:
+                    spct = self.data[n]["line"]
+                    xs = spct.get_xdata()
+                    ys = spct.get_ydata()
+                    min_y = min(ys)
+                    y_shifted = ys - min_y
+                    spct.set_ydata(y_shifted)
+                    change.save(self.data[n], "y")
+                    self.data[n]["y"] = y_shifted
+                    self.redraw_scheduler.request()
 
     def baseline(self):
         self.select_data_set()
@@ -3674,6 +4242,15 @@ class PlotWindow(QMainWindow):
             if baseline_dialog.close_button.isChecked():
                 break
 
+    def baseline_multiple(self):
+        """baseline correction of all selected spectra with the same method and parameters"""
+        self.select_data_set()
+        if not self.selectedDatasetNumber:
+            return
+        spectra = [self.data[n]["line"] for n in self.selectedDatasetNumber]
+        baseline_dialog = analysisMethods.BaselineCorrectionStackDialog(self, spectra, self.blc)
+        baseline_dialog.show()
+
     def smoothing(self):
         self.select_data_set()
         smoothing_methods = analysisMethods.SmoothingMethods()
@@ -3693,44 +4270,54 @@ class PlotWindow(QMainWindow):
             if smooth_dialog.close_button.isChecked():
                 break
 
-    def linear_regression(self):
+    def smoothing_multiple(self):
+        """smooth all selected spectra with the same method and parameters"""
         self.select_data_set()
-        for n in self.selectedDatasetNumber:
-            spct = self.data[n]["line"]
-            xs = spct.get_xdata()
-            ys = spct.get_ydata()
-
-            # delete all values, which are nan
-            x = xs[np.logical_not(np.isnan(ys))]
-            y = ys[np.logical_not(np.isnan(ys))]
-
-            # Fit
-            popt, pcov = curve_fit(self.fit_functions.LinearFct, x, y)
-
-            # Errors and R**2
-            perr = np.sqrt(np.diag(pcov))
-            residuals = y - self.fit_functions.LinearFct(x, *popt)
-            ss_res = np.sum(residuals ** 2)
-            ss_tot = np.sum((y - np.mean(y)) ** 2)
-            r_squared = 1 - (ss_res / ss_tot)
-
-            # Plot determined linear function
-            x1 = np.linspace(min(x), max(x), 1000)
-            y1 = self.fit_functions.LinearFct(x1, *popt)
-            line, = self.ax.plot(x1, y1, '-r')
-            label = line.get_label()
-            self.data.append(self.create_data(x, y, label=label, line=line, style='-'))
-            self.canvas.draw()
+        if not self.selectedDatasetNumber:
+            return
+        spectra = [self.data[n]["line"] for n in self.selectedDatasetNumber]
+        smooth_dialog = analysisMethods.SmoothingStackDialog(self, spectra, analysisMethods.SmoothingMethods())
+        smooth_dialog.show()
 
-            # print results
-            print_table = prettytable.PrettyTable()
-            print_table.field_names = ["Parameters", "Values", "Errors"]
-            parameter_name = ["Slope", "y-Intercept"]
-            for i in range(len(popt)):
-                print_table.add_row([parameter_name[i], popt[i], perr[i]])
-            print('\n {}'.format(spct.get_label()))
-            print(r'R^2={:.4f}'.format(r_squared))
-            print(print_table)
+    def linear_regression(self):
+        self.select_data_set()
+        with self.redraw_scheduler.batch("Linear regression"):
+            for n in self.selectedDatasetNumber:
+                spct = self.data[n]["line"]
+                xs = spct.get_xdata()
+                ys = spct.get_ydata()
+
+                # delete all values, which are nan
+                x = xs[np.logical_not(np.isnan(ys))]
+                y = ys[np.logical_not(np.isnan(ys))]
+
+                # Fit
+                popt, pcov = curve_fit(self.fit_functions.LinearFct, x, y)
+
+                # Errors and R**2
+                perr = np.sqrt(np.diag(pcov))
+                residuals = y - self.fit_functions.LinearFct(x, *popt)
+                ss_res = np.sum(residuals ** 2)
+                ss_tot = np.sum((y - np.mean(y)) ** 2)
+                r_squared = 1 - (ss_res / ss_tot)
+
+                # Plot determined linear function
+                x1 = np.linspace(min(x), max(x), 1000)
+                y1 = self.fit_functions.LinearFct(x1, *popt)
+                line, = self.ax.plot(x1, y1, '-r')
+                label = line.get_label()
+                self.data.append(self.create_data(x, y, label=label, line=line, style='-'))
+                self.redraw_scheduler.request()
+
+                # print results
+                print_table = prettytable.PrettyTable()
+                print_table.field_names = ["Parameters", "Values", "Errors"]
+                parameter_name = ["Slope", "y-Intercept"]
+                for i in range(len(popt)):
+                    print_table.add_row([parameter_name[i], popt[i], perr[i]])
+                print('\n {}'.format(spct.get_label()))
+                print(r'R^2={:.4f}'.format(r_squared))
+                print(print_table)
 
     def create_analysis_routine(self):
         """create own analysis routine"""
@@ -3738,7 +4325,7 @@ class PlotWindow(QMainWindow):
             "Define data area":
                 analysisMethods.DataLimit(self),
             "Cosmic spike removal":
-                "Not yet implemented",
+                analysisMethods.AnalysisDialog(self, analysisMethods.SpikeRemovalMethods(), add_apply_button=False),
             "Smoothing":
                 analysisMethods.AnalysisDialog(self, analysisMethods.SmoothingMethods(), add_apply_button=False),
             "Baseline correction":
@@ -3767,31 +4354,32 @@ class PlotWindow(QMainWindow):
         if len(input_routine) != len(output_routine):
             print("Something is wrong with the length of the input and output of the analysis routine")
 
-        for n in self.selectedDatasetNumber:
-            spectrum = self.data[n]["line"]
-            x = spectrum.get_xdata()
-            y = spectrum.get_ydata()
-            label = spectrum.get_label()
-            result_text += "\n{}\n".format(label)
-            for i, o in zip(input_routine, output_routine):
-
-                result_text += "{}\n".format(i["method"])
-                x, y, result_text, output = self.apply_own_routine(i["method"], i["info"], x, y, label, result_text)
-                if y is None:
-                    break
-                if output is None:
-                    continue
-                else:
-                    if o["method"] == "Peak fitting":
-                        buffer_list = [label]
-                        idx_fct = 0
-                        for op, iop in zip(output, o["info"]):
-                            for opk in iop["parameter"]:
-                                buffer_list.append(op[opk])
-                                if len(header) < len(buffer_list):
-                                    header.append("{} {} ({})".format(opk, idx_fct, iop["function"]))
-                            idx_fct += 1
-                        output_list.append(buffer_list)
+        with self.redraw_scheduler.batch("Own analysis routine"):
+            for n in self.selectedDatasetNumber:
+                spectrum = self.data[n]["line"]
+                x = spectrum.get_xdata()
+                y = spectrum.get_ydata()
+                label = spectrum.get_label()
+                result_text += "\n{}\n".format(label)
+                for i, o in zip(input_routine, output_routine):
+
+                    result_text += "{}\n".format(i["method"])
+                    x, y, result_text, output = self.apply_own_routine(i["method"], i["info"], x, y, label, result_text)
+                    if y is None:
+                        break
+                    if output is None:
+                        continue
+                    else:
+                        if o["method"] == "Peak fitting":
+                            buffer_list = [label]
+                            idx_fct = 0
+                            for op, iop in zip(output, o["info"]):
+                                for opk in iop["parameter"]:
+                                    buffer_list.append(op[opk])
+                                    if len(header) < len(buffer_list):
+                                        header.append("{} {} ({})".format(opk, idx_fct, iop["function"]))
+                                idx_fct += 1
+                            output_list.append(buffer_list)
 
         self.save_to_file("Save", "output.txt", output_list, header="".join(header))
 
@@ -3810,17 +4398,29 @@ class PlotWindow(QMainWindow):
             x = x_cut
             y = y_cut
             output = None
+        elif method == "Cosmic spike removal":
+            # remove spikes
+            parameter = parameter[0]
+            function = analysisMethods.SpikeRemovalMethods().methods[parameter["name"]]["function"]
+            params = list(parameter["parameter"].values())
+            y_clean, spikes = function(x, y, *params)
+            y = y_clean[0]
+
+            # save results
+            result_text += "{}\n".format(parameter["name"])
+            result_text += "{}\n".format(parameter["parameter"])
+            result_text += "{} points replaced\n".format(np.count_nonzero(spikes))
+            output = None
         elif method == "Baseline correction":
 
             # apply baseline correction
             parameter = parameter[0]
-            function = self.blc.methods[parameter["name"]]["function"]
             params = list(parameter["parameter"].values())
-            yb, zb = function(x, y, *params)
+            yb, zb = self.blc.correct(x, y, parameter["name"], *params)
 
             # plot
             line, = self.ax.plot(x, yb, label="{} ({})".format(label, "baseline corrected"))
-            self.canvas.draw()
+            self.redraw_scheduler.request()
             self.create_data(x, yb, line=line, label=line.get_label())
 
             # save results
@@ -3831,13 +4431,15 @@ class PlotWindow(QMainWindow):
         elif method == "Smoothing":
             # apply smoothing
             parameter = parameter[0]
-            function = analysisMethods.SmoothingMethods().methods[parameter["name"]]["function"]
             params = list(parameter["parameter"].values())
-            y_smoothed = function(x, y, *params)
+            y_smoothed = analysisMethods.SmoothingMethods().smooth_stack(x, y, parameter["name"], *params)
+            if y_smoothed is None:
+                return x, None, result_text, None
+            y_smoothed = y_smoothed[0]
 
             # plot
             line, = self.ax.plot(x, y_smoothed, label="{} ({})".format(label, "smoothed"))
-            self.canvas.draw()
+            self.redraw_scheduler.request()
             self.create_data(x, y_smoothed, line=line, label=line.get_label())
 
             # save results
@@ -3871,7 +4473,7 @@ class PlotWindow(QMainWindow):
             y_fit_total = self.fit_functions.FctSumme(x, *popt)
             line, = self.ax.plot(x, y_fit_total, label="{} ({})".format(label, "total fit"))
 
-            self.canvas.draw()
+            self.redraw_scheduler.request()
             self.create_data(x, y_fit_total, line=line, label=line.get_label())
 
             # Calculate Errors and R square
@@ -3936,36 +4538,37 @@ class PlotWindow(QMainWindow):
         x_max_1 = 900
         x_min_2 = 1900
         x_max_2 = 2300
-        for n in self.selectedDatasetNumber:
-            x = self.data[n]["line"].get_xdata()
-            y = self.data[n]["line"].get_ydata()
-
-            x1 = x[np.where((x > x_min_1) & (x < x_max_1))]
-            y1 = y[np.where((x > x_min_1) & (x < x_max_1))]
-            x2 = x[np.where((x > x_min_2) & (x < x_max_2))]
-            y2 = y[np.where((x > x_min_2) & (x < x_max_2))]
-            x = np.concatenate((x1, x2))
-            y = np.concatenate((y1, y2))
-
-            popt, pcov = curve_fit(self.fit_functions.LinearFct, x, y)
-
-            # Plot determined linear function
-            x_plot = np.linspace(min(x), max(x), 1000)
-            self.ax.plot(x_plot, self.fit_functions.LinearFct(x_plot, *popt), '-r')
-            self.canvas.draw()
-
-            # get index of G peak
-            idx_G = np.argmax(y)
-
-            # calculate m/I(G):
-            mIG = popt[0] / y[idx_G]
-
-            print(self.data[n]["line"].get_label())
-            if mIG > 0:
-                hydrogen_content = 21.7 + 16.6 * math.log10(mIG * 10 ** 4)
-                print("Slope: {}\nhydrogen content: {}".format(mIG, hydrogen_content))
-            else:
-                print('negative slope')
+        with self.redraw_scheduler.batch("Hydrogen estimation"):
+            for n in self.selectedDatasetNumber:
+                x = self.data[n]["line"].get_xdata()
+                y = self.data[n]["line"].get_ydata()
+
+                x1 = x[np.where((x > x_min_1) & (x < x_max_1))]
+                y1 = y[np.where((x > x_min_1) & (x < x_max_1))]
+                x2 = x[np.where((x > x_min_2) & (x < x_max_2))]
+                y2 = y[np.where((x > x_min_2) & (x < x_max_2))]
+                x = np.concatenate((x1, x2))
+                y = np.concatenate((y1, y2))
+
+                popt, pcov = curve_fit(self.fit_functions.LinearFct, x, y)
+
+                # Plot determined linear function
+                x_plot = np.linspace(min(x), max(x), 1000)
+                self.ax.plot(x_plot, self.fit_functions.LinearFct(x_plot, *popt), '-r')
+                self.redraw_scheduler.request()
+
+                # get index of G peak
+                idx_G = np.argmax(y)
+
+                # calculate m/I(G):
+                mIG = popt[0] / y[idx_G]
+
+                print(self.data[n]["line"].get_label())
+                if mIG > 0:
+                    hydrogen_content = 21.7 + 16.6 * math.log10(mIG * 10 ** 4)
+                    print("Slope: {}\nhydrogen content: {}".format(mIG, hydrogen_content))
+                else:
+                    print('negative slope')
 
     def fit_D_G(self):
         """
@@ -4029,164 +4632,167 @@ class PlotWindow(QMainWindow):
         p_bounds = ((p_bounds_low, p_bounds_up))
 
         # iterate through all selected data sets
-        for n in self.selectedDatasetNumber:
-
-            x = self.data[n]["line"].get_xdata()
-            y = self.data[n]["line"].get_ydata()
+        with self.redraw_scheduler.batch("Fit D and G band"):
+            for n in self.selectedDatasetNumber:
 
-            # baseline correction
-            # Asymmetric least‐squares baseline algorithm with peak screening
-            # for automatic processing of the Raman spectra
-            yb, zb = self.blc.derpsALS(x, y, 1000000, 0.01)  # (lambda, p) parameter for baseline correction
-            self.ax.plot(x, zb, 'c--', label='baseline ({})'.format(self.data[n]["line"].get_label()))
-            self.ax.plot(x, yb, 'c-', label='baseline-corrected ({})'.format(self.data[n]["line"].get_label()))
-            self.canvas.draw()
+                x = self.data[n]["line"].get_xdata()
+                y = self.data[n]["line"].get_ydata()
 
-            # Limits for FitProcess
-            # define fit region
-            x_min_fit = 945
-            x_max_fit = 1830
+                # baseline correction
+                # Asymmetric least‐squares baseline algorithm with peak screening
+                # for automatic processing of the Raman spectra
+                yb, zb = self.blc.derpsALS(x, y, 1000000, 0.01)  # (lambda, p) parameter for baseline correction
+                self.ax.plot(x, zb, 'c--', label='baseline ({})'.format(self.data[n]["line"].get_label()))
+                self.ax.plot(x, yb, 'c-', label='baseline-corrected ({})'.format(self.data[n]["line"].get_label()))
+                self.redraw_scheduler.request()
 
-            # limit data to fit region
-            working_y = yb[np.where((x > x_min_fit) & (x < x_max_fit))]
-            working_x = x[np.where((x > x_min_fit) & (x < x_max_fit))]
-
-            try:
-                popt, pcov = curve_fit(self.fit_functions.FctSumme, working_x, working_y, p0=p_start, bounds=p_bounds,
-                                       absolute_sigma=False)
-            except RuntimeError as e:
-                self.mw.show_statusbar_message(str(e), 4000)
-                continue
-
-            # Plot the Fit Data
-            x1 = np.linspace(min(working_x), max(working_x), 3000)
-            y_L = []
-            for j in range(aL):
-                y_L.append(np.array(
-                    popt[0] + self.fit_functions.LorentzFct(x1, popt[1 + 3 * j], popt[2 + 3 * j], popt[3 + 3 * j])))
-            y_G = []
-            for j in range(aG):
-                y_G.append(np.array(
-                    popt[0] + self.fit_functions.GaussianFct(x1, popt[1 + 3 * aL + 3 * j], popt[2 + 3 * aL + 3 * j],
-                                                             popt[3 + 3 * aL + 3 * j])))
-            y_BWF = []
-            for j in range(aB):
-                y_BWF.append(np.array(
-                    popt[0] + self.fit_functions.BreitWignerFct(x1, popt[4 * j + 3 * aLG + 1],
-                                                                popt[4 * j + 3 * aLG + 2],
-                                                                popt[4 * j + 3 * aLG + 3], popt[4 * j + 3 * aLG + 4])))
-            y_Ges = np.array(self.fit_functions.FctSumme(x1, *popt))
-            self.ax.plot(x1, y_Ges, '-r')
-            for j in y_G:
-                self.ax.plot(x1, j, '--g')
-            for j in y_L:
-                self.ax.plot(x1, j, '--g')
-            for j in y_BWF:
-                self.ax.plot(x1, j, '--g')
-
-            self.canvas.draw()
+                # Limits for FitProcess
+                # define fit region
+                x_min_fit = 945
+                x_max_fit = 1830
 
-            # Calculate Errors and R square
-            perr = np.sqrt(np.diag(pcov))
+                # limit data to fit region
+                working_y = yb[np.where((x > x_min_fit) & (x < x_max_fit))]
+                working_x = x[np.where((x > x_min_fit) & (x < x_max_fit))]
 
-            residuals = working_y - self.fit_functions.FctSumme(working_x, *popt)
-            ss_res = np.sum(residuals ** 2)
-            ss_tot = np.sum((working_y - np.mean(working_y)) ** 2)
-            r_squared = 1 - (ss_res / ss_tot)
+                try:
+                    popt, pcov = curve_fit(self.fit_functions.FctSumme, working_x, working_y, p0=p_start,
+                                           bounds=p_bounds, absolute_sigma=False)
+                except RuntimeError as e:
+                    self.mw.show_statusbar_message(str(e), 4000)
+                    continue
 
-            # Peak Area
-            area_Lorentz = []
-            area_Lorentz_err = []
-            for j in range(aL):
-                area_Lorentz.append(np.trapz(y_L[j], x1))
-                area_Lorentz_err.append(None)  # add error later
-
-            area_Gauss = []
-            area_Gauss_err = []
-            for j in range(aG):
-                area_Gauss.append(np.trapz(y_G[j], x1))
-                area_Gauss_err.append(None)
-
-            area_BWF = []
-            area_BWF_err = []
-            for j in range(aB):
-                area_BWF.append(np.trapz(y_BWF[j], x1))
-                area_BWF_err.append(None)
-
-            # get data into printable form
-            print_table = [['Background', popt[0], perr[0]], ['', '', '']]
-            for j in range(aL):
-                print_table.append(['Lorentz %i' % (j + 1), "", ""])
-                print_table.append(['Raman Shift in cm-1', popt[j * 3 + 1], perr[j * 3 + 1]])
-                print_table.append(['Peak height in cps', popt[j * 3 + 2], perr[j * 3 + 2]])
-                I_D = popt[j * 3 + 2]
-                print_table.append(['FWHM in cm-1', popt[j * 3 + 3], perr[j * 3 + 3]])
-                print_table.append(['Peak area in cps*cm-1', area_Lorentz[j], area_Lorentz_err[j]])
-                print_table.append(['', '', ''])
-            for j in range(aG):
-                print_table.append(['Gauss %i' % (j + 1), "", ""])
-                print_table.append(['Raman Shift in cm-1', popt[j * 3 + 3 * aL + 1], perr[j * 3 + 3 * aL + 1]])
-                print_table.append(['Peak height in cps', popt[j * 3 + 3 * aL + 2], perr[j * 3 + 3 * aL + 2]])
-                print_table.append(['FWHM in cm-1', popt[j * 3 + 3 * aL + 3], perr[j * 3 + 3 * aL + 3]])
-                print_table.append(['Peak area in cps*cm-1', area_Gauss[j], area_Gauss_err[j]])
-                print_table.append(['', '', ''])
-            for j in range(aB):
-                print_table.append(['BWF %i' % (j + 1), "", ""])
-                print_table.append(['Raman Shift in cm-1', popt[j * 3 + 3 * aLG + 1], perr[j * 3 + 3 * aLG + 1]])
-                print_table.append(['Peak height in cps', popt[j * 3 + 3 * aLG + 2], perr[j * 3 + 3 * aLG + 2]])
-                I_G = popt[j * 3 + 3 * aLG + 2]
-                print_table.append(['FWHM in cm-1', popt[j * 3 + 3 * aLG + 3], perr[j * 3 + 3 * aLG + 3]])
-                print_table.append(['BWF Coupling Coefficient', popt[j * 3 + 3 * aLG + 4], perr[j * 3 + 3 * aLG + 4]])
-                print_table.append(['Peak area in cps*cm-1', area_BWF[j], area_BWF_err[j]])
-                print_table.append(['', '', ''])
-
-            # Estimate Cluster size
-            # ID/IG = C(lambda)/L_a
-            # mit C(514.5 nm) = 4.4 nm
-            ratio = I_D / I_G
-            ratio_err = None  # add error later
-            L_a = 4.4 / ratio  # in nm
-            L_a_err = None
-
-            print_table.append(['I_D/I_G', ratio, ratio_err])
-            print_table.append(['Cluster Size in nm', L_a, L_a_err])
-
-            save_data = prettytable.PrettyTable()
-            save_data.field_names = ["Parameters", "Values", "Errors"]
-            save_data.add_rows(print_table)
-            save_data = "R^2={:.6f} \n Lorentz 1 = D-Bande, BWF (Breit-Wigner-Fano) 1 = G-Bande \n {}".format(r_squared,
-                                                                                                              save_data)
-
-            print('\n')
-            print(self.data[n]["line"].get_label())
-            print(save_data)
-
-            # (fileBaseName, fileExtension) = os.path.splitext(self.data[n]["line"].get_label())
-            # startFileDirName = os.path.dirname(self.selectedData[0]["filename"])
-            # with open(startFileDirName + "/ID-IG.txt", "a") as file_cluster:
-            #    file_cluster.write('\n' + str(fileBaseName) + '   %.4f' % ratio + '   %.4f' % ratio_err)
-
-            # pos_G_max = pos_G + b_G / (2 * q_G)
-            # with open(startFileDirName + "/G-Position.txt", "a") as file_GPosition:
-            #    file_GPosition.write('\n{} {:.4f}  {:.4f}'.format(fileBaseName, pos_G_max, 0.0))
-
-            # Save the fit parameter
-            # startFileBaseName = startFileDirName + '/' + fileBaseName
-            # startFileName = startFileBaseName + '_fitpara.txt'
-            # self.save_to_file('Save fit parameter in file', startFileName, save_data)
-
-            # Save the Fit data
-            # startFileName = startFileBaseName + '_fitdata.txt'
-            # save_data = [x1]
-            # for j in y_L:
-            #    save_data.append(j)
-            # for j in y_G:
-            #    save_data.append(j)
-            # for j in y_BWF:
-            #    save_data.append(j)
-            # save_data.append(y_Ges)
-            # save_data = np.transpose(save_data)
-            # self.save_to_file('Save fit data in file', startFileName, save_data)
+                # Plot the Fit Data
+                x1 = np.linspace(min(working_x), max(working_x), 3000)
+                y_L = []
+                for j in range(aL):
+                    y_L.append(np.array(
+                        popt[0] + self.fit_functions.LorentzFct(x1, popt[1 + 3 * j], popt[2 + 3 * j], popt[3 + 3 * j])))
+                y_G = []
+                for j in range(aG):
+                    y_G.append(np.array(
+                        popt[0] + self.fit_functions.GaussianFct(x1, popt[1 + 3 * aL + 3 * j], popt[2 + 3 * aL + 3 * j],
+                                                                 popt[3 + 3 * aL + 3 * j])))
+                y_BWF = []
+                for j in range(aB):
+                    y_BWF.append(np.array(
+                        popt[0] + self.fit_functions.BreitWignerFct(x1, popt[4 * j + 3 * aLG + 1],
+                                                                    popt[4 * j + 3 * aLG + 2],
+                                                                    popt[4 * j + 3 * aLG + 3],
+                                                                    popt[4 * j + 3 * aLG + 4])))
+                y_Ges = np.array(self.fit_functions.FctSumme(x1, *popt))
+                self.ax.plot(x1, y_Ges, '-r')
+                for j in y_G:
+                    self.ax.plot(x1, j, '--g')
+                for j in y_L:
+                    self.ax.plot(x1, j, '--g')
+                for j in y_BWF:
+                    self.ax.plot(x1, j, '--g')
+
+                self.redraw_scheduler.request()
+
+                # Calculate Errors and R square
+                perr = np.sqrt(np.diag(pcov))
+
+                residuals = working_y - self.fit_functions.FctSumme(working_x, *popt)
+                ss_res = np.sum(residuals ** 2)
+                ss_tot = np.sum((working_y - np.mean(working_y)) ** 2)
+                r_squared = 1 - (ss_res / ss_tot)
+
+                # Peak Area
+                area_Lorentz = []
+                area_Lorentz_err = []
+                for j in range(aL):
+                    area_Lorentz.append(np.trapz(y_L[j], x1))
+                    area_Lorentz_err.append(None)  # add error later
+
+                area_Gauss = []
+                area_Gauss_err = []
+                for j in range(aG):
+                    area_Gauss.append(np.trapz(y_G[j], x1))
+                    area_Gauss_err.append(None)
+
+                area_BWF = []
+                area_BWF_err = []
+                for j in range(aB):
+                    area_BWF.append(np.trapz(y_BWF[j], x1))
+                    area_BWF_err.append(None)
+
+                # get data into printable form
+                print_table = [['Background', popt[0], perr[0]], ['', '', '']]
+                for j in range(aL):
+                    print_table.append(['Lorentz %i' % (j + 1), "", ""])
+                    print_table.append(['Raman Shift in cm-1', popt[j * 3 + 1], perr[j * 3 + 1]])
+                    print_table.append(['Peak height in cps', popt[j * 3 + 2], perr[j * 3 + 2]])
+                    I_D = popt[j * 3 + 2]
+                    print_table.append(['FWHM in cm-1', popt[j * 3 + 3], perr[j * 3 + 3]])
+                    print_table.append(['Peak area in cps*cm-1', area_Lorentz[j], area_Lorentz_err[j]])
+                    print_table.append(['', '', ''])
+                for j in range(aG):
+                    print_table.append(['Gauss %i' % (j + 1), "", ""])
+                    print_table.append(['Raman Shift in cm-1', popt[j * 3 + 3 * aL + 1], perr[j * 3 + 3 * aL + 1]])
+                    print_table.append(['Peak height in cps', popt[j * 3 + 3 * aL + 2], perr[j * 3 + 3 * aL + 2]])
+                    print_table.append(['FWHM in cm-1', popt[j * 3 + 3 * aL + 3], perr[j * 3 + 3 * aL + 3]])
+                    print_table.append(['Peak area in cps*cm-1', area_Gauss[j], area_Gauss_err[j]])
+                    print_table.append(['', '', ''])
+                for j in range(aB):
+                    print_table.append(['BWF %i' % (j + 1), "", ""])
+                    print_table.append(['Raman Shift in cm-1', popt[j * 3 + 3 * aLG + 1], perr[j * 3 + 3 * aLG + 1]])
+                    print_table.append(['Peak height in cps', popt[j * 3 + 3 * aLG + 2], perr[j * 3 + 3 * aLG + 2]])
+                    I_G = popt[j * 3 + 3 * aLG + 2]
+                    print_table.append(['FWHM in cm-1', popt[j * 3 + 3 * aLG + 3], perr[j * 3 + 3 * aLG + 3]])
+                    print_table.append(['BWF Coupling Coefficient', popt[j * 3 + 3 * aLG + 4],
+                                        perr[j * 3 + 3 * aLG + 4]])
+                    print_table.append(['Peak area in cps*cm-1', area_BWF[j], area_BWF_err[j]])
+                    print_table.append(['', '', ''])
+
+                # Estimate Cluster size
+                # ID/IG = C(lambda)/L_a
+                # mit C(514.5 nm) = 4.4 nm
+                ratio = I_D / I_G
+                ratio_err = None  # add error later
+                L_a = 4.4 / ratio  # in nm
+                L_a_err = None
+
+                print_table.append(['I_D/I_G', ratio, ratio_err])
+                print_table.append(['Cluster Size in nm', L_a, L_a_err])
+
+                save_data = prettytable.PrettyTable()
+                save_data.field_names = ["Parameters", "Values", "Errors"]
+                save_data.add_rows(print_table)
+                save_data = "R^2={:.6f} \n Lorentz 1 = D-Bande, BWF (Breit-Wigner-Fano) 1 = G-Bande \n {}".format(
+                    r_squared, save_data)
+
+                print('\n')
+                print(self.data[n]["line"].get_label())
+                print(save_data)
+
+                # (fileBaseName, fileExtension) = os.path.splitext(self.data[n]["line"].get_label())
+                # startFileDirName = os.path.dirname(self.selectedData[0]["filename"])
+                # with open(startFileDirName + "/ID-IG.txt", "a") as file_cluster:
+                #    file_cluster.write('\n' + str(fileBaseName) + '   %.4f' % ratio + '   %.4f' % ratio_err)
+
+                # pos_G_max = pos_G + b_G / (2 * q_G)
+                # with open(startFileDirName + "/G-Position.txt", "a") as file_GPosition:
+                #    file_GPosition.write('\n{} {:.4f}  {:.4f}'.format(fileBaseName, pos_G_max, 0.0))
+
+                # Save the fit parameter
+                # startFileBaseName = startFileDirName + '/' + fileBaseName
+                # startFileName = startFileBaseName + '_fitpara.txt'
+                # self.save_to_file('Save fit parameter in file', startFileName, save_data)
+
+                # Save the Fit data
+                # startFileName = startFileBaseName + '_fitdata.txt'
+                # save_data = [x1]
+                # for j in y_L:
+                #    save_data.append(j)
+                # for j in y_G:
+                #    save_data.append(j)
+                # for j in y_BWF:
+                #    save_data.append(j)
+                # save_data.append(y_Ges)
+                # save_data = np.transpose(save_data)
+                # self.save_to_file('Save fit data in file', startFileName, save_data)
 
     def norm_to_water(self):
         """
@@ -4194,32 +4800,33 @@ class PlotWindow(QMainWindow):
         and then normalizes the spectra to the water peak
         """
         self.select_data_set()
-        for n in self.selectedDatasetNumber:
-            # get data
-            spct = self.data[n]["line"]
-            xs = spct.get_xdata()
-            ys = spct.get_ydata()
-
-            # background correction
-            yb, baseline = self.blc.drPLS(xs, ys, lam=9000000, eta=0.5)
-
-            # norm spectrum regarding water peak
-            norm_factor = np.max(yb[np.argwhere((xs > 3000) & (xs < 3700))])
-            yb = yb / norm_factor
-            self.data[n]["y"] = yb
-            self.data[n]["line"].set_data(xs, yb)
-            self.canvas.draw()
-            # Save normalized data
-            if self.data[n]["filename"] is not None:
-                (fileBaseName, fileExtension) = os.path.splitext(self.data[n]["label"])
-                startFileDirName = os.path.dirname(self.data[n]["filename"])
-                startFileBaseName = startFileDirName + '/' + fileBaseName
-                startFileName = startFileBaseName + '_norm.txt'
-            else:
-                startFileName = None
-            save_data = [self.data[n]["x"], self.data[n]["y"]]
-            save_data = np.transpose(save_data)
-            self.save_to_file('Save normalized data in file', startFileName, save_data)
+        with self.redraw_scheduler.batch("Normalize to water peak"):
+            for n in self.selectedDatasetNumber:
+                # get data
+                spct = self.data[n]["line"]
+                xs = spct.get_xdata()
+                ys = spct.get_ydata()
+
+                # background correction
+                yb, baseline = self.blc.drPLS(xs, ys, lam=9000000, eta=0.5)
+
+                # norm spectrum regarding water peak
+                norm_factor = np.max(yb[np.argwhere((xs > 3000) & (xs < 3700))])
+                yb = yb / norm_factor
+                self.data[n]["y"] = yb
+                self.data[n]["line"].set_data(xs, yb)
+                self.redraw_scheduler.request()
+                # Save normalized data
+                if self.data[n]["filename"] is not None:
+                    (fileBaseName, fileExtension) = os.path.splitext(self.data[n]["label"])
+                    startFileDirName = os.path.dirname(self.data[n]["filename"])
+                    startFileBaseName = startFileDirName + '/' + fileBaseName
+                    startFileName = startFileBaseName + '_norm.txt'
+                else:
+                    startFileName = None
+                save_data = [self.data[n]["x"], self.data[n]["y"]]
+                save_data = np.transpose(save_data)
+                self.save_to_file('Save normalized data in file', startFileName, save_data)
 
     def fit_sulfuroxyanion(self):
         """function to fit region between 700 and 1400cm-1 in spectra with sulfuroxyanions with Lorentzians"""
@@ -4249,93 +4856,94 @@ class PlotWindow(QMainWindow):
         # number of fit functions
         self.fit_functions.n_fit_fct['Lorentz'] = len(peak_pos)
 
-        for n in self.selectedDatasetNumber:
-            peak_areas = []
-
-            # get data
-            spct = self.data[n]["line"]
-            xs = spct.get_xdata()
-            ys = spct.get_ydata()
+        with self.redraw_scheduler.batch("Fit sulfuroxyanions"):
+            for n in self.selectedDatasetNumber:
+                peak_areas = []
+
+                # get data
+                spct = self.data[n]["line"]
+                xs = spct.get_xdata()
+                ys = spct.get_ydata()
+
+                # limit data
+                y = ys[np.where((xs > x_min) & (xs < x_max))]
+                x = xs[np.where((xs > x_min) & (xs < x_max))]
+
+                # Fit parameter: initial guess and boundaries
+                p_start = [0]
+                p_bounds_low = [-0.001]
+                p_bounds_up = [np.inf]
+                for (start_pos, start_width) in zip(peak_pos, peak_fwhm):
+                    start_height = max(y[np.where((x > (start_pos - 3)) & (x < (start_pos + 3)))]) * 0.9
+                    if start_height < 0:
+                        start_height = 0
+                    start_width = 15
+                    p_start.extend([start_pos, start_height, start_width])
+                    p_bounds_low.extend([start_pos - 10, 0, 0])
+                    p_bounds_up.extend([start_pos + 10, np.inf, np.inf])
+                p_bounds = [p_bounds_low, p_bounds_up]
 
-            # limit data
-            y = ys[np.where((xs > x_min) & (xs < x_max))]
-            x = xs[np.where((xs > x_min) & (xs < x_max))]
-
-            # Fit parameter: initial guess and boundaries
-            p_start = [0]
-            p_bounds_low = [-0.001]
-            p_bounds_up = [np.inf]
-            for (start_pos, start_width) in zip(peak_pos, peak_fwhm):
-                start_height = max(y[np.where((x > (start_pos - 3)) & (x < (start_pos + 3)))]) * 0.9
-                if start_height < 0:
-                    start_height = 0
-                start_width = 15
-                p_start.extend([start_pos, start_height, start_width])
-                p_bounds_low.extend([start_pos - 10, 0, 0])
-                p_bounds_up.extend([start_pos + 10, np.inf, np.inf])
-            p_bounds = [p_bounds_low, p_bounds_up]
-
-            try:
-                popt, pcov = curve_fit(self.fit_functions.FctSumme, x, y, p0=p_start, bounds=p_bounds,
-                                       absolute_sigma=False)
-            except RuntimeError as e:
-                self.mw.show_statusbar_message(str(e), 4000)
-                continue
-
-            # Plot the Fit Data
-            x_fit = np.linspace(x_min, x_max, 3000)
-            for j in range(self.fit_functions.n_fit_fct['Lorentz']):
-                y_Lorentz = self.fit_functions.LorentzFct(x_fit, popt[1 + 3 * j], popt[2 + 3 * j], popt[3 + 3 * j])
-                peak_areas.append(np.trapz(y_Lorentz))
-                self.ax.plot(x_fit, popt[0] + y_Lorentz, '--g')
-            self.ax.plot(x_fit, self.fit_functions.FctSumme(x_fit, *popt), '-r')
-            self.canvas.draw()
-
-            # Calculate Errors and R square
-            perr = np.sqrt(np.diag(pcov))
-
-            residuals = y - self.fit_functions.FctSumme(x, *popt)
-            ss_res = np.sum(residuals ** 2)
-            ss_tot = np.sum((y - np.mean(y)) ** 2)
-            r_squared = 1 - (ss_res / ss_tot)
+                try:
+                    popt, pcov = curve_fit(self.fit_functions.FctSumme, x, y, p0=p_start, bounds=p_bounds,
+                                           absolute_sigma=False)
+                except RuntimeError as e:
+                    self.mw.show_statusbar_message(str(e), 4000)
+                    continue
 
-            # store fit parameter in list
-            print_table = [['Background', popt[0], perr[0]], ['', '', '']]
-            for j in range(self.fit_functions.n_fit_fct['Lorentz']):
-                print_table.append(['Lorentz %i' % (j + 1), "", ""])
-                print_table.append(['Raman Shift in cm-1', popt[j * 3 + 1], perr[j * 3 + 1]])
-                print_table.append(['Peak height in cps', popt[j * 3 + 2], perr[j * 3 + 2]])
-                print_table.append(['FWHM in cm-1', popt[j * 3 + 3], perr[j * 3 + 3]])
-                print_table.append(['Peak area in cps*cm-1', peak_areas[j], ''])
-                print_table.append(['', '', ''])
-
-            # use prettytable to create printable table
-            fit_parameter_table = prettytable.PrettyTable()
-            fit_parameter_table.field_names = ["Parameters", "Values", "Errors"]
-            fit_parameter_table.add_rows(print_table)
-
-            # print fit parameter
-            print('\n')
-            print(self.data[n]["line"].get_label(), "R^2={}".format(r_squared))
-            print(fit_parameter_table)
-
-            # save the fit parameter
-            directory_name, file_name_spectrum = os.path.split(self.data[n]["filename"])
-            (fileBaseName, fileExtension) = os.path.splitext(file_name_spectrum)
-            file_name_parameter = '{}/{}_fitparameter.txt'.format(directory_name, fileBaseName)
-            self.save_to_file('Save fit parameter in file', file_name_parameter, fit_parameter_table)
-
-            # get peak heights of persulfate and CarosAcid peaks
-            name = self.data[n]["line"].get_label()
-            idx_PS = [peak_pos.index(p) for p in pos_PS]
-            idx_Caros = [peak_pos.index(p) for p in pos_Caros]
-            for j in idx_PS:
-                with open("{}/PS_intensity_PS{}cm-1.txt".format(directory_name, peak_pos[j]), "a") as f:
-                    f.write('\n{} {:.4f}  {:.4f}'.format(name, popt[3 * j + 2], perr[3 * j + 2]))
-
-            for j in idx_Caros:
-                with open("{}/PS_intensity_Caros{}cm-1.txt".format(directory_name, peak_pos[j]), "a") as f:
-                    f.write('\n{} {:.4f}  {:.4f}'.format(name, popt[3 * j + 2], perr[3 * j + 2]))
+                # Plot the Fit Data
+                x_fit = np.linspace(x_min, x_max, 3000)
+                for j in range(self.fit_functions.n_fit_fct['Lorentz']):
+                    y_Lorentz = self.fit_functions.LorentzFct(x_fit, popt[1 + 3 * j], popt[2 + 3 * j], popt[3 + 3 * j])
+                    peak_areas.append(np.trapz(y_Lorentz))
+                    self.ax.plot(x_fit, popt[0] + y_Lorentz, '--g')
+                self.ax.plot(x_fit, self.fit_functions.FctSumme(x_fit, *popt), '-r')
+                self.redraw_scheduler.request()
+
+                # Calculate Errors and R square
+                perr = np.sqrt(np.diag(pcov))
+
+                residuals = y - self.fit_functions.FctSumme(x, *popt)
+                ss_res = np.sum(residuals ** 2)
+                ss_tot = np.sum((y - np.mean(y)) ** 2)
+                r_squared = 1 - (ss_res / ss_tot)
+
+                # store fit parameter in list
+                print_table = [['Background', popt[0], perr[0]], ['', '', '']]
+                for j in range(self.fit_functions.n_fit_fct['Lorentz']):
+                    print_table.append(['Lorentz %i' % (j + 1), "", ""])
+                    print_table.append(['Raman Shift in cm-1', popt[j * 3 + 1], perr[j * 3 + 1]])
+                    print_table.append(['Peak height in cps', popt[j * 3 + 2], perr[j * 3 + 2]])
+                    print_table.append(['FWHM in cm-1', popt[j * 3 + 3], perr[j * 3 + 3]])
+                    print_table.append(['Peak area in cps*cm-1', peak_areas[j], ''])
+                    print_table.append(['', '', ''])
+
+                # use prettytable to create printable table
+                fit_parameter_table = prettytable.PrettyTable()
+                fit_parameter_table.field_names = ["Parameters", "Values", "Errors"]
+                fit_parameter_table.add_rows(print_table)
+
+                # print fit parameter
+                print('\n')
+                print(self.data[n]["line"].get_label(), "R^2={}".format(r_squared))
+                print(fit_parameter_table)
+
+                # save the fit parameter
+                directory_name, file_name_spectrum = os.path.split(self.data[n]["filename"])
+                (fileBaseName, fileExtension) = os.path.splitext(file_name_spectrum)
+                file_name_parameter = '{}/{}_fitparameter.txt'.format(directory_name, fileBaseName)
+                self.save_to_file('Save fit parameter in file', file_name_parameter, fit_parameter_table)
+
+                # get peak heights of persulfate and CarosAcid peaks
+                name = self.data[n]["line"].get_label()
+                idx_PS = [peak_pos.index(p) for p in pos_PS]
+                idx_Caros = [peak_pos.index(p) for p in pos_Caros]
+                for j in idx_PS:
+                    with open("{}/PS_intensity_PS{}cm-1.txt".format(directory_name, peak_pos[j]), "a") as f:
+                        f.write('\n{} {:.4f}  {:.4f}'.format(name, popt[3 * j + 2], perr[3 * j + 2]))
+
+                for j in idx_Caros:
+                    with open("{}/PS_intensity_Caros{}cm-1.txt".format(directory_name, peak_pos[j]), "a") as f:
+                        f.write('\n{} {:.4f}  {:.4f}'.format(name, popt[3 * j + 2], perr[3 * j + 2]))
 
         self.fit_functions.n_fit_fct['Lorentz'] = 0
 
@@ -4356,7 +4964,7 @@ class PlotWindow(QMainWindow):
                 v_line.remove()
                 del v_line
         self.peak_positions = {}
-        self.canvas.draw()
+        self.redraw_scheduler.request()
 
     def draw_peak_positions(self, peak_positions, id, n_materials):
         colors = list(mcolors.TABLEAU_COLORS)
@@ -4365,7 +4973,7 @@ class PlotWindow(QMainWindow):
             v_line = self.ax.axvline(x=pp, color=colors[n_materials])
             pp_list.append(v_line)
         self.peak_positions[id] = pp_list
-        self.canvas.draw()
+        self.redraw_scheduler.request()
 
     def remove_peak_positions(self, id):
         if id in self.peak_positions.keys():
@@ -4381,7 +4989,7 @@ class PlotWindow(QMainWindow):
             self.peak_positions = {}
         else:
             return
-        self.canvas.draw()
+        self.redraw_scheduler.request()
 
     # Functions of toolbar
     def create_vertical_line(self):
@@ -4445,7 +5053,7 @@ class PlotWindow(QMainWindow):
             arrow.set_figure(self.fig)
             self.ax.add_patch(arrow)
             self.drawn_line.append(LineDrawer(arrow))
-            self.canvas.draw()
+            self.redraw_scheduler.request()
 
     def insert_text(self):
         self.end_event_loop()
@@ -4456,7 +5064,7 @@ class PlotWindow(QMainWindow):
         text = self.ax.annotate(r'''*''', pos, picker=True, fontsize=24)
         self.inserted_text.append(InsertText(text, self.mw))
         self.canvas.mpl_disconnect(self.pick_text_point_connection)
-        self.canvas.draw()
+        self.redraw_scheduler.request()
 
     def closeEvent(self, event):
         close = QMessageBox()
@@ -4472,6 +5080,390 @@ class PlotWindow(QMainWindow):
             event.ignore()
 
 
+class StackPlotWindow(QMainWindow):
+    """
+    Plot window for many spectra (e.g. all spectra of a map): the spectra are drawn as one LineCollection with colors
+    from a colormap and a colorbar instead of a legend
+    """
+    closeWindowSignal = QtCore.pyqtSignal(str, str)
+
+    def __init__(self, mainwindow, content, parent=None):
+        """
+        @param mainwindow: MainWindow
+        @param content: dictionary with the spectra ('x', 'y', 'labels'), the values for the colormap ('color sources')
+        and the plot options ('color by', 'colormap', 'offset', 'line width', 'xaxis', 'yaxis')
+        """
+        super(StackPlotWindow, self).__init__(parent)
+        self.mw = mainwindow
+        self.content = content
+        self.selected = None  # index of the picked spectrum
+
+        self.fig = Figure(figsize=(15, 9))
+        self.ax = self.fig.add_subplot(111)
+        self.canvas = FigureCanvasQTAgg(self.fig)
+        self.spectra = None
+        self.colorbar = None
+        self.highlight = None
+
+        self.plot()
+        self.create_menubar()
+        self.show()
+        self.canvas.mpl_connect("pick_event", self.pick_spectrum)
+
+    def plot(self):
+        self.setCentralWidget(self.canvas)
+        self.addToolBar(NavigationToolbar2QT(self.canvas, self))
+        c = self.content
+        self.spectra = plotRendering.SpectrumCollection(self.ax, list(zip(c["x"], c["y"])),
+                                                        c["color sources"][c["color by"]], c["colormap"], c["offset"],
+                                                        c["line width"])
+        self.colorbar = self.fig.colorbar(self.spectra.collection, ax=self.ax, label=c["color by"])
+        self.highlight, = self.ax.plot([], [], color="r", linewidth=2, visible=False)
+        plotRendering.enable_decimation(self.highlight)
+
+        self.ax.set_xlabel(c["xaxis"] or r"Raman Shift / cm$^{-1}$", fontsize=24)
+        self.ax.set_ylabel(c["yaxis"] or r"Raman Intensity / Arbitr. Units", fontsize=24)
+        self.ax.xaxis.set_tick_params(labelsize=18)
+        self.ax.yaxis.set_tick_params(labelsize=18)
+
+    def create_menubar(self):
+        menubar = self.menuBar()
+        edit_menu = menubar.addMenu("&Edit")
+        edit_menu.addAction("Plot options", self.change_options)
+        edit_menu.addAction("Plot selected spectrum", self.plot_selected)
+
+    def change_options(self):
+        options_dialog = DialogClasses.StackPlotDialog(self, list(self.content["color sources"].keys()), self.content)
+        options_dialog.show()
+
+        # loop stops code until user selects options
+        loop = QtCore.QEventLoop()
+        options_dialog.closeSignal.connect(loop.quit)
+        loop.exec_()
+        options = options_dialog.options
+        if options is None:
+            return
+
+        try:
+            self.spectra.set_colormap(options["colormap"])
+        except ValueError:
+            self.mw.show_statusbar_message("Unknown colormap {}".format(options["colormap"]), 4000)
+            options["colormap"] = self.content["colormap"]
+        self.spectra.set_values(self.content["color sources"][options["color by"]])
+        self.spectra.set_offset(options["offset"])
+        self.spectra.set_linewidth(options["line width"])
+        self.colorbar.set_label(options["color by"])
+        self.content.update(options)
+        if self.selected is not None:
+            self.highlight.set_data(*self.spectra.displayed_spectrum(self.selected))
+        self.canvas.draw_idle()
+
+    def pick_spectrum(self, event):
+        idx = self.spectra.picked_index(event)
+        if idx is None:
+            return
+        self.selected = idx
+        self.highlight.set_data(*self.spectra.displayed_spectrum(idx))
+        self.highlight.set_visible(True)
+        value = self.content["color sources"][self.content["color by"]][idx]
+        self.mw.show_statusbar_message("Spectrum {}: {} ({} = {:g})".format(
+            idx, self.content["labels"][idx], self.content["color by"], value), 4000)
+        self.canvas.draw_idle()
+
+    def plot_selected(self):
+        """open the picked spectrum in a normal plot window"""
+        if self.selected is None:
+            self.mw.show_statusbar_message("Please click on a spectrum first", 4000)
+            return
+        x, y = self.spectra.spectra[self.selected]
+        plot_data = {"x": x, "y": y, "yerr": None, "plot type": "-", "label": self.content["labels"][self.selected],
+                     "xaxis": self.content["xaxis"], "yaxis": self.content["yaxis"], "filename": None,
+                     "spreadsheet title": self.content.get("spreadsheet title")}
+        self.mw.new_window(None, "Plotwindow", [[plot_data], None], None)
+
+    def get_save_data(self):
+        """content of the window as JSON serializable dictionary"""
+        save_data = dict(self.content)
+        save_data["x"] = [list(x) for x in self.content["x"]]
+        save_data["y"] = [list(y) for y in self.content["y"]]
+        save_data["color sources"] = {key: list(values) for key, values in self.content["color sources"].items()}
+        return save_data
+
+    def closeEvent(self, event):
+        close = QMessageBox()
+        close.setWindowTitle('Quit')
+        close.setText("You sure?")
+        close.setStandardButtons(QMessageBox.Yes | QMessageBox.Cancel)
+        close = close.exec_()
+
+        if close == QMessageBox.Yes:
+            self.closeWindowSignal.emit('Stackplot', self.windowTitle())
+            event.accept()
+        else:
+            event.ignore()
+
+
+class HeatmapWindow(QMainWindow):
+    """
+    Plot window showing a stack of spectra as image: the x axis of the spectra horizontally, the spectra (index or a
+    value like the temperature in the long names) vertically. The spectrum under the mouse is shown below the image, a
+    click on the image opens this spectrum in a normal plot window.
+    """
+    closeWindowSignal = QtCore.pyqtSignal(str, str)
+
+    def __init__(self, mainwindow, content, parent=None):
+        """
+        @param mainwindow: MainWindow
+        @param content: dictionary with the spectra ('x', 'y', 'labels'), the values usable as y axis ('y sources') and
+        the options ('y axis source', 'colormap', 'color limits', 'xaxis', 'yaxis')
+        """
+        super(HeatmapWindow, self).__init__(parent)
+        self.mw = mainwindow
+        self.content = content
+
+        self.fig = Figure(figsize=(15, 9))
+        grid = self.fig.add_gridspec(2, 1, height_ratios=(3, 1))
+        self.ax = self.fig.add_subplot(grid[0])
+        self.profile_ax = self.fig.add_subplot(grid[1], sharex=self.ax)
+        self.canvas = FigureCanvasQTAgg(self.fig)
+        self.toolbar = None
+        self.statusBar = None
+        self.lower_box = None
+        self.upper_box = None
+        self.colormap_box = None
+        self.source_box = None
+
+        self.x_grid = None  # common x axis of all spectra
+        self.z = None  # image, spectra sorted by the y axis values (rows) x x_grid (columns)
+        self.order = None  # spectrum index of every row
+        self.row_edges = None  # y coordinates of the borders between the rows
+        self.image = None
+        self.colorbar = None
+        self.cursor_line = None
+        self.profile_line = None
+        self.blit_manager = plotInteraction.blit_manager(self.canvas)
+
+        self.compute_image()
+        self.create_statusbar()
+        self.create_toolbar()
+        self.plot()
+        self.show()
+        self.canvas.mpl_connect("motion_notify_event", self.show_cursor)
+        self.canvas.mpl_connect("button_press_event", self.on_click)
+
+    def compute_image(self):
+        """put all spectra on a common, equidistant x axis, spectra with different x axes are resampled"""
+        x_all, y_all = self.content["x"], self.content["y"]
+        x0 = x_all[0]
+        dx = np.diff(x0)
+        same_x = all(len(x) == len(x0) and np.array_equal(x, x0) for x in x_all)
+        if same_x and len(x0) > 1 and np.allclose(dx, dx[0], rtol=1e-3, atol=0) and dx[0] != 0:
+            self.x_grid = x0
+            self.z = np.vstack(y_all)
+            if dx[0] < 0:
+                self.x_grid, self.z = self.x_grid[::-1], self.z[:, ::-1]
+        else:
+            # spectra with the same x axis are resampled together, the step is the median step of the first spectrum
+            groups = {}
+            for idx, x in enumerate(x_all):
+                groups.setdefault(np.asarray(x).tobytes(), []).append(idx)
+            stacks = [(x_all[rows[0]], np.vstack([y_all[r] for r in rows])) for rows in groups.values()]
+            step = np.median(np.abs(dx)) if len(dx) else 1.0
+            x_grid, z = analysisMethods.ResamplingMethods().resample(stacks, step, "Union", "Linear")
+            order = np.argsort(np.concatenate(list(groups.values())))
+            self.x_grid, self.z = x_grid, z[order]
+        self.sort_rows()
+
+    def sort_rows(self):
+        """order of the rows and their borders for the current y axis values"""
+        source = self.content["y axis source"]
+        values = np.asarray(self.content["y sources"][source], dtype=float)
+        self.order = np.argsort(values, kind="stable")
+        values = values[self.order]
+        if len(values) > 1 and np.any(np.diff(values) == 0):
+            self.mw.show_statusbar_message("{} contains equal values, the spectrum index is used".format(source), 4000)
+            self.content["y axis source"] = "Spectrum index"
+            self.sort_rows()
+            return
+        if len(values) == 1:
+            self.row_edges = np.array([values[0] - 0.5, values[0] + 0.5])
+        else:
+            middle = (values[1:] + values[:-1]) / 2
+            self.row_edges = np.concatenate(([2 * values[0] - middle[0]], middle, [2 * values[-1] - middle[-1]]))
+
+    def create_statusbar(self):
+        self.statusBar = QtWidgets.QStatusBar()
+        self.setStatusBar(self.statusBar)
+
+    def create_toolbar(self):
+        self.toolbar = NavigationToolbar2QT(self.canvas, self)
+        self.addToolBar(self.toolbar)
+
+        options_toolbar = QtWidgets.QToolBar("Image options", self)
+        self.addToolBar(options_toolbar)
+        options_toolbar.addWidget(QtWidgets.QLabel("Y axis "))
+        self.source_box = QtWidgets.QComboBox()
+        self.source_box.addItems(list(self.content["y sources"].keys()))
+        self.source_box.setCurrentText(self.content["y axis source"])
+        self.source_box.currentTextChanged.connect(self.change_y_axis)
+        options_toolbar.addWidget(self.source_box)
+
+        options_toolbar.addWidget(QtWidgets.QLabel(" Colormap "))
+        self.colormap_box = QtWidgets.QComboBox()
+        self.colormap_box.addItems(DialogClasses.StackPlotDialog.colormaps)
+        self.colormap_box.setCurrentText(self.content["colormap"])
+        self.colormap_box.currentTextChanged.connect(self.change_colormap)
+        options_toolbar.addWidget(self.colormap_box)
+
+        options_toolbar.addWidget(QtWidgets.QLabel(" Color limits "))
+        self.lower_box = QtWidgets.QDoubleSpinBox()
+        self.upper_box = QtWidgets.QDoubleSpinBox()
+        for box in [self.lower_box, self.upper_box]:
+            box.setRange(-1e15, 1e15)
+            box.setDecimals(4)
+            box.setKeyboardTracking(False)
+            box.valueChanged.connect(self.change_color_limits)
+            options_toolbar.addWidget(box)
+        options_toolbar.addAction("Auto", self.auto_color_limits)
+
+    def plot(self):
+        self.setCentralWidget(self.canvas)
+        c = self.content
+        rows = self.z[self.order]
+        step = self.x_grid[1] - self.x_grid[0] if len(self.x_grid) > 1 else 1.0
+        if np.allclose(np.diff(self.row_edges), self.row_edges[1] - self.row_edges[0], rtol=1e-6):
+            extent = [self.x_grid[0] - step / 2, self.x_grid[-1] + step / 2, self.row_edges[0], self.row_edges[-1]]
+            self.image = self.ax.imshow(rows, extent=extent, origin="lower", aspect="auto", interpolation="nearest",
+                                        cmap=c["colormap"])
+        else:
+            x_edges = np.append(self.x_grid - step / 2, self.x_grid[-1] + step / 2)
+            self.image = self.ax.pcolormesh(x_edges, self.row_edges, rows, cmap=c["colormap"])
+        self.colorbar = self.fig.colorbar(self.image, ax=[self.ax, self.profile_ax], label=c["yaxis"] or "Intensity")
+        self.ax.set_ylabel(c["y axis source"])
+        self.ax.tick_params(labelbottom=False)
+
+        self.profile_ax.set_xlabel(c["xaxis"] or r"Raman Shift / cm$^{-1}$")
+        self.profile_ax.set_ylabel(c["yaxis"] or "Intensity")
+        if np.any(np.isfinite(self.z)):
+            self.profile_ax.set_ylim(np.nanmin(self.z), np.nanmax(self.z))
+        self.profile_line, = self.profile_ax.plot(self.x_grid, np.full(len(self.x_grid), np.nan), color="k")
+        plotRendering.enable_decimation(self.profile_line)
+        self.cursor_line = self.ax.axhline(np.nan, color="w", linewidth=1)
+
+        if c["color limits"] is None:
+            self.auto_color_limits()
+        else:
+            self.set_color_limits(*c["color limits"])
+        # the cursor line and the spectrum under the mouse are redrawn with blitting
+        self.blit_manager.start(self.cursor_line, self.profile_line)
+
+    def set_color_limits(self, lower, upper):
+        self.content["color limits"] = [lower, upper]
+        for box, value in [(self.lower_box, lower), (self.upper_box, upper)]:
+            box.blockSignals(True)
+            box.setValue(value)
+            box.blockSignals(False)
+        self.image.set_clim(lower, upper)
+        self.canvas.draw_idle()
+
+    def auto_color_limits(self):
+        """1 and 99 percentile of the image, so that single spikes don't hide everything else"""
+        if not np.any(np.isfinite(self.z)):
+            return
+        lower, upper = np.nanpercentile(self.z, [1, 99])
+        if lower == upper:
+            upper = lower + 1
+        self.set_color_limits(float(lower), float(upper))
+
+    def change_color_limits(self):
+        lower, upper = self.lower_box.value(), self.upper_box.value()
+        if lower >= upper:
+            self.statusBar.showMessage("The lower color limit has to be smaller than the upper one", 4000)
+            return
+        self.set_color_limits(lower, upper)
+
+    def change_colormap(self, colormap):
+        self.content["colormap"] = colormap
+        self.image.set_cmap(colormap)
+        self.canvas.draw_idle()
+
+    def change_y_axis(self, source):
+        """use other values (e.g. the temperature in the long names) as y axis"""
+        self.content["y axis source"] = source
+        self.sort_rows()
+        self.source_box.blockSignals(True)
+        self.source_box.setCurrentText(self.content["y axis source"])
+        self.source_box.blockSignals(False)
+        self.blit_manager.stop()
+        self.colorbar.remove()
+        self.image.remove()
+        self.cursor_line.remove()
+        self.profile_line.remove()
+        self.plot()
+
+    def row_at(self, y):
+        """
+        @param y: y coordinate in the image
+        @return: row of the image or None
+        """
+        row = int(np.searchsorted(self.row_edges, y)) - 1
+        if 0 <= row < len(self.order):
+            return row
+        return None
+
+    def show_cursor(self, event):
+        """show the spectrum under the mouse below the image and its values in the status bar"""
+        if event.inaxes is not self.ax:
+            return
+        row = self.row_at(event.ydata)
+        if row is None:
+            return
+        spectrum = self.order[row]
+        column = int(np.clip(np.searchsorted(self.x_grid, event.xdata), 0, len(self.x_grid) - 1))
+        value = self.content["y sources"][self.content["y axis source"]][spectrum]
+        self.statusBar.showMessage("x = {:g}   {} = {:g} ({})   intensity = {:g}".format(
+            self.x_grid[column], self.content["y axis source"], value, self.content["labels"][spectrum],
+            self.z[spectrum, column]))
+        self.cursor_line.set_ydata([(self.row_edges[row] + self.row_edges[row + 1]) / 2] * 2)
+        self.profile_line.set_ydata(self.z[spectrum])
+        self.blit_manager.update()
+
+    def on_click(self, event):
+        """a click on the image opens the spectrum in a normal plot window (not while zooming or panning)"""
+        if event.inaxes is not self.ax or event.button != 1 or self.toolbar.mode != "":
+            return
+        row = self.row_at(event.ydata)
+        if row is None:
+            return
+        spectrum = self.order[row]
+        plot_data = {"x": self.content["x"][spectrum], "y": self.content["y"][spectrum], "yerr": None,
+                     "plot type": "-", "label": self.content["labels"][spectrum], "xaxis": self.content["xaxis"],
+                     "yaxis": self.content["yaxis"], "filename": None,
+                     "spreadsheet title": self.content.get("spreadsheet title")}
+        self.mw.new_window(None, "Plotwindow", [[plot_data], None], None)
+
+    def get_save_data(self):
+        """content of the window as JSON serializable dictionary"""
+        save_data = dict(self.content)
+        save_data["x"] = [list(x) for x in self.content["x"]]
+        save_data["y"] = [list(y) for y in self.content["y"]]
+        save_data["y sources"] = {key: list(values) for key, values in self.content["y sources"].items()}
+        return save_data
+
+    def closeEvent(self, event):
+        close = QMessageBox()
+        close.setWindowTitle('Quit')
+        close.setText("You sure?")
+        close.setStandardButtons(QMessageBox.Yes | QMessageBox.Cancel)
+        close = close.exec_()
+
+        if close == QMessageBox.Yes:
+            self.closeWindowSignal.emit('Heatmap', self.windowTitle())
+            event.accept()
+        else:
+            event.ignore()
+
+
 def new_MainWindow():
     MW = MainWindow()
     MW.showMaximized()
@@ -0,0 +1,183 @@
+"""
+Export of the plot windows of projects as figures (png, pdf, svg, ...) without opening PyRamanGUI
+
+The figures are built from the saved data, figure settings, annotations and axis breaks with figureBuilder.create_figure
+(the same function, which rebuilds the plot windows when a project is loaded) and rendered with the Agg backend in a
+pool of worker processes. Neither Qt nor a display is needed, so that many figures can be exported on a server:
+
+    python batchExport.py project.rmn -f png pdf
+    python batchExport.py project.rmn -w "Plotwindow 1" "Plotwindow 3" -f svg -o figures --processes 4
+
+This module doesn't import Qt, neither in the main process nor in the workers.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent import futures
+
+import matplotlib
+
+
+def read_project(file_name):
+    """
+    all windows of a project file
+    @param file_name: project file (.rmn or old .jrmn format)
+    @return: list of (folder name, window name, window type, window content)
+    """
+    with open(file_name, "rb") as file:
+        project = json.load(file)
+
+    windows = []
+    if os.path.splitext(file_name)[1] == ".jrmn":
+        for folder_name, folder_content in project.items():
+            for window_name, (window_type, window_content) in folder_content.items():
+                windows.append((folder_name, window_name, window_type, window_content))
+    else:
+        for folder_name, folder_content in project.items():
+            for window_name, window_type, window_content in folder_content:
+                windows.append((folder_name, window_name, window_type, window_content))
+    return windows
+
+
+def plot_windows(windows, selection=None):
+    """
+    plot windows with saved figure settings
+    @param windows: list of windows as returned by read_project
+    @param selection: names of the plot windows, which should be exported, None for all plot windows
+    @return: list of (window name, window content)
+    """
+    plots = [(name, content) for _, name, window_type, content in windows
+             if window_type == "Plotwindow" and isinstance(content[1], dict)]
+    if selection is None:
+        return plots
+    names = [name for name, _ in plots]
+    for name in selection:
+        if name not in names:
+            print("There is no plot window called {}".format(name))
+    return [(name, content) for name, content in plots if name in selection]
+
+
+def file_base_name(window_name):
+    """window name without characters, which aren't allowed in file names"""
+    return re.sub(r'[\\/:*?"<>|]', "_", window_name).strip() or "Plotwindow"
+
+
+def init_worker():
+    """initializer of the worker processes: render with Agg, no GUI backend is loaded"""
+    matplotlib.use("Agg")
+
+
+def export_figure(window_name, window_content, file_names, dpi=None, size=None):
+    """
+    build the figure of a plot window and save it in all file names (the format is taken from the extension)
+    @param window_name: name of the plot window
+    @param window_content: [plot data, {"figure settings": ..., "annotations": ...}] as saved in the project
+    @param file_names: list of file names
+    @param dpi: resolution of raster formats, None for the resolution of the figure (vector formats with rasterized
+    lines use the dpi of the figure options)
+    @param size: (width, height) of the figure in inches, None for the size of new plot windows
+    @return: window name, file names and time needed in s
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import figureBuilder
+    import plotRendering
+
+    start = time.perf_counter()
+    plot_data, settings = window_content
+    fig = figureBuilder.create_figure(settings, plot_data)
+    FigureCanvasAgg(fig)
+    if size is not None:
+        fig.set_size_inches(size)
+    # long spectra are drawn decimated in raster formats and as rasterized lines, vector formats get all points
+    for d in plot_data:
+        plotRendering.enable_decimation(d["line"])
+    for file_name in file_names:
+        fig.savefig(file_name, dpi=plotRendering.export_dpi(fig, file_name, dpi))
+    return window_name, file_names, time.perf_counter() - start
+
+
+def export_projects(project_files, output_directory=None, formats=("png",), windows=None, processes=None, dpi=None,
+                    size=None):
+    """
+    export the plot windows of several projects with one pool of worker processes
+    @param project_files: list of project files
+    @param output_directory: directory of the figures, None for a directory next to every project file
+    (<project>_figures); if several projects are exported into one directory, every project gets a subdirectory
+    @param formats: list of file formats (png, pdf, svg, ...)
+    @param windows: names of the plot windows, which should be exported, None for all plot windows
+    @param processes: number of worker processes, default: number of CPUs; 0 exports in this process
+    @param dpi: resolution of raster formats
+    @param size: (width, height) of the figures in inches
+    @return: list of the exported files
+    """
+    tasks = []
+    for project_file in project_files:
+        if output_directory is None:
+            directory = os.path.splitext(project_file)[0] + "_figures"
+        elif len(project_files) > 1:
+            directory = os.path.join(output_directory, os.path.splitext(os.path.basename(project_file))[0])
+        else:
+            directory = output_directory
+        os.makedirs(directory, exist_ok=True)
+        for name, content in plot_windows(read_project(project_file), windows):
+            file_names = [os.path.join(directory, "{}.{}".format(file_base_name(name), f.lstrip("."))) for f in formats]
+            tasks.append((name, content, file_names))
+    if not tasks:
+        print("No plot windows to export")
+        return []
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(tasks))
+    start = time.perf_counter()
+    if processes < 1:
+        init_worker()
+        results = [(name, lambda task=(name, content, file_names): export_figure(*task, dpi, size))
+                   for name, content, file_names in tasks]
+        exported = collect_results(results)
+    else:
+        with futures.ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                         initializer=init_worker) as executor:
+            results = [(name, executor.submit(export_figure, name, content, file_names, dpi, size).result)
+                       for name, content, file_names in tasks]
+            exported = collect_results(results)
+    print("{} of {} figures exported in {:.1f} s".format(len(exported), len(tasks), time.perf_counter() - start))
+    return [file_name for _, file_names in exported for file_name in file_names]
+
+
+def collect_results(results):
+    """
+    export all figures or wait until the worker processes exported them, failed figures are reported and skipped
+    @param results: list of (window name, function returning the result of export_figure)
+    @return: list of (window name, file names) of the exported figures
+    """
+    exported = []
+    for name, result in results:
+        try:
+            window_name, file_names, duration = result()
+        except Exception as e:
+            print("Export of {} failed: {}".format(name, e))
+            continue
+        sizes = ["{} ({:.2f} MB)".format(f, os.path.getsize(f) / 1024 ** 2) for f in file_names]
+        print("{} ({:.2f} s): {}".format(window_name, duration, ", ".join(sizes)))
+        exported.append((window_name, file_names))
+    return exported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the plot windows of PyRamanGUI projects as figures")
+    parser.add_argument("project", nargs="+", help="project files (.rmn, .jrmn)")
+    parser.add_argument("-o", "--output", default=None, help="output directory, default: <project>_figures")
+    parser.add_argument("-f", "--formats", nargs="+", default=["png"], help="file formats, e.g. png pdf svg")
+    parser.add_argument("-w", "--windows", nargs="+", default=None, help="names of the plot windows, default: all")
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="number of worker processes, default: number of CPUs, 0: no worker processes")
+    parser.add_argument("--dpi", type=float, default=None, help="resolution of raster formats")
+    parser.add_argument("--size", type=float, nargs=2, default=None, metavar=("WIDTH", "HEIGHT"),
+                        help="figure size in inches, default: 15 9")
+    args = parser.parse_args()
+    matplotlib.use("Agg")
+    export_projects(args.project, args.output, args.formats, args.windows, args.processes, args.dpi, args.size)
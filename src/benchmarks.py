@@ -0,0 +1,272 @@
+"""
+Benchmarks for the analysis methods of PyRamanGUI
+
+usage: python benchmarks.py <benchmark> [<benchmark> ...]
+available benchmarks are listed with: python benchmarks.py --help
+
+Every single measurement runs in a fresh process, so that the peak resident set size (RSS) belongs to this measurement
+only. The peak RSS includes the memory of the imported modules, that's why the RSS after the imports is reported as
+well.
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+import prettytable
+
+
+def peak_rss_mb():
+    """peak resident set size of the current process in MB or None if it can't be determined"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, linux kilobytes
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+def _isolated_call(queue, function, args):
+    import analysisMethods  # noqa: F401, imported before the measurement
+    rss_imports = peak_rss_mb()
+    start = time.perf_counter()
+    result = function(*args)
+    runtime = time.perf_counter() - start
+    queue.put((runtime, rss_imports, peak_rss_mb(), result))
+
+
+def run_isolated(function, *args):
+    """
+    run function(*args) in a new process
+    @return: runtime in s, peak RSS after imports in MB, peak RSS in MB, return value of function
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_isolated_call, args=(queue, function, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def format_rss(rss_imports, rss_peak):
+    """peak RSS with its increase compared to the RSS after the imports"""
+    if rss_peak is None:
+        return "n/a"
+    return "{:.1f} (+{:.1f})".format(rss_peak, rss_peak - rss_imports)
+
+
+def synthetic_spectrum(n_points, seed=0):
+    """wide-range spectrum with curved background, 60 peaks and noise"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(100, 4000, n_points)
+    y = 5 + 3 * np.sin(x / 700) + 0.001 * x
+    for center in rng.uniform(100, 4000, 60):
+        y += rng.uniform(1, 20) * np.exp(-((x - center) / rng.uniform(2, 15)) ** 2)
+    y += rng.normal(0, 0.05, n_points)
+    return x, y
+
+
+def _baseline(n_points, method, chunked):
+    import analysisMethods
+    blc = analysisMethods.BaselineCorrectionMethods()
+    if not chunked:
+        blc.chunkable_methods = []
+    x, y = synthetic_spectrum(n_points)
+    params = blc.methods[method]["parameter"].values()
+    return blc.correct(x, y, method, *params)[1]
+
+
+def chunked_baseline(lengths=(10000, 50000, 100000, 200000, 500000, 1000000)):
+    """runtime, peak RSS and deviation of the chunked baseline correction compared to the full solve"""
+    import analysisMethods
+    blc = analysisMethods.BaselineCorrectionMethods()
+    table = prettytable.PrettyTable()
+    table.field_names = ["method", "points", "full / s", "full peak RSS / MB", "chunked / s",
+                         "chunked peak RSS / MB", "max deviation / %"]
+    for method in blc.chunkable_methods:
+        for n_points in lengths:
+            t_full, imports_full, rss_full, baseline_full = run_isolated(_baseline, n_points, method, False)
+            t_chunk, imports_chunk, rss_chunk, baseline_chunk = run_isolated(_baseline, n_points, method, True)
+            _, y = synthetic_spectrum(n_points)
+            deviation = 100 * np.max(np.abs(baseline_full - baseline_chunk)) / np.ptp(y)
+            table.add_row([method, n_points, round(t_full, 3), format_rss(imports_full, rss_full), round(t_chunk, 3),
+                           format_rss(imports_chunk, rss_chunk), "{:.4f}".format(deviation)])
+    print("Chunked baseline correction (chunk length {}, overlap {})".format(blc.chunk_length, blc.chunk_overlap))
+    print("peak RSS: total (increase after imports)")
+    print(table)
+
+
+def _resample_groups(n_spectra, n_points, n_groups=4):
+    """spectra with n_groups different x axes (e.g. measured with different gratings)"""
+    groups = []
+    for g in range(n_groups):
+        x, y = synthetic_spectrum(n_points, seed=g)
+        x = x + 7.3 * g
+        rng = np.random.default_rng(g)
+        y_stack = y * rng.uniform(0.5, 2, (n_spectra // n_groups, 1)) + rng.normal(0, 0.05, (n_spectra // n_groups,
+                                                                                             n_points))
+        groups.append((x, y_stack))
+    return groups
+
+
+def _resample_loop(n_spectra, n_points):
+    import rampy as rp
+    groups = _resample_groups(n_spectra, n_points)
+    x_new = np.arange(max(x[0] for x, y in groups), min(x[-1] for x, y in groups), 1.0)
+    return np.vstack([rp.resample(x, y, x_new) for x, y_stack in groups for y in y_stack]).shape
+
+
+def _resample_vectorized(n_spectra, n_points, method):
+    import analysisMethods
+    resampling = analysisMethods.ResamplingMethods()
+    x_new, y_new = resampling.resample(_resample_groups(n_spectra, n_points), 1.0, "Intersection", method)
+    return y_new.shape
+
+
+def resampling(n_spectra=1000, n_points=2000):
+    """runtime of the resampling of n_spectra onto a common grid, per column with rampy and vectorized"""
+    import analysisMethods
+    table = prettytable.PrettyTable()
+    table.field_names = ["method", "time / s", "peak RSS / MB", "result shape"]
+    runtime, rss_imports, rss_peak, shape = run_isolated(_resample_loop, n_spectra, n_points)
+    table.add_row(["rampy.resample per column", round(runtime, 3), format_rss(rss_imports, rss_peak), shape])
+    for method in analysisMethods.ResamplingMethods().methods:
+        runtime, rss_imports, rss_peak, shape = run_isolated(_resample_vectorized, n_spectra, n_points, method)
+        table.add_row([method, round(runtime, 3), format_rss(rss_imports, rss_peak), shape])
+    print("Resampling of {} spectra with {} points (4 different x axes) with step 1.0".format(n_spectra, n_points))
+    print("peak RSS: total (increase after imports)")
+    print(table)
+
+
+def _map_spectra(n_spectra, n_points, seed=0):
+    """spectra of a map: mixtures of 3 components with noise, one array per spectrum like spreadsheet columns"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, n_points)
+    components = np.stack([np.exp(-((x - c) / 0.03) ** 2) for c in (0.2, 0.5, 0.8)])
+    return [rng.random(3) @ components + rng.normal(0, 0.01, n_points) for _ in range(n_spectra)]
+
+
+def _decomposition_in_memory(n_spectra, n_points, n_components):
+    from sklearn import decomposition
+    columns = _map_spectra(n_spectra, n_points)
+    pca = decomposition.PCA(n_components=n_components)
+    pca.fit_transform(np.stack(columns, axis=0))
+    return np.round(np.sum(pca.explained_variance_ratio_[:3]), 6)
+
+
+def _decomposition_chunked(n_spectra, n_points, n_components, method):
+    import spectraDecomposition
+    result = spectraDecomposition.decompose(_map_spectra(n_spectra, n_points), method, n_components)
+    return np.round(np.sum(result.explained_variance_ratio[:3]), 6)
+
+
+def decomposition(n_spectra=20000, n_points=1000, n_components=10):
+    """runtime and peak RSS of PCA and NMF of a map, in memory and chunked from a memory-mapped stack"""
+    import spectraDecomposition
+    table = prettytable.PrettyTable()
+    table.field_names = ["method", "time / s", "peak RSS / MB", "explained by 3 components"]
+    runtime, rss_imports, rss_peak, explained = run_isolated(_decomposition_in_memory, n_spectra, n_points,
+                                                             n_components)
+    table.add_row(["sklearn PCA in memory", round(runtime, 3), format_rss(rss_imports, rss_peak), explained])
+    for method in spectraDecomposition.methods:
+        runtime, rss_imports, rss_peak, explained = run_isolated(_decomposition_chunked, n_spectra, n_points,
+                                                                 n_components, method)
+        table.add_row([method, round(runtime, 3), format_rss(rss_imports, rss_peak), explained])
+    print("Decomposition of {} spectra with {} points into {} components".format(n_spectra, n_points, n_components))
+    print("peak RSS: total (increase after imports), the spectra themselves need {} MB".format(
+        round(n_spectra * n_points * 8 / 1024 ** 2)))
+    print(table)
+
+
+def _draw_time(n_spectra, n_points, decimated, repeat=5):
+    """mean time of a redraw of a figure with n_spectra lines"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    import plotRendering
+    fig = Figure(figsize=(15, 9))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    for idx in range(n_spectra):
+        x, y = synthetic_spectrum(n_points, seed=idx)
+        line, = ax.plot(x, y)
+        if decimated:
+            plotRendering.enable_decimation(line)
+    fig.canvas.draw()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fig.canvas.draw()
+    return (time.perf_counter() - start) / repeat
+
+
+def plot_rendering(configurations=((1, 100000), (10, 100000), (50, 20000), (1, 1000000))):
+    """redraw time of a plot window with all points drawn and with min/max decimation"""
+    table = prettytable.PrettyTable()
+    table.field_names = ["spectra", "points", "full / s", "decimated / s", "speedup"]
+    for n_spectra, n_points in configurations:
+        full = _draw_time(n_spectra, n_points, False)
+        decimated = _draw_time(n_spectra, n_points, True)
+        table.add_row([n_spectra, n_points, round(full, 4), round(decimated, 4), round(full / decimated, 1)])
+    print(table)
+
+
+def _normalize_time(n_spectra, n_points, batched):
+    """time and number of renders of normalizing n_spectra lines, one redraw per spectrum or one batch"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    import plotRendering
+    fig = Figure(figsize=(15, 9))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    lines = []
+    for idx in range(n_spectra):
+        x, y = synthetic_spectrum(n_points, seed=idx)
+        line, = ax.plot(x, y)
+        lines.append(plotRendering.enable_decimation(line))
+    scheduler = plotRendering.RedrawScheduler(fig.canvas)
+    fig.canvas.draw()
+    renders = scheduler.renders
+    start = time.perf_counter()
+    if batched:
+        with scheduler.batch("Normalize"):
+            for line in lines:
+                line.set_ydata(line.get_ydata() / np.amax(line.get_ydata()))
+                scheduler.request()
+    else:
+        for line in lines:
+            line.set_ydata(line.get_ydata() / np.amax(line.get_ydata()))
+            fig.canvas.draw()
+    return time.perf_counter() - start, scheduler.renders - renders
+
+
+def redraw_scheduling(configurations=((10, 2000), (50, 2000), (50, 20000))):
+    """runtime and renders of an operation on many spectra, drawn after every spectrum and drawn once"""
+    table = prettytable.PrettyTable()
+    table.field_names = ["spectra", "points", "per spectrum / s", "renders", "batched / s", "renders (batched)"]
+    for n_spectra, n_points in configurations:
+        single, single_renders = _normalize_time(n_spectra, n_points, False)
+        batched, batched_renders = _normalize_time(n_spectra, n_points, True)
+        table.add_row([n_spectra, n_points, round(single, 3), single_renders, round(batched, 3), batched_renders])
+    print(table)
+
+
+benchmarks = {
+    "chunked_baseline": chunked_baseline,
+    "resampling": resampling,
+    "decomposition": decomposition,
+    "plot_rendering": plot_rendering,
+    "redraw_scheduling": redraw_scheduling,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for PyRamanGUI analysis methods")
+    parser.add_argument("benchmark", nargs="+", choices=list(benchmarks.keys()))
+    for name in parser.parse_args().benchmark:
+        benchmarks[name]()
@@ -0,0 +1,172 @@
+"""
+Fast export of numeric columns into text files
+
+np.savetxt formats every row with Python string formatting. Here the numbers are formatted with numpy: the values are
+rounded to integers with the requested number of decimals, the digits are written into a byte array and empty bytes
+are removed at the end. The file is written in chunks of rows, so that the memory stays small and the progress can be
+reported.
+
+Columns of different length are padded, missing values are written as missing_text (e.g. empty or nan).
+The result is the same as '%.{precision}f' formatting: value * 10**precision is rounded in float64, values which lie
+so close to half a unit of the last digit that this rounding could change the last digit are formatted with Python, as
+are blocks with scaled values above 2**53.
+"""
+import numpy as np
+from PyQt5 import QtCore
+
+# largest scaled value, which is formatted with numpy (above, the spacing of float64 values is larger than 1)
+_max_scaled = 2.0 ** 53
+
+# delimiter as shown in the export dialog -> delimiter in the file
+delimiters = {"Tab": "\t", "Space": " ", "Comma": ",", "Semicolon": ";"}
+
+
+def pad_columns(columns):
+    """
+    stack columns of different length into a 2D array, missing values are NaN
+    @param columns: list of 1D arrays
+    @return: 2D array (rows x columns)
+    """
+    n_rows = max([len(c) for c in columns], default=0)
+    table = np.full((n_rows, len(columns)), np.nan)
+    for idx, c in enumerate(columns):
+        table[:len(c), idx] = c
+    return table
+
+
+def format_block(block, precision=5, delimiter="\t", missing_text="nan"):
+    """
+    format a 2D block of numbers as text
+    @param block: 2D float array (rows x columns)
+    @param precision: number of decimals
+    @param delimiter: delimiter between the columns
+    @param missing_text: text for NaN
+    @return: bytes, every row ends with a newline
+    """
+    block = np.asarray(block, dtype=float)
+    if block.size == 0:
+        return b"\n" * len(block)
+    finite = np.isfinite(block)
+    scale = 10.0 ** precision
+    if np.any(np.isinf(block)) or np.nanmax(np.abs(block), initial=0) * scale >= _max_scaled:
+        # very large values and inf can't be formatted with int64, use Python formatting for this block
+        return format_block_python(block, precision, delimiter, missing_text)
+
+    magnitude = np.abs(np.where(finite, block, 0)) * scale
+    scaled = np.rint(magnitude).astype(np.int64)
+    # the relative error of magnitude is at most 2**-53, close to a half integer rint can round to the other side than
+    # the decimal rounding of the exact value, these values are rounded by Python formatting
+    doubtful = np.abs(magnitude - np.floor(magnitude) - 0.5) <= magnitude * 2.0 ** -52
+    for idx in zip(*np.nonzero(doubtful)):
+        scaled[idx] = int("{:.{}f}".format(abs(block[idx]), precision).replace(".", ""))
+    int_width = len(str(int(np.max(scaled)) // int(scale)))
+    dot = 1 if precision > 0 else 0
+    missing = missing_text.encode()
+    width = max(1 + int_width + dot + precision, len(missing)) + 1
+
+    # byte k of every field is stored in text[k], so that the digits can be written contiguously, the fields are
+    # right aligned and unused bytes are 0
+    text = np.zeros((width,) + block.shape, dtype=np.uint8)
+    text[-1] = ord(delimiter)
+    text[-1, :, -1] = ord("\n")
+
+    # the digits are computed from right to left with uint32 (much faster than int64), the lower 9 and the upper 9
+    # digits separately
+    parts = [(scaled % 10 ** 9).astype(np.uint32), (scaled // 10 ** 9).astype(np.uint32)]
+    int_length = np.ones(block.shape, dtype=np.int64)
+    position = width - 2
+    for k in range(precision + int_width):
+        if k == precision and dot:
+            text[position] = ord(".")
+            position -= 1
+        quotient = parts[k // 9] // 10
+        digit = (parts[k // 9] - quotient * 10).astype(np.uint8) + ord("0")
+        parts[k // 9] = quotient
+        if k <= precision:
+            # digits after the decimal point and the first digit before it
+            text[position] = digit
+        else:
+            # leading zeros are omitted
+            used = scaled >= 10 ** k
+            text[position] = np.where(used, digit, 0)
+            int_length += used
+        position -= 1
+    # sign
+    rows, cols = np.nonzero(np.signbit(block) & finite)
+    text[width - 2 - precision - dot - int_length[rows, cols], rows, cols] = ord("-")
+    # missing values
+    text[:-1, ~finite] = 0
+    if missing:
+        text[width - 1 - len(missing):-1, ~finite] = np.frombuffer(missing, dtype=np.uint8)[:, None]
+
+    text = text.transpose(1, 2, 0)
+    return text[text != 0].tobytes()
+
+
+def format_block_python(block, precision=5, delimiter="\t", missing_text="nan"):
+    """slow but general version of format_block"""
+    lines = []
+    for row in block:
+        fields = [missing_text if np.isnan(v) else "{:.{}f}".format(v, precision) for v in row]
+        lines.append(delimiter.join(fields))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def write_columns(file_name, columns, header=None, precision=5, delimiter="\t", missing_text="", comments="",
+                  chunk_size=500000, progress=None, cancelled=None):
+    """
+    write numeric columns into a text file
+    @param file_name: name of the file
+    @param columns: list of 1D arrays, the columns can have different lengths
+    @param header: list of header rows, every header row is a list of strings (one for every column)
+    @param precision: number of decimals
+    @param delimiter: delimiter between the columns
+    @param missing_text: text for missing values (NaN and padding of shorter columns)
+    @param comments: string in front of every header row, e.g. '# '
+    @param chunk_size: number of values formatted at once
+    @param progress: function called with the fraction of written rows
+    @param cancelled: function returning True, if the export should be stopped
+    @return: True if the file was written completely
+    """
+    table = pad_columns([np.asarray(c, dtype=float) for c in columns])
+    n_rows = len(table)
+    chunk_rows = max(chunk_size // max(table.shape[1], 1), 1)
+    with open(file_name, "wb") as f:
+        for header_row in header or []:
+            fields = ["" if h is None else str(h) for h in header_row]
+            f.write("{}{}\n".format(comments, delimiter.join(fields)).encode())
+        for start in range(0, n_rows, chunk_rows):
+            if cancelled is not None and cancelled():
+                return False
+            f.write(format_block(table[start:start + chunk_rows], precision, delimiter, missing_text))
+            if progress is not None:
+                progress(min(start + chunk_rows, n_rows) / n_rows)
+    return True
+
+
+class ExportThread(QtCore.QThread):
+    """runs write_columns in a background thread"""
+    progress = QtCore.pyqtSignal(int)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, file_name, columns, parent=None, **options):
+        """
+        @param file_name: name of the file
+        @param columns: list of 1D arrays
+        @param parent: QObject
+        @param options: keyword arguments of write_columns
+        """
+        super(ExportThread, self).__init__(parent)
+        self.file_name = file_name
+        # copy the data, so that it can be changed in the meantime
+        self.columns = [np.array(c, dtype=float) for c in columns]
+        self.options = options
+        self.completed = False
+
+    def run(self):
+        try:
+            self.completed = write_columns(self.file_name, self.columns,
+                                           progress=lambda fraction: self.progress.emit(int(100 * fraction)),
+                                           cancelled=self.isInterruptionRequested, **self.options)
+        except Exception as e:
+            self.failed.emit(str(e))
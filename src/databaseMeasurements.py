@@ -8,6 +8,37 @@ from PyQt5.QtWidgets import (QMainWindow, QVBoxLayout, QMessageBox, QLineEdit, Q
                              QTreeWidgetItem, QDockWidget, QListWidget, QLabel)
 from datetime import date
 
+import undoStack
+
+
+class DatabaseRows:
+    """
+    rows of the table stocks accessed by their ID, so that changes can be recorded by undoStack.Change:
+    rows[ID] is the tuple of the row or None if there is no row with this ID, setting rows[ID] inserts, replaces or
+    deletes the row
+    """
+
+    def __init__(self, path_of_database):
+        self.path_of_database = path_of_database
+
+    def __getitem__(self, row_id):
+        conn = sqlite3.connect(self.path_of_database)
+        c = conn.cursor()
+        c.execute('SELECT * FROM stocks WHERE ID = ?', (row_id,))
+        row = c.fetchone()
+        conn.close()
+        return row
+
+    def __setitem__(self, row_id, row):
+        conn = sqlite3.connect(self.path_of_database)
+        c = conn.cursor()
+        c.execute('DELETE FROM stocks WHERE ID = ?', (row_id,))
+        if row is not None:
+            c.execute(" INSERT INTO stocks (ID, Date, Sample, Material, Wavelength, Donor, Location) VALUES "
+                      "(?, ?, ?, ?, ?, ?, ?)", row)
+        conn.commit()
+        conn.close()
+
 
 class DatabaseMeasurements(QMainWindow):
     """ Creating the main window containing the list of all measurements """
@@ -27,6 +58,8 @@ class DatabaseMeasurements(QMainWindow):
         self.searchbar = None
         self.search_checklist = None
         self.ew = None
+        self.rows = DatabaseRows(self.path_of_database)
+        self.undo_stack = undoStack.UndoStack()
 
         self.setWindowTitle('Data base Raman measurements')
         self.entries()
@@ -73,6 +106,7 @@ class DatabaseMeasurements(QMainWindow):
         menubar.addAction('Edit Entry', self.open_entry_window)
         menubar.addAction('Delete Entry', self.delete_entry)
         menubar.addAction('Undo', self.undo)
+        menubar.addAction('Redo', self.redo)
 
     def create_searchbar(self):
         # create a searchbar
@@ -130,11 +164,10 @@ class DatabaseMeasurements(QMainWindow):
             id_new = 0
         else:
             id_new = max([j[0] for j in a]) + 1
-        c.execute(
-            " INSERT INTO stocks (ID, Date, Sample, Material, Wavelength, Donor, Location) VALUES "
-            "(?, ?, ?, ?, ?, ?, ?)", (id_new, ew.date, ew.sample, ew.material_class, ew.wavelength, ew.donor, ew.loc))
-        conn.commit()
         conn.close()
+        with self.undo_stack.record("New entry", self.entries) as change:
+            change.save(self.rows, id_new)
+            self.rows[id_new] = (id_new, ew.date, ew.sample, ew.material_class, ew.wavelength, ew.donor, ew.loc)
         self.entries()
 
     def change_entry(self):
@@ -148,10 +181,12 @@ class DatabaseMeasurements(QMainWindow):
         c = conn.cursor()
         sqlite_update_query = 'UPDATE stocks set Date=?, Sample=?, Material=?, Wavelength=?, Donor=?, Location=? ' \
                               ' where ID = ?'
-        for j in id_change:
-            column_values = (ew.date, ew.sample, ew.material_class, ew.wavelength, ew.donor, ew.loc, j)
-            c.execute(sqlite_update_query, column_values)
-        conn.commit()
+        with self.undo_stack.record("Edit entry", self.entries) as change:
+            for j in id_change:
+                change.save(self.rows, int(j))
+                column_values = (ew.date, ew.sample, ew.material_class, ew.wavelength, ew.donor, ew.loc, j)
+                c.execute(sqlite_update_query, column_values)
+            conn.commit()
         conn.close()
         self.ew.close()
         self.entries()
@@ -164,9 +199,11 @@ class DatabaseMeasurements(QMainWindow):
 
         conn = sqlite3.connect(self.path_of_database)
         c = conn.cursor()
-        for j in id_delete:
-            c.execute('DELETE FROM stocks WHERE ID = ?', (j,))
-        conn.commit()
+        with self.undo_stack.record("Delete entry", self.entries) as change:
+            for j in id_delete:
+                change.save(self.rows, int(j))
+                c.execute('DELETE FROM stocks WHERE ID = ?', (j,))
+            conn.commit()
         conn.close()
 
         self.entries()
@@ -212,10 +249,13 @@ class DatabaseMeasurements(QMainWindow):
                 j.setForeground(col, red)
 
     def undo(self):
-        # undo function
-        print("This function doesn't work yet!")
+        # undo the last new, changed or deleted entry
+        if self.undo_stack.undo() is None:
+            print("Nothing to undo")
 
-    # rollback()
+    def redo(self):
+        if self.undo_stack.redo() is None:
+            print("Nothing to redo")
 
     def closeEvent(self, event):
         reply = QMessageBox.question(self, 'Question', "Should the application be closed?",
@@ -0,0 +1,164 @@
+"""
+Creation of the figure of a plot window from the data and figure settings saved in a project
+
+This module doesn't depend on Qt, it is used to rebuild the plot windows when a project is loaded and to export the
+figures of a project without opening PyRamanGUI (batchExport).
+"""
+import math
+
+import matplotlib.colors as mcolors
+import matplotlib.patches as mpatches
+import numpy as np
+from matplotlib.figure import Figure
+
+import plotRendering
+from BrokenAxes import brokenaxes
+
+
+def create_figure(settings_dictionary, data):
+    """
+    create the figure of a plot window from the saved figure settings
+    @param settings_dictionary: dict with "figure settings" and "annotations" (see MainWindow.get_save_data_plotwindow)
+    @param data: list of data dicts of the plot window, the line of every data set is stored in d["line"]
+    @return: Figure
+    """
+    fig = Figure(figsize=(15, 9))
+    ax = fig.add_subplot(111)
+
+    figure_settings = settings_dictionary["figure settings"]
+
+    # Set general figure settings
+    general = figure_settings["general"]
+
+    ax.set_title(general["title"])
+    ax.title.set_fontsize(general["title font size"])
+
+    ax.set_xlabel(general["x label"])
+    ax.xaxis.labelpad = general["x label pad"]
+    ax.set_ylabel(general["y label"])
+    ax.yaxis.labelpad = general["y label pad"]
+    ax.xaxis.label.set_size(general["label font size"])
+    ax.yaxis.label.set_size(general["label font size"])
+
+    axis_option = figure_settings["axis options"]
+
+    if ax.get_xscale() != axis_option["x scale"]:
+        ax.set_xscale(axis_option["x scale"])
+    if ax.get_yscale() != axis_option["y scale"]:
+        ax.set_yscale(axis_option["y scale"])
+
+    if axis_option["x tick step size"] is not None:
+        x_tick = axis_option["x tick step size"]
+        xtick_space_start = math.ceil(axis_option["x lower limit"] / x_tick) * x_tick
+        ax.xaxis.set_ticks(np.arange(xtick_space_start, axis_option["x upper limit"], x_tick))
+        ax.xaxis.set_ticks(np.arange(xtick_space_start, axis_option["x upper limit"], x_tick))
+    else:
+        ax.xaxis.set_ticks([])
+    ax.set_xlim(axis_option["x lower limit"], axis_option["x upper limit"])
+    ax.xaxis.set_tick_params(labelsize=general["tick size"])
+
+    if axis_option["y tick step size"] is not None:
+        y_tick = axis_option["y tick step size"]
+        ytick_space_start = math.ceil(axis_option["y lower limit"] / y_tick) * y_tick
+        ax.yaxis.set_ticks(np.arange(ytick_space_start, axis_option["y upper limit"], y_tick))
+    else:
+        ax.yaxis.set_ticks([])
+    ax.set_ylim(axis_option["y lower limit"], axis_option["y upper limit"])
+    ax.yaxis.set_tick_params(labelsize=general["tick size"])
+
+    ax.grid(general["grid"])
+
+    # plot data in figure
+    for d in data:
+        if d["yerr"] is not None:  # errorbars
+            if d["plot type"] is None:
+                d["plot type"] = "o"
+            (spect, caplines, barlinecol) = ax.errorbar(d["x"], d["y"], yerr=d["yerr"], fmt=d["plot type"],
+                                                        picker=True, pickradius=5, capsize=3,
+                                                        label="_Hidden errorbar {}".format(d["label"]))
+            spect.set_label(d["label"])
+            if "line options" in d.keys():
+                if "error bar line width" in d["line options"].keys():
+                    dlo = d["line options"]
+                    for capline in caplines:
+                        capline.set_markersize(dlo["error bar cap size"])
+                        capline.set_markeredgewidth(dlo["error bar line width"])
+                        capline.set_markerfacecolor(dlo["error bar color"])
+                        capline.set_markeredgecolor(dlo["error bar color"])
+                    barlinecol[0].set_linewidth(dlo["error bar line width"])
+                    barlinecol[0].set_color(dlo["error bar color"])
+            else:
+                print("no line options")
+
+        else:
+            try:
+                spect, = ax.plot(d["x"], d["y"], d["plot type"], label=d["label"], picker=True, pickradius=5)
+            except ValueError as e:
+                print(e)
+                print(d["label"])
+                if d["plot type"] is None:
+                    d["plot type"] = "-"
+                    spect, = ax.plot(d["x"], d["y"], d["plot type"], label=d["label"], picker=True, pickradius=5)
+        if "line options" in d.keys():
+            line_options = d["line options"]
+            spect.set_linestyle(line_options["line style"])
+            spect.set_drawstyle(line_options["draw style"])
+            spect.set_linewidth(line_options["line width"])
+            rgba = mcolors.to_rgba(line_options["color"])
+            spect.set_alpha(None)
+            spect.set_color(rgba)
+            if line_options["marker style"] != "none":
+                spect.set_marker(line_options["marker style"])
+                spect.set_markersize(line_options["marker size"])
+                spect.set_markerfacecolor(line_options["marker face color"])
+                spect.set_markeredgecolor(line_options["marker edge color"])
+        else:
+            print("no line options in dict")
+        d["line"] = spect
+
+    if axis_option["axis break"]:
+        # the lines stay the same objects, they are moved into the first segment
+        brokenaxes(xlims=((axis_option["x lower limit"], axis_option["x upper limit"]),
+                          (axis_option["x lower limit 2"], axis_option["x upper limit 2"])), fig=fig)
+        # the main axis is cleared by brokenaxes
+        ax.set_title(general["title"])
+        ax.title.set_fontsize(general["title font size"])
+
+        handles, labels = fig.axes[1].get_legend_handles_labels()
+    else:
+        handles, labels = ax.get_legend_handles_labels()
+
+    # Set legend
+    legend = figure_settings["legend"]
+
+    new_legend = ax.legend(handles, labels,
+                           ncol=legend["columns"],
+                           fontsize=float(legend["font size"]),
+                           frameon=legend["frame"],
+                           shadow=legend["shadow"],
+                           framealpha=legend["alpha"],
+                           fancybox=legend["fancy box"])
+
+    new_legend.set_visible(legend["visible"])
+    new_legend.set_picker(legend["picker"])
+    new_legend.set_draggable(legend["draggable"])
+
+    # insert text and arrows
+    for a in settings_dictionary["annotations"]["arrows"]:
+        arrow = mpatches.FancyArrowPatch(a["posA"], a["posB"], mutation_scale=10, picker=50)
+        arrow.set_linewidth(a["line width"])
+        arrow.set_linestyle(a["line style"])
+        arrow.set_color(a["color"])
+        if a["style"] != '-':
+            arrow.set_arrowstyle(a["style"], head_length=a["head length"], head_width=a["head width"])
+        else:
+            arrow.set_arrowstyle(a["style"])
+        arrow.set_figure(fig)
+        ax.add_patch(arrow)
+    for t in settings_dictionary["annotations"]["text"]:
+        ax.annotate(t["text"], t["position"], picker=True, fontsize=t["font size"], color=t["color"])
+
+    # dense lines in vector figures (not in old projects)
+    if "rasterization" in figure_settings:
+        plotRendering.rasterize_dense_lines(fig, figure_settings["rasterization"])
+    return fig
@@ -0,0 +1,369 @@
+"""
+Formula engine for the formula columns of the spreadsheet (header field "F(x)=")
+
+A formula is parsed once into a Python AST, checked against a whitelist of allowed nodes and compiled into a code
+object. The compiled formulas are cached by their text, so a formula column is only parsed again if its formula is
+changed. The evaluation is vectorized, every column reference is a complete numpy array.
+
+Syntax:
+    columns:     Col(0), Col(1), ... (0-based index), Col("name") or the short name itself, e.g. A + B
+    operators:   + - * / ** ^ (^ is the same as **), unary + and -, parentheses
+    functions:   log, log10, exp, sqrt, abs, sin, cos, tan, interp(x, xp, fp), rolling_mean(y, window), cumsum
+    reductions:  mean, sum, min, max, std, median (NaN is ignored), the result is broadcast to the whole column
+    constants:   pi, e, nan, inf
+
+Columns of different length are padded with NaN to the length of the longest referenced column.
+
+DependencyGraph describes which formula columns use which columns. If columns are changed, only the formula columns
+depending on them are recomputed (recompute), in topological order, so that every formula sees up-to-date input.
+
+This module doesn't depend on Qt.
+"""
+import ast
+import functools
+
+import numpy as np
+
+
+class FormulaError(Exception):
+    """formula can't be parsed or evaluated"""
+
+
+def rolling_mean(y, window):
+    """
+    centered moving average, the window shrinks at the edges and NaN values are ignored
+    @param y: data
+    @param window: number of points of the window
+    @return: averaged data
+    """
+    window = int(window)
+    if window < 1:
+        raise FormulaError("The window of rolling_mean has to be at least 1.")
+    y = np.asarray(y, dtype=float)
+    if y.size == 0:
+        return y
+    finite = np.isfinite(y)
+    kernel = np.ones(window)
+    # mode "same" returns max(len(y), window) values, so the centered part of the full convolution is taken instead
+    center = slice((window - 1) // 2, (window - 1) // 2 + len(y))
+    sums = np.convolve(np.where(finite, y, 0.0), kernel, mode="full")[center]
+    counts = np.convolve(finite.astype(float), kernel, mode="full")[center]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+def interp(x, xp, fp):
+    """linear interpolation of (xp, fp) at x, xp doesn't have to be sorted"""
+    xp = np.asarray(xp, dtype=float)
+    fp = np.asarray(fp, dtype=float)
+    valid = np.isfinite(xp) & np.isfinite(fp)
+    order = np.argsort(xp[valid])
+    return np.interp(x, xp[valid][order], fp[valid][order], left=np.nan, right=np.nan)
+
+
+functions = {
+    "log": np.log,
+    "log10": np.log10,
+    "exp": np.exp,
+    "sqrt": np.sqrt,
+    "abs": np.abs,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "interp": interp,
+    "rolling_mean": rolling_mean,
+    "cumsum": np.nancumsum,
+}
+
+reductions = {
+    "mean": np.nanmean,
+    "sum": np.nansum,
+    "min": np.nanmin,
+    "max": np.nanmax,
+    "std": np.nanstd,
+    "median": np.nanmedian,
+}
+
+# number of arguments of the functions and reductions, checked when the formula is compiled (numpy ufuncs would take
+# a second argument as output array and overwrite it, the reductions as axis)
+arguments = dict.fromkeys(list(functions) + list(reductions), 1)
+arguments.update({"interp": 3, "rolling_mean": 2})
+
+constants = {
+    "pi": np.pi,
+    "e": np.e,
+    "nan": np.nan,
+    "inf": np.inf,
+}
+
+operators = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.BitXor, ast.UAdd, ast.USub)
+
+# name of the column lookup inside the compiled code
+_column = "_column"
+
+
+class _Compiler(ast.NodeTransformer):
+    """checks the AST and replaces every column reference by _column(reference)"""
+
+    def __init__(self):
+        self.references = []
+
+    def generic_visit(self, node):
+        if not isinstance(node, (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Call, ast.Name,
+                                 ast.Load) + operators):
+            raise FormulaError("'{}' is not allowed in formulas".format(type(node).__name__))
+        return super().generic_visit(node)
+
+    def visit_BinOp(self, node):
+        node = self.generic_visit(node)
+        if isinstance(node.op, ast.BitXor):
+            node.op = ast.Pow()
+        return node
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+            raise FormulaError("Only numbers are allowed as constants, not {!r}".format(node.value))
+        return node
+
+    def visit_Name(self, node):
+        if node.id in functions or node.id in reductions:
+            raise FormulaError("'{}' is a function, please use {}(...)".format(node.id, node.id))
+        if node.id in constants:
+            return node
+        return self.column_reference(node.id, node)
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise FormulaError("Invalid function call in formula")
+        name = node.func.id
+        if name == "Col":
+            if len(node.args) != 1 or not isinstance(node.args[0], ast.Constant) or \
+                    not isinstance(node.args[0].value, (int, str)) or isinstance(node.args[0].value, bool):
+                raise FormulaError("Col() needs the column index or the column name, e.g. Col(0) or Col(\"A\")")
+            return self.column_reference(node.args[0].value, node)
+        if name not in functions and name not in reductions:
+            raise FormulaError("Unknown function '{}'".format(name))
+        if len(node.args) != arguments[name]:
+            raise FormulaError("{}() needs {} argument{}, not {}".format(
+                name, arguments[name], "" if arguments[name] == 1 else "s", len(node.args)))
+        node.args = [self.visit(a) for a in node.args]
+        return node
+
+    def column_reference(self, reference, node):
+        self.references.append(reference)
+        call = ast.Call(func=ast.Name(id=_column, ctx=ast.Load()), args=[ast.Constant(value=reference)],
+                        keywords=[])
+        return ast.copy_location(call, node)
+
+
+class CompiledFormula:
+    """formula compiled into a code object together with the referenced columns"""
+
+    def __init__(self, text):
+        """
+        @param text: formula as typed in the spreadsheet
+        """
+        self.text = text
+        try:
+            tree = ast.parse(text.strip(), mode="eval")
+        except SyntaxError as e:
+            raise FormulaError("Invalid formula '{}': {}".format(text, e.msg))
+        compiler = _Compiler()
+        tree = ast.fix_missing_locations(compiler.visit(tree))
+        self.code = compile(tree, "<formula>", "eval")
+        # column references in the formula, index (int) or short name (str)
+        self.references = tuple(dict.fromkeys(compiler.references))
+
+    def referenced_columns(self, data):
+        """
+        @param data: spreadsheet data, list of dictionaries
+        @return: indices of the columns used by this formula
+        """
+        return list(dict.fromkeys(column_index(data, r) for r in self.references))
+
+    def evaluate(self, data):
+        """
+        evaluate the formula for the spreadsheet data
+        @param data: spreadsheet data, list of dictionaries
+        @return: 1D numpy array
+        """
+        columns = {}
+        for r in self.references:
+            columns[r] = np.asarray(data[column_index(data, r)]["data"], dtype=float)
+        if columns:
+            length = max(len(c) for c in columns.values())
+        else:
+            length = max([len(d["data"]) for d in data], default=0)
+        for r, c in columns.items():
+            if len(c) < length:
+                columns[r] = np.concatenate([c, np.full(length - len(c), np.nan)])
+
+        namespace = {"__builtins__": {}, _column: columns.__getitem__}
+        namespace.update(functions)
+        namespace.update(reductions)
+        namespace.update(constants)
+        try:
+            with np.errstate(all="ignore"):
+                result = eval(self.code, namespace)
+        except FormulaError:
+            raise
+        except Exception as e:
+            raise FormulaError("Formula '{}' could not be evaluated: {}".format(self.text, e))
+
+        result = np.asarray(result, dtype=float)
+        if result.ndim == 0:
+            return np.full(length, float(result))
+        if result.ndim != 1:
+            raise FormulaError("Formula '{}' doesn't result in a column".format(self.text))
+        return result
+
+
+def column_index(data, reference):
+    """
+    @param data: spreadsheet data, list of dictionaries
+    @param reference: index (int) or short name (str) of a column
+    @return: index of the column
+    """
+    if isinstance(reference, int):
+        if not 0 <= reference < len(data):
+            raise FormulaError("There is no column with index {}".format(reference))
+        return reference
+    for idx, d in enumerate(data):
+        if d["shortname"] == reference:
+            return idx
+    raise FormulaError("There is no column named '{}'".format(reference))
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_formula(text):
+    """
+    compiled formula, the result is cached for every formula text
+    @param text: formula as typed in the spreadsheet
+    @return: CompiledFormula
+    """
+    return CompiledFormula(text)
+
+
+def evaluate(text, data):
+    """
+    evaluate a formula for the spreadsheet data
+    @param text: formula as typed in the spreadsheet
+    @param data: spreadsheet data, list of dictionaries
+    @return: 1D numpy array
+    """
+    return compile_formula(text).evaluate(data)
+
+
+def remap_references(text, mapping):
+    """
+    change the column indices in a formula, e.g. if the columns are copied into another spreadsheet
+    @param text: formula
+    @param mapping: dictionary old column index -> new column index
+    @return: formula with the new column indices
+    """
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except SyntaxError as e:
+        raise FormulaError("Invalid formula '{}': {}".format(text, e.msg))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "Col" and \
+                len(node.args) == 1 and isinstance(node.args[0], ast.Constant) and \
+                isinstance(node.args[0].value, int):
+            if node.args[0].value not in mapping:
+                raise FormulaError("Column {} is not available".format(node.args[0].value))
+            node.args[0].value = mapping[node.args[0].value]
+    return ast.unparse(tree)
+
+
+class DependencyGraph:
+    """dependencies between the formula columns and the columns they use"""
+
+    def __init__(self, data):
+        """
+        @param data: spreadsheet data, list of dictionaries
+        """
+        # formula column -> columns used by the formula
+        self.references = {}
+        # formula column -> error message, if the formula is invalid
+        self.errors = {}
+        # column -> formula columns using it
+        self.dependents = {}
+        for idx, d in enumerate(data):
+            formula = d.get("formula")
+            if not formula:
+                continue
+            try:
+                self.references[idx] = compile_formula(formula).referenced_columns(data)
+            except FormulaError as e:
+                self.errors[idx] = str(e)
+                continue
+            for r in self.references[idx]:
+                self.dependents.setdefault(r, []).append(idx)
+
+    def affected(self, changed, include_changed=False):
+        """
+        @param changed: indices of the changed columns
+        @param include_changed: True if the changed columns have to be recomputed too (e.g. their formula changed)
+        @return: set of the formula columns, which have to be recomputed
+        """
+        affected = {c for c in changed if c in self.references} if include_changed else set()
+        stack = list(changed)
+        while stack:
+            for d in self.dependents.get(stack.pop(), []):
+                if d not in affected:
+                    affected.add(d)
+                    stack.append(d)
+        return affected
+
+    def recompute_order(self, changed, include_changed=False):
+        """
+        topological order of the formula columns depending on the changed columns
+        @param changed: indices of the changed columns
+        @param include_changed: True if the changed columns have to be recomputed too
+        @return: list of column indices
+        """
+        affected = self.affected(changed, include_changed)
+        # number of inputs of each column, which have to be recomputed first
+        waiting = {c: sum(r in affected for r in self.references[c]) for c in affected}
+        ready = sorted(c for c, n in waiting.items() if n == 0)
+        order = []
+        while ready:
+            c = ready.pop(0)
+            order.append(c)
+            for d in self.dependents.get(c, []):
+                if d in waiting:
+                    waiting[d] -= 1
+                    if waiting[d] == 0:
+                        ready.append(d)
+        if len(order) != len(affected):
+            cycle = sorted(affected.difference(order))
+            raise FormulaError("Circular reference between the formula columns {}".format(
+                ", ".join(str(c) for c in cycle)))
+        return order
+
+
+def recompute(data, changed, include_changed=False):
+    """
+    recompute all formula columns depending on the changed columns, data is changed in place
+    @param data: spreadsheet data, list of dictionaries
+    @param changed: indices of the changed columns
+    @param include_changed: True if the changed columns have to be recomputed too (e.g. their formula changed)
+    @return: indices of the recomputed columns, list of error messages
+    """
+    graph = DependencyGraph(data)
+    messages = [graph.errors[c] for c in changed if include_changed and c in graph.errors]
+    failed = set(graph.errors)
+    updated = []
+    for c in graph.recompute_order(changed, include_changed):
+        # columns depending on a failed formula keep their data
+        if failed.intersection(graph.references[c]):
+            failed.add(c)
+            continue
+        try:
+            data[c]["data"] = compile_formula(data[c]["formula"]).evaluate(data)
+        except FormulaError as e:
+            messages.append(str(e))
+            failed.add(c)
+            continue
+        updated.append(c)
+    return updated, messages
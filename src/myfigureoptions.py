@@ -14,6 +14,7 @@ import re
 import numpy as np
 import math
 from BrokenAxes import brokenaxes
+import plotRendering
 
 import matplotlib
 from matplotlib import cm, colors as mcolors, markers, image as mimage
@@ -175,6 +176,13 @@ def figure_edit(axes, parent=None):
               ('Picker', _picker)
               ]
 
+    rasterization = plotRendering.rasterization_settings(ax.get_figure())
+    export = [(None, "<b>Vector graphics (pdf, svg, eps)</b>"),
+              ('Rasterize dense lines', rasterization["rasterize"]),
+              ('Point threshold', int(rasterization["point threshold"])),
+              ('DPI', int(rasterization["dpi"]))
+              ]
+
     # Save the unit data
     xconverter = ax.xaxis.converter
     yconverter = ax.yaxis.converter
@@ -319,7 +327,7 @@ def figure_edit(axes, parent=None):
         fills.append([fill_data, label, ""])
     has_fills = bool(fills)
 
-    datalist = [(general, "General", ""), (axis_options, "Axis", ""), (legend, "Legend", "")]
+    datalist = [(general, "General", ""), (axis_options, "Axis", ""), (legend, "Legend", ""), (export, "Export", "")]
     if curves:
         datalist.append((curves, "Curves", ""))
     if errorbars:
@@ -335,6 +343,7 @@ def figure_edit(axes, parent=None):
         general = data.pop(0)
         axis_options = data.pop(0)
         legend = data.pop(0)
+        export = data.pop(0)
         curves = data.pop(0) if has_curve else []
         errorbars = data.pop(0) if has_errorbar else []
         fills = data.pop(0) if has_fills else []
@@ -429,31 +438,28 @@ def figure_edit(axes, parent=None):
         if figure_edit.axis_is_broken is False:
             if xbreak is True and ybreak is True:
                 if xbreak_start < xbreak_end and ybreak_start < ybreak_end:
-                    baxes = brokenaxes(xlims=((xlim_left, xbreak_start), (xbreak_end, xlim_right)),
-                                       ylims=((ylim_left, ybreak_start), (ybreak_end, ylim_right)),
-                                       hspace=.05, fig=figure)
+                    brokenaxes(xlims=((xlim_left, xbreak_start), (xbreak_end, xlim_right)),
+                               ylims=((ylim_left, ybreak_start), (ybreak_end, ylim_right)),
+                               hspace=.05, fig=figure)
                     figure_edit.axis_is_broken = True
-                    parent.signal_axis_break.emit(baxes.old_lines, baxes.new_lines)
             elif xbreak is True:
                 if xbreak_start < xbreak_end:
-                    baxes = brokenaxes(xlims=((xlim_left, xbreak_start), (xbreak_end, xlim_right)), fig=figure)
+                    brokenaxes(xlims=((xlim_left, xbreak_start), (xbreak_end, xlim_right)), fig=figure)
                     figure_edit.axis_is_broken = True
-                    parent.signal_axis_break.emit(baxes.old_lines, baxes.new_lines)
                 else:
                     print("The first limit has to be smaller than the second one.")
             elif ybreak is True:
                 if ybreak_start < ybreak_end:
-                    baxes = brokenaxes(ylims=((ylim_left, ybreak_start), (ybreak_end, ylim_right)),
-                                       hspace=.05, fig=figure)
+                    brokenaxes(ylims=((ylim_left, ybreak_start), (ybreak_end, ylim_right)),
+                               hspace=.05, fig=figure)
                     figure_edit.axis_is_broken = True
-                    parent.signal_axis_break.emit(baxes.old_lines, baxes.new_lines)
 
         # Set / Legend
         (leg_visible, leg_draggable, leg_ncol, leg_fontsize, leg_frameon, leg_shadow,
          leg_fancybox, leg_framealpha, leg_picker) = legend
 
         if figure_edit.axis_is_broken:
-            handles, labels = figure.axes[2].get_legend_handles_labels()
+            handles, labels = figure.axes[1].get_legend_handles_labels()
         else:
             handles, labels = ax.get_legend_handles_labels()
         new_legend = ax.legend(handles, labels,
@@ -530,6 +536,11 @@ def figure_edit(axes, parent=None):
                 except ValueError as e:
                     print(e)
 
+        # Set / Export
+        (rasterize, point_threshold, dpi) = export
+        plotRendering.rasterize_dense_lines(figure, {"rasterize": rasterize, "point threshold": point_threshold,
+                                                     "dpi": dpi})
+
         # Redraw
         figure.canvas.draw()
 
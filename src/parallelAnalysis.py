@@ -0,0 +1,543 @@
+"""
+Execution layer to run the analysis methods (baseline correction, smoothing, peak fitting) for stacks of spectra in
+worker processes.
+
+The spectra and the results are stored in shared memory segments (multiprocessing.shared_memory). The workers only get
+the name, shape and dtype of a segment, attach to it and write their results in place, so no large array is pickled.
+All segments belong to an owner (e.g. a window); SharedMemoryRegistry releases them when the owner is closed or the
+job is cancelled.
+
+AnalysisWorkerPool is the long-lived pool of worker processes, which is shared by all analysis operations of PyRamanGUI.
+
+This module itself doesn't import Qt, so that the parent side can be used without a GUI (e.g. in scripts). The method
+classes executed by the workers are defined in analysisMethods and peakFitting, which import PyQt5 at module level for
+their dialogs, so every worker imports PyQt5 once when it loads them (no QApplication is created).
+"""
+import multiprocessing
+import os
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArray:
+    """numpy array stored in a shared memory segment"""
+
+    def __init__(self, shape, dtype=np.float64, name=None):
+        """
+        @param shape: shape of the array
+        @param dtype: dtype of the array
+        @param name: name of an existing segment to attach to, a new segment is created if name is None
+        """
+        self.shape = tuple(int(s) for s in shape)
+        self.dtype = np.dtype(dtype)
+        # only the process, which created the segment, removes it
+        self.created = name is None
+        n_bytes = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        if self.created:
+            self.shm = shared_memory.SharedMemory(create=True, size=n_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @classmethod
+    def from_array(cls, array):
+        """create a new segment containing a copy of array"""
+        array = np.asarray(array)
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, descriptor):
+        """attach to an existing segment described by (name, shape, dtype)"""
+        name, shape, dtype = descriptor
+        return cls(shape, dtype, name=name)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    def descriptor(self):
+        """everything a worker needs to attach to this segment"""
+        return self.shm.name, self.shape, self.dtype.str
+
+    def close(self):
+        """close the access of this process to the segment"""
+        if self.array is None:
+            return
+        # the numpy view has to be deleted before the buffer can be closed
+        self.array = None
+        self.shm.close()
+
+    def release(self):
+        """close the segment and remove it, if it was created by this process"""
+        self.close()
+        if self.created:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+            self.created = False
+
+
+class SharedMemoryRegistry:
+    """
+    keeps track of shared memory segments and running jobs per owner (e.g. a PlotWindow), so that they can be released
+    when the owner is closed
+    """
+
+    def __init__(self):
+        # key = owner, value = list of objects with a release() method (SharedArray, StackJob)
+        self.items = {}
+
+    def add(self, owner, item):
+        self.items.setdefault(owner, []).append(item)
+        return item
+
+    def create(self, owner, shape, dtype=np.float64):
+        """create an empty shared array belonging to owner"""
+        return self.add(owner, SharedArray(shape, dtype))
+
+    def share(self, owner, array):
+        """copy array into a new shared array belonging to owner"""
+        return self.add(owner, SharedArray.from_array(array))
+
+    def discard(self, owner, item):
+        """release a single item of owner"""
+        item.release()
+        try:
+            self.items[owner].remove(item)
+        except (KeyError, ValueError):
+            return
+        if not self.items[owner]:
+            del self.items[owner]
+
+    def release(self, owner):
+        """release everything belonging to owner: running jobs are cancelled, segments are removed"""
+        for item in self.items.pop(owner, []):
+            item.release()
+
+    def release_all(self):
+        for owner in list(self.items.keys()):
+            self.release(owner)
+
+    def nbytes(self, owner=None):
+        """size of all shared segments (of owner) in bytes, including the segments of jobs"""
+        owners = self.items.keys() if owner is None else [owner]
+        return sum(i.nbytes for o in owners for i in self.items.get(o, []))
+
+
+########################################################################################################################
+# worker side
+########################################################################################################################
+
+# instances of the method classes, created once per worker process
+_method_instances = {}
+
+# thread limits of the BLAS/OpenMP libraries of a worker, kept alive for the lifetime of the worker
+_thread_limits = None
+
+
+def init_worker(blas_threads):
+    """
+    initializer of the worker processes: limit the BLAS threads and import the numeric modules once, so that the
+    first job doesn't pay for the imports
+    """
+    global _thread_limits
+    try:
+        import threadpoolctl
+    except ImportError:
+        pass
+    else:
+        _thread_limits = threadpoolctl.threadpool_limits(limits=blas_threads)
+
+    import scipy.optimize  # noqa: F401
+    import scipy.signal  # noqa: F401
+    import scipy.sparse.linalg  # noqa: F401
+    import pybaselines  # noqa: F401
+    import rampy  # noqa: F401
+    try:
+        import sklearn.decomposition  # noqa: F401
+    except ImportError:
+        pass
+    for kind in ["baseline", "smoothing", "fit"]:
+        method_instance(kind)
+
+
+def ping():
+    """used by the health check of AnalysisWorkerPool"""
+    return os.getpid()
+
+
+def load_text_file(file_name, delimiter=None, skip_header=0, names=None, comments=None):
+    """read a text file with numpy.genfromtxt (used by the data import in the worker processes)"""
+    kwargs = {"delimiter": delimiter, "skip_header": skip_header, "names": names, "dtype": float}
+    if comments is not None and comments != "":
+        kwargs["comments"] = comments
+    return np.genfromtxt(file_name, **kwargs)
+
+
+def method_instance(kind):
+    """instance of the class containing the analysis methods of kind 'baseline', 'smoothing' or 'fit'"""
+    if kind not in _method_instances:
+        if kind == "baseline":
+            import analysisMethods
+            _method_instances[kind] = analysisMethods.BaselineCorrectionMethods()
+        elif kind == "smoothing":
+            import analysisMethods
+            _method_instances[kind] = analysisMethods.SmoothingMethods()
+        elif kind == "fit":
+            import peakFitting
+            _method_instances[kind] = peakFitting.FitFunctions()
+        else:
+            raise ValueError("Unknown kind of analysis: {}".format(kind))
+    return _method_instances[kind]
+
+
+def run_task(task):
+    """
+    process the rows task["rows"] of a shared stack of spectra, executed in a worker process
+    @param task: dict with keys kind, method, params, x, y, out (descriptors of shared arrays) and rows (start, stop)
+    @return: dict with the processed rows, the rows which failed and the error message (None if the block didn't
+    raise an exception)
+    """
+    x = SharedArray.attach(task["x"])
+    y = SharedArray.attach(task["y"])
+    out = [SharedArray.attach(d) for d in task["out"]]
+    start, stop = task["rows"]
+    failed = []
+    error = None
+    try:
+        if task["kind"] == "baseline":
+            blc = method_instance("baseline")
+            result = blc.correct_stack(x.array, y.array[start:stop], task["method"], *task["params"])
+            if result is None:
+                failed = list(range(start, stop))
+                out[0].array[start:stop] = np.nan
+                out[1].array[start:stop] = np.nan
+            else:
+                out[0].array[start:stop], out[1].array[start:stop] = result
+        elif task["kind"] == "smoothing":
+            sm = method_instance("smoothing")
+            result = sm.smooth_stack(x.array, y.array[start:stop], task["method"], *task["params"])
+            if result is None:
+                failed = list(range(start, stop))
+                out[0].array[start:stop] = np.nan
+            else:
+                out[0].array[start:stop] = result
+        elif task["kind"] == "fit":
+            failed = _fit_rows(x.array, y.array, out, start, stop, task["params"])
+        else:
+            raise ValueError("Unknown kind of analysis: {}".format(task["kind"]))
+    except Exception as e:
+        # e.g. unknown method or fit function, all rows of the block failed
+        failed = list(range(start, stop))
+        for o in out:
+            o.array[start:stop] = np.nan
+        error = "{}: {}".format(type(e).__name__, e)
+    finally:
+        for shared in [x, y] + out:
+            shared.close()
+    return {"rows": (start, stop), "failed": failed, "error": error}
+
+
+def _fit_rows(x, y, out, start, stop, params):
+    """
+    peak fit of the rows start to stop, params contains n_fit_fct, p0 and bounds,
+    p0 is either one list of start parameters for all spectra or one list per spectrum
+    """
+    from scipy.optimize import curve_fit
+
+    ff = method_instance("fit")
+    ff.n_fit_fct = dict.fromkeys(ff.n_fit_fct, 0)
+    ff.n_fit_fct.update(params["n_fit_fct"])
+    p_start = np.asarray(params["p0"], dtype=float)
+    bounds = params.get("bounds", (-np.inf, np.inf))
+    failed = []
+    for row in range(start, stop):
+        valid = np.isfinite(y[row])
+        p0 = p_start[row] if p_start.ndim == 2 else p_start
+        try:
+            popt, pcov = curve_fit(ff.FctSumme, x[valid], y[row][valid], p0=p0, bounds=bounds)
+        except (RuntimeError, ValueError):
+            out[0].array[row] = np.nan
+            out[1].array[row] = np.nan
+            failed.append(row)
+            continue
+        out[0].array[row] = popt
+        out[1].array[row] = np.sqrt(np.diag(pcov))
+    return failed
+
+
+########################################################################################################################
+# parent side
+########################################################################################################################
+
+def group_by_x(spectra, x_data=None):
+    """
+    group spectra with identical x data, so that each group can be treated as one stack
+    @param spectra: list of spectra, e.g. matplotlib lines
+    @param x_data: function returning the x data of a spectrum, default: spectrum.get_xdata()
+    @return: list of dicts with keys "x" and "spectra"
+    """
+    if x_data is None:
+        x_data = lambda spct: spct.get_xdata()
+    groups = []
+    for spct in spectra:
+        x = np.asarray(x_data(spct), dtype=float)
+        for group in groups:
+            if group["x"].shape == x.shape and np.array_equal(group["x"], x):
+                group["spectra"].append(spct)
+                break
+        else:
+            groups.append({"x": x, "spectra": [spct]})
+    return groups
+
+
+class StackJob:
+    """
+    analysis of a stack of spectra with the same x axis, the stack is split into blocks of rows, which are processed
+    by the workers of an executor (or in this process if executor is None)
+
+    outputs per kind of analysis:
+        baseline: corrected spectra, baselines (both n x m)
+        smoothing: smoothed spectra (n x m)
+        fit: fit parameters, errors of the fit parameters (both n x number of parameters)
+    """
+
+    def __init__(self, registry, owner, kind, method, params, x, y_stack, executor=None, n_blocks=None):
+        """
+        @param registry: SharedMemoryRegistry
+        @param owner: owner of the job, e.g. the window which started it
+        @param kind: 'baseline', 'smoothing' or 'fit'
+        @param method: name of the method (key of the methods dict of the method class), ignored for 'fit'
+        @param params: list of parameters of the method, for 'fit' a dict with n_fit_fct, p0 (one list of start
+        parameters or one per spectrum) and bounds
+        @param x: x data, shape (m,)
+        @param y_stack: y data, shape (n, m)
+        @param executor: concurrent.futures executor, e.g. of AnalysisWorkerPool
+        @param n_blocks: number of blocks the stack is split into
+        """
+        self.registry = registry
+        self.owner = owner
+        self.kind = kind
+        self.segments = []
+        self.futures = []
+        self.failed = []
+        self.errors = []
+        self.cancelled = False
+
+        y_stack = np.atleast_2d(np.asarray(y_stack, dtype=np.float64))
+        n_rows = y_stack.shape[0]
+
+        self.x = self.new_segment(np.asarray(x, dtype=np.float64))
+        self.y = self.new_segment(y_stack)
+        if kind == "fit":
+            out_shape = (n_rows, np.shape(params["p0"])[-1])
+            n_out = 2
+        elif kind == "baseline":
+            out_shape = y_stack.shape
+            n_out = 2
+        else:
+            out_shape = y_stack.shape
+            n_out = 1
+        self.out = [self.new_segment(shape=out_shape) for _ in range(n_out)]
+        registry.add(owner, self)
+
+        if n_blocks is None:
+            n_blocks = 4 * (os.cpu_count() or 1)
+        bounds = np.linspace(0, n_rows, min(max(int(n_blocks), 1), max(n_rows, 1)) + 1).astype(int)
+        tasks = [{"kind": kind, "method": method, "params": params, "x": self.x.descriptor(),
+                  "y": self.y.descriptor(), "out": [o.descriptor() for o in self.out], "rows": (int(a), int(b))}
+                 for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+        for task in tasks:
+            if executor is None:
+                future = futures.Future()
+                future.set_result(run_task(task))
+            else:
+                future = executor.submit(run_task, task)
+            self.futures.append(future)
+
+    def new_segment(self, array=None, shape=None):
+        if array is not None:
+            segment = SharedArray.from_array(array)
+        else:
+            segment = SharedArray(shape)
+            segment.array[...] = np.nan
+        self.segments.append(segment)
+        return segment
+
+    def done(self):
+        return all(f.done() for f in self.futures)
+
+    def progress(self):
+        """fraction of finished blocks"""
+        if not self.futures:
+            return 1.0
+        return sum(f.done() for f in self.futures) / len(self.futures)
+
+    def add_done_callback(self, function):
+        """function(job) is called once all blocks are finished (in the thread which finished the last block)"""
+        remaining = [len(self.futures)]
+
+        def block_done(_future):
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                function(self)
+
+        if not self.futures:
+            function(self)
+        for f in self.futures:
+            f.add_done_callback(block_done)
+
+    def result(self, timeout=None):
+        """
+        wait for all blocks, copy the results out of shared memory and release the segments
+        @return: list of output arrays (see class docstring), None if the job was cancelled
+        """
+        if self.cancelled:
+            return None
+        try:
+            for f in self.futures:
+                block = f.result(timeout=timeout)
+                self.failed.extend(block["failed"])
+                if block["error"] is not None:
+                    self.errors.append(block["error"])
+            results = [np.array(o.array) for o in self.out]
+        except futures.CancelledError:
+            results = None
+        if self.cancelled:
+            # released while waiting
+            results = None
+        self.registry.discard(self.owner, self)
+        return results
+
+    def cancel(self):
+        """cancel blocks which haven't started yet and release the shared memory"""
+        self.registry.discard(self.owner, self)
+
+    @property
+    def nbytes(self):
+        return sum(s.nbytes for s in self.segments)
+
+    def release(self):
+        self.cancelled = True
+        for f in self.futures:
+            f.cancel()
+        for s in self.segments:
+            s.release()
+        self.segments = []
+
+
+class AnalysisWorkerPool:
+    """
+    long-lived pool of worker processes shared by all analysis operations (baseline correction, smoothing, fitting,
+    data import). The workers are started once, import the numeric modules in advance and use a limited number of
+    BLAS threads each, so that n_workers * blas_threads doesn't oversubscribe the CPU.
+    A crashed worker breaks the whole pool, in this case the pool is restarted.
+    """
+    # environment variables read by the BLAS/OpenMP libraries when they are loaded
+    blas_variables = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS",
+                      "NUMEXPR_NUM_THREADS"]
+
+    def __init__(self, n_workers=None, blas_threads=1, min_stack_size=8):
+        """
+        @param n_workers: number of worker processes, default: number of CPUs - 1; 0 disables the pool
+        @param blas_threads: number of BLAS threads per worker
+        @param min_stack_size: smaller stacks of spectra are processed in the main process
+        """
+        if n_workers is None:
+            n_workers = max(1, (os.cpu_count() or 2) - 1)
+        self.n_workers = int(n_workers)
+        self.blas_threads = int(blas_threads)
+        self.min_stack_size = min_stack_size
+        self.executor = None
+        self.restarts = 0
+
+    def start(self):
+        """start the worker processes (if they aren't running yet)"""
+        if self.executor is not None or self.n_workers < 1:
+            return
+        # the workers are spawned during the first submit and inherit the environment at this moment
+        saved_environment = {var: os.environ.get(var) for var in self.blas_variables}
+        os.environ.update({var: str(self.blas_threads) for var in self.blas_variables})
+        try:
+            self.executor = futures.ProcessPoolExecutor(
+                max_workers=self.n_workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker, initargs=(self.blas_threads,))
+            for _ in range(self.n_workers):
+                self.executor.submit(ping)
+        finally:
+            for var, value in saved_environment.items():
+                if value is None:
+                    os.environ.pop(var, None)
+                else:
+                    os.environ[var] = value
+
+    @property
+    def running(self):
+        return self.executor is not None
+
+    def use_for(self, n_spectra):
+        """True if a stack of n_spectra spectra should be processed by the pool"""
+        return self.n_workers > 0 and n_spectra >= self.min_stack_size
+
+    def submit(self, function, *args, **kwargs):
+        """submit a job to the pool, the pool is (re)started if necessary"""
+        if self.n_workers < 1:
+            future = futures.Future()
+            future.set_result(function(*args, **kwargs))
+            return future
+        self.start()
+        try:
+            return self.executor.submit(function, *args, **kwargs)
+        except BrokenProcessPool:
+            self.restart()
+            return self.executor.submit(function, *args, **kwargs)
+
+    def health_check(self, timeout=30):
+        """
+        check that all workers respond, a broken or unresponsive pool is restarted
+        @return: True if the pool was healthy
+        """
+        if self.n_workers < 1:
+            return True
+        self.start()
+        try:
+            pings = [self.executor.submit(ping) for _ in range(self.n_workers)]
+            for p in pings:
+                p.result(timeout=timeout)
+        except (BrokenProcessPool, futures.TimeoutError):
+            self.restart()
+            return False
+        return True
+
+    def restart(self):
+        self.shutdown()
+        self.restarts += 1
+        self.start()
+
+    def resize(self, n_workers):
+        """change the number of workers, jobs already submitted are finished by the old workers"""
+        n_workers = max(0, int(n_workers))
+        if n_workers == self.n_workers:
+            return
+        self.n_workers = n_workers
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+            self.start()
+
+    def shutdown(self):
+        if self.executor is None:
+            return
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
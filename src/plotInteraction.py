@@ -0,0 +1,189 @@
+"""
+Fast redraws for the interactive tools of plot windows (moving spectra, lines, arrows, texts and data points)
+
+A complete redraw of a figure renders all spectra, the legend and all annotations again, although only one artist
+changes while the mouse is moved. BlitManager draws the figure once without the moved artists (they are 'animated'),
+keeps this image as background and afterwards only copies the background back and draws the animated artists on top
+of it (blitting). Every complete draw of the figure (e.g. after resizing the window) stores a new background.
+
+PickIndex finds the point of a line with the nearest x value in O(log n) with searchsorted (the x values of data,
+which isn't monotonic, are sorted once). picking_index keeps one index per line and builds it again only if the x data
+of the line changed. picked_point selects the point next to the mouse among the points of a pick event, measured in
+screen pixels.
+"""
+import weakref
+
+import numpy as np
+
+_managers = weakref.WeakKeyDictionary()
+_indices = weakref.WeakKeyDictionary()
+
+
+class BlitManager:
+    """redraws the animated artists of a canvas on top of a stored background"""
+
+    def __init__(self, canvas):
+        """
+        @param canvas: FigureCanvas
+        """
+        self.canvas = canvas
+        self.artists = []
+        self.background = None
+        self.cid_draw = self.canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        """a complete draw happened, the figure is drawn without animated artists, so it is the new background"""
+        if not self.artists:
+            self.background = None
+            return
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        figure = self.canvas.figure
+        for artist in self.artists:
+            if artist.figure is figure:
+                figure.draw_artist(artist)
+
+    @staticmethod
+    def with_shared_lines(artists):
+        """the artists and the lines drawing their data in other axes (segments of broken axes)"""
+        result = []
+        for artist in artists:
+            result.append(artist)
+            result.extend(getattr(artist, "shared_lines", []))
+        return result
+
+    def start(self, *artists):
+        """
+        the artists are moved from now on, the figure is drawn once without them to get the background
+        @param artists: matplotlib artists
+        """
+        new_artists = [a for a in self.with_shared_lines(artists) if a is not None and a not in self.artists]
+        if not new_artists:
+            return
+        for artist in new_artists:
+            artist.set_animated(True)
+            self.artists.append(artist)
+        self.canvas.draw()
+
+    def update(self):
+        """draw the current state of the animated artists"""
+        if not self.artists:
+            self.canvas.draw_idle()
+            return
+        if not self.canvas.supports_blit or self.background is None or not self.background_fits():
+            # first draw or the size of the canvas changed
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+    def background_fits(self):
+        """False if the canvas was resized since the background was stored"""
+        width, height = self.canvas.get_width_height(physical=True)
+        return self.background.get_extents()[2:] == (width, height)
+
+    def stop(self, *artists):
+        """
+        the artists aren't moved anymore, they are drawn like all other artists again
+        @param artists: matplotlib artists, all animated artists if no artist is given
+        """
+        artists = self.with_shared_lines(artists) or list(self.artists)
+        for artist in artists:
+            if artist in self.artists:
+                self.artists.remove(artist)
+                artist.set_animated(False)
+        if not self.artists:
+            self.background = None
+        self.canvas.draw_idle()
+
+
+def blit_manager(canvas):
+    """
+    BlitManager of a canvas, all tools of a plot window share the same one
+    @param canvas: FigureCanvas
+    @return: BlitManager
+    """
+    manager = _managers.get(canvas)
+    if manager is None:
+        manager = _managers[canvas] = BlitManager(canvas)
+    return manager
+
+
+class PickIndex:
+    """search of the nearest x value in the data of a line"""
+
+    def __init__(self, x):
+        """
+        @param x: 1D array of x values
+        """
+        self.x = np.asarray(x, dtype=float)
+        dx = np.diff(self.x)
+        # sort key (increasing) and the indices of the sorted values, order is None if x is monotonic
+        if np.all(dx >= 0):
+            self.order, self.key, self.sign = None, self.x, 1
+        elif np.all(dx <= 0):
+            self.order, self.key, self.sign = None, -self.x, -1
+        else:
+            self.order = np.argsort(self.x, kind="stable")
+            self.key, self.sign = self.x[self.order], 1
+
+    def sorted_position(self, x):
+        """
+        position of x within the sorted x values (insertion index)
+        """
+        return int(np.searchsorted(self.key, self.sign * x))
+
+    def nearest_x(self, x):
+        """
+        @param x: x value
+        @return: index of the point with the nearest x value
+        """
+        position = self.sorted_position(x)
+        candidates = [p for p in (position - 1, position) if 0 <= p < len(self.key)]
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda p: abs(self.key[p] - self.sign * x))
+        return best if self.order is None else int(self.order[best])
+
+
+def picking_index(line):
+    """
+    PickIndex of a line, it is built again, if the x data of the line changed (set_data or set_xdata)
+    @param line: Line2D
+    @return: PickIndex
+    """
+    x = line.get_xdata(orig=True)
+    cached = _indices.get(line)
+    if cached is None or cached[0] is not x:
+        _indices[line] = (x, PickIndex(line.get_xdata()))
+    return _indices[line][1]
+
+
+def picked_point(event):
+    """
+    point of a picked line next to the mouse in screen pixels
+    @param event: pick event of a Line2D
+    @return: index of the point or None
+    """
+    line = event.artist
+    x, y = np.asarray(line.get_xdata(), dtype=float), np.asarray(line.get_ydata(), dtype=float)
+    # event.ind contains the points within the pick radius and the first point of picked segments
+    candidates = np.unique(np.concatenate([event.ind, np.asarray(event.ind) + 1]))
+    candidates = candidates[candidates < len(x)]
+    if not len(candidates):
+        return None
+    transform = line.get_transform()
+    mouse_axes = event.mouseevent.inaxes
+    if mouse_axes is not None and line.axes is not None and mouse_axes is not line.axes and \
+            transform is line.axes.transData:
+        # picked in another segment of a broken axis (plotRendering.SharedLine)
+        transform = mouse_axes.transData
+    points = transform.transform(np.column_stack((x[candidates], y[candidates])))
+    distances = np.hypot(points[:, 0] - event.mouseevent.x, points[:, 1] - event.mouseevent.y)
+    distances[np.isnan(distances)] = np.inf
+    if not np.isfinite(distances).any():
+        return None
+    return int(candidates[np.argmin(distances)])
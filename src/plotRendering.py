@@ -0,0 +1,531 @@
+"""
+Rendering of long spectra in plot windows
+
+A line with 100k points drawn into a plot window of 1500 pixels width puts about 70 points into every pixel column.
+Drawing all of them is slow, but the result is only a vertical stroke per pixel column from the smallest to the largest
+value, connected with its neighbours. DecimatedLine2D therefore draws for every pixel column only the first, the
+smallest, the largest and the last point (min/max decimation, also called M4). The line covers the same pixels with at
+most four points per pixel column, only the antialiased edges of very dense pixel columns are a little lighter.
+
+The smallest and largest values of blocks of 2, 4, 8, ... points are precomputed once (DecimationPyramid), so that the
+decimation for a new x range (zoom, pan, resize) only needs a few thousand blocks of the matching size instead of all
+points.
+
+The line keeps its complete data: get_xdata/get_ydata, picking, fitting, saving and export use all points. Only lines
+drawn by an Agg renderer (screen, png) are decimated, vector formats (pdf, svg, eps) get all points.
+
+SpectrumCollection draws a stack of spectra (e.g. all spectra of a map) as a single LineCollection. The colors of the
+spectra are taken from a colormap (shown with a colorbar instead of a legend) and the spectra can be shifted against
+each other (waterfall plot).
+
+Lines with many points make vector figures (pdf, svg, eps) large and slow to open, because every point becomes a vertex
+of a path. rasterize_dense_lines rasterizes these lines (option of the figure options), axes, texts and annotations stay
+vector graphics.
+
+SharedLine draws the data of a line in another axes, e.g. in the segments of a broken axis. The data isn't copied and
+only the part in the x range of the segment is drawn, so every segment costs about as much as the visible part of the
+line. The line object itself stays the same, picking and moving it works in all segments.
+
+RedrawScheduler coalesces the redraws of a plot window: operations only mark the canvas as changed and the figure is
+drawn once, when the event loop is idle again (draw_idle). Operations on many spectra suspend drawing completely until
+they are finished and the number of renders every operation caused is counted.
+"""
+import os
+from contextlib import contextmanager
+
+import numpy as np
+from matplotlib.artist import Artist, allow_rasterization
+from matplotlib.backend_bases import PickEvent
+from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+
+# lines with less points are always drawn completely
+min_points = 2000
+# a block of the pyramid is at most points_per_pixel / block_ratio points long
+block_ratio = 4
+# rasterization of dense lines in vector figures, the settings of a figure are saved in the figure settings
+rasterization_defaults = {"rasterize": False, "point threshold": 10000, "dpi": 300}
+vector_formats = ("pdf", "svg", "svgz", "eps", "ps")
+
+
+class DecimationPyramid:
+    """indices of the smallest and largest value in blocks of 2**level points"""
+
+    def __init__(self, y, min_blocks=64):
+        """
+        @param y: 1D array without NaN
+        @param min_blocks: no levels with less blocks are built
+        """
+        self.y = y
+        self.n = len(y)
+        # levels[k] contains the index arrays (argmin, argmax) for blocks of 2**(k+1) points, the block j consists of
+        # the points j * 2**(k+1) to (j+1) * 2**(k+1) - 1, the last block can be shorter
+        self.levels = []
+        imin = imax = np.arange(self.n)
+        while len(imin) >= 2 * min_blocks:
+            n_pairs = len(imin) // 2
+            a, b = imin[0:2 * n_pairs:2], imin[1:2 * n_pairs:2]
+            new_min = np.where(y[b] < y[a], b, a)
+            a, b = imax[0:2 * n_pairs:2], imax[1:2 * n_pairs:2]
+            new_max = np.where(y[b] > y[a], b, a)
+            if len(imin) % 2:
+                new_min = np.append(new_min, imin[-1])
+                new_max = np.append(new_max, imax[-1])
+            imin, imax = new_min, new_max
+            self.levels.append((imin, imax))
+
+    @property
+    def nbytes(self):
+        return sum(imin.nbytes + imax.nbytes for imin, imax in self.levels)
+
+    def decimate(self, i0, i1, pixel_x, x):
+        """
+        indices of the points drawn for the range i0 to i1 (inclusive)
+        @param i0: first index
+        @param i1: last index
+        @param pixel_x: function converting x values into pixel positions
+        @param x: 1D array of x values, monotonic
+        @return: sorted index array, or slice if all points of the range have to be drawn
+        """
+        n_visible = i1 - i0 + 1
+        columns = abs(np.diff(pixel_x(x[[i0, i1]]))[0]) + 1
+        level = int(np.floor(np.log2(max(n_visible / (block_ratio * columns), 1))))
+        level = min(level, len(self.levels))
+        if level == 0:
+            return slice(i0, i1 + 1)
+
+        imin, imax = self.levels[level - 1]
+        size = 2 ** level
+        blocks = np.arange(i0 // size, i1 // size + 1)
+        starts = blocks * size
+        ends = np.minimum(starts + size, self.n) - 1
+        imin, imax = imin[blocks], imax[blocks]
+
+        # blocks in the same pixel column, the pixel positions are monotonic like x
+        column = np.floor(pixel_x(x[starts]))
+        new_column = np.flatnonzero(np.diff(column)) + 1
+        first = np.concatenate(([0], new_column))
+        last = np.concatenate((new_column, [len(blocks)])) - 1
+        group = np.zeros(len(blocks), dtype=np.intp)
+        group[new_column] = 1
+        group = np.cumsum(group)
+
+        # sorted by pixel column and value, the smallest value of every column comes first, the largest last
+        by_min = np.lexsort((self.y[imin], group))
+        by_max = np.lexsort((self.y[imax], group))
+        indices = np.stack((starts[first], imin[by_min[first]], imax[by_max[last]], ends[last]), axis=1)
+        indices = np.sort(indices, axis=1).ravel()
+        return indices[np.concatenate(([True], np.diff(indices) != 0))]
+
+
+class DecimatedLine2D(Line2D):
+    """
+    Line2D, which is drawn with min/max decimation on the screen
+
+    Lines created with Axes.plot are converted with enable_decimation. The pyramid and the decimated indices for the
+    last view are cached, they are computed again if the data, the x limits or the size of the axes change.
+    """
+    _lod_keys = ("_lod_data", "_lod_pyramid", "_lod_view", "_lod_indices", "_lod_proxy")
+
+    def __getstate__(self):
+        # the cache is not saved (e.g. copies of plot windows), it is computed again when the line is drawn
+        state = super(DecimatedLine2D, self).__getstate__()
+        for key in self._lod_keys:
+            state.pop(key, None)
+        return state
+
+    def decimation_possible(self):
+        """markers, steps and missing lines are drawn completely"""
+        return (self.get_marker() in (None, "None", "", " ") and self.get_drawstyle() == "default"
+                and self.get_linestyle() not in ("None", "", " ") and self.axes is not None)
+
+    def get_pyramid(self):
+        """
+        pyramid of the current data
+        @return: DecimationPyramid and the sort key of x (x for increasing, -x for decreasing values) or None if the
+        data can't be decimated (too short, NaN, x not monotonic)
+        """
+        x, y = self._x, self._y
+        data = getattr(self, "_lod_data", None)
+        if data is not None and data[0] is x and data[1] is y:
+            return self._lod_pyramid
+        self._lod_data = (x, y)
+        self._lod_pyramid = None
+        self._lod_view = None
+        if len(x) < min_points or not (np.all(np.isfinite(x)) and np.all(np.isfinite(y))):
+            return None
+        dx = np.diff(x)
+        if np.all(dx >= 0):
+            key = x
+        elif np.all(dx <= 0):
+            key = -x
+        else:
+            return None
+        self._lod_pyramid = DecimationPyramid(y), key
+        return self._lod_pyramid
+
+    def get_decimated_indices(self):
+        """
+        indices of the points drawn for the current view
+        @return: index array or slice, or None if the line is drawn completely
+        """
+        if self._invalidx or self._invalidy:
+            self.recache()
+        pyramid = self.get_pyramid()
+        if pyramid is None:
+            return None
+        pyramid, key = pyramid
+        transform = self.get_transform()
+
+        def pixel_x(values):
+            points = np.column_stack((values, np.ones_like(values)))
+            return transform.transform(points)[:, 0]
+
+        i0, i1 = visible_range(key, key is not self._x, self.axes.get_xlim())
+        view = (i0, i1, tuple(pixel_x(self._x[[i0, i1]])))
+        if view != getattr(self, "_lod_view", None):
+            self._lod_view = view
+            self._lod_indices = pyramid.decimate(i0, i1, pixel_x, self._x)
+        return self._lod_indices
+
+    def get_visible_slice(self):
+        """
+        points in the x range of the axes (vector formats)
+        @return: slice or None if the line is drawn completely
+        """
+        if self._invalidx or self._invalidy:
+            self.recache()
+        pyramid = self.get_pyramid()
+        if pyramid is None:
+            return None
+        key = pyramid[1]
+        i0, i1 = visible_range(key, key is not self._x, self.axes.get_xlim())
+        if i0 == 0 and i1 == len(key) - 1:
+            return None
+        return slice(i0, i1 + 1)
+
+    @allow_rasterization
+    def draw(self, renderer):
+        if not (self.get_visible() and self.decimation_possible()):
+            return super(DecimatedLine2D, self).draw(renderer)
+        # rasterized lines of vector figures are drawn by an Agg renderer too
+        if isinstance(renderer, RendererAgg) or (
+                isinstance(getattr(renderer, "_raster_renderer", None), RendererAgg) and self.get_rasterized()):
+            indices = self.get_decimated_indices()
+        else:
+            indices = self.get_visible_slice()
+        if indices is None:
+            return super(DecimatedLine2D, self).draw(renderer)
+
+        # the decimated points are drawn by a line with the same properties, which doesn't belong to the axes
+        proxy = getattr(self, "_lod_proxy", None)
+        if proxy is None:
+            proxy = self._lod_proxy = Line2D([], [])
+        proxy.update_from(self)
+        proxy.set_gid(self.get_gid())
+        proxy.set_rasterized(self.get_rasterized())
+        proxy.set_agg_filter(self.get_agg_filter())
+        proxy.set_data(self._x[indices], self._y[indices])
+        proxy.draw(renderer)
+        self.stale = False
+
+
+def visible_range(key, decreasing, xlim):
+    """
+    indices of the first and last point in the x range with one point more on both sides, so that the line leaves the
+    axes correctly
+    @param key: increasing sort key of x (x or -x)
+    @param decreasing: True if the key is -x
+    @param xlim: x limits of the axes
+    @return: first and last index
+    """
+    x_lower, x_upper = sorted(xlim)
+    if decreasing:
+        x_lower, x_upper = -x_upper, -x_lower
+    i0 = max(int(np.searchsorted(key, x_lower, side="left")) - 1, 0)
+    i1 = min(int(np.searchsorted(key, x_upper, side="right")), len(key) - 1)
+    return i0, i1
+
+
+def enable_decimation(line):
+    """
+    draw a line created by Axes.plot with min/max decimation, the line object (and its data) stays the same, so that
+    all references to it stay valid
+    @param line: Line2D
+    @return: the line
+    """
+    if type(line) is Line2D:
+        line.__class__ = DecimatedLine2D
+    return line
+
+
+class SharedLine(Artist):
+    """
+    draws the data of a line of another axes in this axes (segments of a broken axis) with the style of this line
+
+    Only the points in the x range of the axes are drawn (if x is monotonic). Clicking on the shared line fires a pick
+    event for the original line and the shared line is moved together with the original line (BlitManager).
+    """
+
+    def __init__(self, ax, source):
+        """
+        @param ax: Axes, in which the line is drawn
+        @param source: Line2D, which contains the data
+        """
+        super(SharedLine, self).__init__()
+        self.source = source
+        self.proxy = enable_decimation(Line2D([], []))
+        self.proxy.axes = ax
+        self.proxy.set_figure(ax.get_figure())
+        self._proxy_view = None
+        self._order = None
+        ax.add_artist(self)
+        self.set_zorder(source.get_zorder())
+        if not hasattr(source, "shared_lines"):
+            source.shared_lines = []
+        source.shared_lines.append(self)
+
+    def monotonic_key(self, x):
+        """sort key of x (x or -x) and if it is decreasing, None if x isn't monotonic"""
+        if self._order is None or self._order[0] is not x:
+            key = None
+            if np.all(np.isfinite(x)):
+                dx = np.diff(x)
+                if np.all(dx >= 0):
+                    key = (x, False)
+                elif np.all(dx <= 0):
+                    key = (-x, True)
+            self._order = (x, key)
+        return self._order[1]
+
+    def update_proxy(self):
+        """
+        the style is taken from the source, the data in the x range of this axes
+        @return: index of the first point of the proxy in the data of the source
+        """
+        source, proxy = self.source, self.proxy
+        # update_from copies the transform and the clipping of the source, they are replaced by the ones of this axes
+        proxy.update_from(source)
+        proxy.set_transform(self.get_transform())
+        proxy.set_clip_path(self.axes.patch)
+        proxy.set_rasterized(source.get_rasterized())
+
+        x = np.asarray(source.get_xdata(), dtype=float)
+        key = self.monotonic_key(x)
+        if key is None:
+            i0, i1 = 0, len(x) - 1
+        else:
+            i0, i1 = visible_range(key[0], key[1], self.axes.get_xlim())
+        # the visible part is only copied again, if the data of the source or the x range changed
+        x_orig, y_orig = source.get_xdata(orig=True), source.get_ydata(orig=True)
+        view = self._proxy_view
+        if view is None or view[0] is not x_orig or view[1] is not y_orig or view[2:] != (i0, i1):
+            self._proxy_view = (x_orig, y_orig, i0, i1)
+            proxy.set_data(x[i0:i1 + 1], source.get_ydata()[i0:i1 + 1])
+        return i0
+
+    def removed(self):
+        """True if the source was removed from its axes"""
+        return self.source.axes is None or self.source.get_figure() is None
+
+    @allow_rasterization
+    def draw(self, renderer):
+        if not self.get_visible() or self.removed():
+            return
+        self.update_proxy()
+        self.proxy.draw(renderer)
+        self.stale = False
+
+    def pick(self, mouseevent):
+        """a click on the shared line is a click on the source"""
+        source = self.source
+        if self.removed() or not source.pickable():
+            return
+        start = self.update_proxy()
+        self.proxy.set_picker(source.get_picker())
+        self.proxy.set_pickradius(source.get_pickradius())
+        inside, prop = self.proxy.contains(mouseevent)
+        if inside:
+            prop["ind"] = np.asarray(prop["ind"]) + start
+            PickEvent("pick_event", self.get_figure().canvas, mouseevent, source, **prop)._process()
+
+
+def rasterization_settings(fig):
+    """
+    @param fig: Figure
+    @return: dict with "rasterize", "point threshold" and "dpi"
+    """
+    settings = dict(rasterization_defaults)
+    settings.update(getattr(fig, "rasterization", {}))
+    return settings
+
+
+def rasterize_dense_lines(fig, settings=None):
+    """
+    rasterize all lines with more points than the threshold in vector figures, if rasterization is switched on. Lines
+    added afterwards are only rasterized if this function is called again, so it is called before every export.
+    @param fig: Figure
+    @param settings: new settings (dict with "rasterize", "point threshold", "dpi"), which are stored in the figure,
+    None to apply the stored settings
+    @return: number of rasterized lines
+    """
+    if settings is not None:
+        fig.rasterization = dict(rasterization_settings(fig), **settings)
+    settings = rasterization_settings(fig)
+    n_rasterized = 0
+    for ax in fig.axes:
+        for line in ax.get_lines():
+            dense = settings["rasterize"] and len(line.get_xdata(orig=True)) > settings["point threshold"]
+            line.set_rasterized(dense)
+            n_rasterized += dense
+    return n_rasterized
+
+
+def export_dpi(fig, file_name, dpi=None):
+    """
+    resolution for savefig: vector figures with rasterized lines use the dpi of the rasterization settings
+    @param fig: Figure
+    @param file_name: file name, the format is taken from the extension
+    @param dpi: resolution of raster formats, None for the resolution of the figure
+    @return: dpi for savefig
+    """
+    settings = rasterization_settings(fig)
+    if settings["rasterize"] and os.path.splitext(file_name)[1].lstrip(".").lower() in vector_formats:
+        return settings["dpi"]
+    return dpi if dpi is not None else "figure"
+
+
+class SpectrumCollection:
+    """stack of spectra drawn as one LineCollection"""
+
+    def __init__(self, ax, spectra, values=None, colormap="viridis", offset=0.0, linewidth=1.0):
+        """
+        @param ax: Axes
+        @param spectra: list of (x, y) tuples, the spectra can have different lengths
+        @param values: one value per spectrum, which is mapped to the colormap, None for the index of the spectra
+        @param colormap: name of the colormap
+        @param offset: spectrum i is shifted by i * offset in y direction
+        @param linewidth: line width
+        """
+        self.ax = ax
+        self.spectra = [(np.asarray(x, dtype=float), np.asarray(y, dtype=float)) for x, y in spectra]
+        self.offset = offset
+        self.collection = LineCollection(self.segments(), cmap=colormap, linewidths=linewidth, picker=True,
+                                         pickradius=5)
+        self.set_values(values)
+        self.ax.add_collection(self.collection)
+        self.update_limits()
+
+    def __len__(self):
+        return len(self.spectra)
+
+    def segments(self):
+        return [np.column_stack((x, y + idx * self.offset)) for idx, (x, y) in enumerate(self.spectra)]
+
+    def update_limits(self):
+        """data limits of the axes, add_collection doesn't take the offset into account"""
+        # the data of the spectra is used, LineCollection.get_segments rebuilds all paths point by point
+        x_min, x_max, y_min, y_max = np.inf, -np.inf, np.inf, -np.inf
+        for idx in range(len(self.spectra)):
+            x, y = self.displayed_spectrum(idx)
+            finite = np.isfinite(x) & np.isfinite(y)
+            if np.any(finite):
+                x_min, x_max = min(x_min, x[finite].min()), max(x_max, x[finite].max())
+                y_min, y_max = min(y_min, y[finite].min()), max(y_max, y[finite].max())
+        if np.isfinite(x_min):
+            self.ax.ignore_existing_data_limits = True
+            self.ax.update_datalim([(x_min, y_min), (x_max, y_max)])
+            self.ax.autoscale_view()
+
+    def set_offset(self, offset):
+        self.offset = offset
+        self.collection.set_segments(self.segments())
+        self.update_limits()
+
+    def set_values(self, values):
+        """
+        @param values: one value per spectrum or None for the index of the spectra
+        """
+        if values is None:
+            values = np.arange(len(self.spectra))
+        self.collection.set_array(np.asarray(values, dtype=float))
+        self.collection.set_norm(None)
+        self.collection.autoscale()
+
+    def set_colormap(self, colormap):
+        self.collection.set_cmap(colormap)
+
+    def set_linewidth(self, linewidth):
+        self.collection.set_linewidth(linewidth)
+
+    def picked_index(self, event):
+        """
+        @param event: pick event
+        @return: index of the picked spectrum (the one nearest to the mouse, if several spectra were picked) or None
+        """
+        if event.artist is not self.collection or not len(event.ind):
+            return None
+        mouse = np.array([event.mouseevent.x, event.mouseevent.y])
+        transform = self.collection.get_transform()
+        distances = []
+        for idx in event.ind:
+            points = transform.transform(np.column_stack(self.displayed_spectrum(idx)))
+            distances.append(np.nanmin(np.hypot(*(points - mouse).T)))
+        return int(event.ind[int(np.argmin(distances))])
+
+    def displayed_spectrum(self, idx):
+        """x and y of spectrum idx as drawn (with offset)"""
+        x, y = self.spectra[idx]
+        return x, y + idx * self.offset
+
+
+class RedrawScheduler:
+    """draws a canvas at most once per event loop iteration"""
+
+    def __init__(self, canvas):
+        """
+        @param canvas: FigureCanvas
+        """
+        self.canvas = canvas
+        self.dirty = False
+        self.renders = 0  # renders of the canvas since the scheduler was created
+        self.operation_renders = {}  # renders caused by the last call of every operation
+        self.operations = []  # running operations, drawing is suspended while an operation is running
+        self.pending = set()  # finished operations, whose redraw wasn't rendered yet
+        self.cid_draw = self.canvas.mpl_connect("draw_event", self.on_draw)
+
+    @property
+    def suspended(self):
+        return bool(self.operations)
+
+    def request(self):
+        """the figure changed, it is drawn when the event loop is idle or when the running operations are finished"""
+        self.dirty = True
+        if not self.operations:
+            self.canvas.draw_idle()
+
+    def on_draw(self, event):
+        self.renders += 1
+        self.dirty = False
+        for name in self.pending.union(self.operations):
+            self.operation_renders[name] = self.operation_renders.get(name, 0) + 1
+        self.pending.clear()
+
+    @contextmanager
+    def batch(self, name):
+        """
+        suspend drawing while the operation is running, the figure is drawn once afterwards
+        (with plot_window.redraw_scheduler.batch("Normalize"): ...)
+        @param name: name of the operation, used for operation_renders
+        """
+        self.operation_renders[name] = 0
+        self.operations.append(name)
+        try:
+            yield self
+        finally:
+            self.operations.remove(name)
+            if self.dirty:
+                self.pending.add(name)
+                if not self.operations:
+                    self.canvas.draw_idle()
@@ -0,0 +1,387 @@
+"""
+Decomposition (PCA, NMF) of large stacks of spectra without loading the whole stack into memory
+
+The spectra are written one after another into a temporary file (SpectrumStack) and the models are fitted chunk by
+chunk, so that neither a dense copy of all spectra nor the copies made by the solvers are needed:
+- PCA (incremental): sklearn IncrementalPCA, partial_fit with every chunk
+- PCA (randomized SVD): randomized range finder with power iterations, every product with the stack is computed chunk
+  by chunk, so only a few passes over the file are needed and no centered copy of the stack is made
+- NMF (mini-batch): sklearn MiniBatchNMF, partial_fit with every chunk for some epochs
+
+Every spectrum is a sample, the loadings (components) have the length of the spectra and the scores contain one value
+per spectrum and component. The explained variance of every component is returned, so that the number of components
+can be chosen after the fit. Fitted models are cached by ModelCache.
+"""
+import os
+import tempfile
+
+import numpy as np
+from PyQt5 import QtCore
+from sklearn import decomposition
+
+# memory of one chunk of spectra in bytes
+chunk_memory = 16 * 1024 ** 2
+
+
+class SpectrumStack:
+    """
+    stack of spectra (n_spectra x n_points) stored in a temporary file
+
+    The chunks are read from the file, so only the current chunk is in the memory of the process. The whole stack
+    can be accessed as memory-mapped array (array).
+    """
+
+    def __init__(self, n_spectra, n_points, directory=None):
+        """
+        @param n_spectra: number of spectra
+        @param n_points: number of points of every spectrum
+        @param directory: directory of the temporary file, default is the temp directory of the system
+        """
+        handle, self.file_name = tempfile.mkstemp(suffix=".dat", prefix="PyRamanGUI_stack_", dir=directory)
+        os.close(handle)
+        self.shape = (n_spectra, n_points)
+        self.memmap = None
+
+    @classmethod
+    def from_columns(cls, columns, directory=None):
+        """
+        write spectra into a new stack one after another, so that no dense copy is needed
+        @param columns: list of 1D arrays with the same length
+        @param directory: directory of the temporary file
+        """
+        stack = cls(len(columns), len(columns[0]), directory)
+        with open(stack.file_name, "wb") as f:
+            for c in columns:
+                f.write(np.ascontiguousarray(c, dtype=np.float64).tobytes())
+        return stack
+
+    @property
+    def array(self):
+        """whole stack as read-only memory-mapped array"""
+        if self.memmap is None:
+            self.memmap = np.memmap(self.file_name, dtype=np.float64, mode="r", shape=self.shape)
+        return self.memmap
+
+    def chunk_size(self, minimum=1):
+        """@return: number of spectra per chunk, at least minimum"""
+        return max(chunk_memory // (8 * max(self.shape[1], 1)), minimum, 1)
+
+    def chunks(self, minimum=1):
+        """
+        iterate over the stack in chunks of spectra, every chunk contains at least minimum spectra (if the stack has
+        enough spectra), so the last chunk can be larger
+        @return: iterator over (start index, 2D array)
+        """
+        n_spectra, n_points = self.shape
+        size = self.chunk_size(minimum)
+        start = 0
+        with open(self.file_name, "rb") as f:
+            while start < n_spectra:
+                stop = start + size
+                if n_spectra - stop < minimum:
+                    stop = n_spectra
+                chunk = np.fromfile(f, dtype=np.float64, count=(stop - start) * n_points)
+                yield start, chunk.reshape(stop - start, n_points)
+                start = stop
+
+    def close(self):
+        """remove the temporary file"""
+        if self.memmap is not None:
+            self.memmap._mmap.close()
+            self.memmap = None
+        try:
+            os.remove(self.file_name)
+        except OSError as e:
+            print(e)
+
+
+class DecompositionResult:
+    """fitted model: loadings, scores and explained variance of every component"""
+
+    def __init__(self, method, components, scores, explained_variance_ratio, message=None):
+        """
+        @param method: name of the method
+        @param components: loadings, shape (n_components, n_points)
+        @param scores: shape (n_spectra, n_components)
+        @param explained_variance_ratio: fraction of the variance explained by every component
+        @param message: note about the fit, e.g. if negative values were set to zero for NMF
+        """
+        self.method = method
+        self.components = components
+        self.scores = scores
+        self.explained_variance_ratio = explained_variance_ratio
+        self.message = message
+
+    @property
+    def n_components(self):
+        return len(self.components)
+
+    def truncate(self, n_components):
+        """@return: result with only the first n_components components"""
+        return DecompositionResult(self.method, self.components[:n_components], self.scores[:, :n_components],
+                                   self.explained_variance_ratio[:n_components], self.message)
+
+    def components_for(self, fraction):
+        """@return: smallest number of components explaining at least this fraction of the variance"""
+        cumulative = np.cumsum(self.explained_variance_ratio)
+        return int(min(np.searchsorted(cumulative, fraction) + 1, self.n_components))
+
+
+class Cancelled(Exception):
+    """the fit was cancelled"""
+
+
+def _check(cancelled):
+    if cancelled is not None and cancelled():
+        raise Cancelled()
+
+
+def _flip_signs(components, scores):
+    """the largest loading of every component is positive, so that the result doesn't depend on the solver"""
+    signs = np.sign(components[np.arange(len(components)), np.argmax(np.abs(components), axis=1)])
+    signs[signs == 0] = 1
+    return components * signs[:, None], scores * signs
+
+
+def incremental_pca(stack, n_components, progress=None, cancelled=None):
+    """
+    PCA with sklearn IncrementalPCA, one pass to fit and one pass to compute the scores
+    @param stack: SpectrumStack
+    @param n_components: number of components
+    @param progress: function called with the fraction of the work done
+    @param cancelled: function returning True, if the fit should be stopped
+    @return: DecompositionResult
+    """
+    n_spectra = stack.shape[0]
+    ipca = decomposition.IncrementalPCA(n_components=n_components)
+    for start, chunk in stack.chunks(minimum=n_components):
+        _check(cancelled)
+        ipca.partial_fit(chunk)
+        if progress is not None:
+            progress(0.5 * (start + len(chunk)) / n_spectra)
+    scores = np.empty((n_spectra, n_components))
+    for start, chunk in stack.chunks():
+        _check(cancelled)
+        scores[start:start + len(chunk)] = ipca.transform(chunk)
+        if progress is not None:
+            progress(0.5 + 0.5 * (start + len(chunk)) / n_spectra)
+    components, scores = _flip_signs(ipca.components_, scores)
+    return DecompositionResult("PCA (incremental)", components, scores, ipca.explained_variance_ratio_)
+
+
+def randomized_pca(stack, n_components, progress=None, cancelled=None, n_oversamples=10, n_iter=4, seed=0):
+    """
+    PCA with a randomized SVD (Halko et al.), all products with the stack are computed chunk by chunk
+    @param stack: SpectrumStack
+    @param n_components: number of components
+    @param progress: function called with the fraction of the work done
+    @param cancelled: function returning True, if the fit should be stopped
+    @param n_oversamples: additional random vectors, which improve the accuracy
+    @param n_iter: number of power iterations
+    @param seed: seed of the random vectors
+    @return: DecompositionResult
+    """
+    n_spectra, n_points = stack.shape
+    n_passes = 2 * n_iter + 3
+    done = [0]
+
+    def next_pass():
+        _check(cancelled)
+        done[0] += 1
+        if progress is not None:
+            progress(done[0] / n_passes)
+
+    # mean spectrum
+    total = np.zeros(n_points)
+    for start, chunk in stack.chunks():
+        total += chunk.sum(axis=0)
+    mean = total / n_spectra
+    next_pass()
+
+    def times(matrix):
+        """(stack - mean) @ matrix"""
+        result = np.empty((n_spectra, matrix.shape[1]))
+        for start, chunk in stack.chunks():
+            result[start:start + len(chunk)] = (chunk - mean) @ matrix
+        return result
+
+    def transposed_times(matrix):
+        """(stack - mean).T @ matrix"""
+        result = np.zeros((n_points, matrix.shape[1]))
+        for start, chunk in stack.chunks():
+            result += (chunk - mean).T @ matrix[start:start + len(chunk)]
+        return result
+
+    k = min(n_components + n_oversamples, n_spectra, n_points)
+    rng = np.random.default_rng(seed)
+    omega = rng.standard_normal((n_points, k))
+    # the total variance is computed in the same pass
+    y = np.empty((n_spectra, k))
+    total_variance = 0.0
+    for start, chunk in stack.chunks():
+        centered = chunk - mean
+        y[start:start + len(chunk)] = centered @ omega
+        total_variance += np.sum(centered ** 2)
+    total_variance /= max(n_spectra - 1, 1)
+    next_pass()
+    for _ in range(n_iter):
+        q, _r = np.linalg.qr(y)
+        z, _r = np.linalg.qr(transposed_times(q))
+        next_pass()
+        y = times(z)
+        next_pass()
+    q, _r = np.linalg.qr(y)
+    b = transposed_times(q).T
+    next_pass()
+
+    u_b, s, vt = np.linalg.svd(b, full_matrices=False)
+    u = q @ u_b
+    components, scores = _flip_signs(vt[:n_components], u[:, :n_components] * s[:n_components])
+    explained_variance = s[:n_components] ** 2 / max(n_spectra - 1, 1)
+    return DecompositionResult("PCA (randomized SVD)", components, scores, explained_variance / total_variance)
+
+
+def minibatch_nmf(stack, n_components, progress=None, cancelled=None, n_epochs=10, seed=0):
+    """
+    NMF with sklearn MiniBatchNMF, every epoch is one pass over the stack, negative values are set to zero
+    @param stack: SpectrumStack
+    @param n_components: number of components
+    @param progress: function called with the fraction of the work done
+    @param cancelled: function returning True, if the fit should be stopped
+    @param n_epochs: number of passes over the stack
+    @param seed: seed of the initialization
+    @return: DecompositionResult, the components are sorted by the fraction of the data they explain
+    """
+    n_spectra = stack.shape[0]
+    n_negative = 0
+    if hasattr(decomposition, "MiniBatchNMF"):
+        nmf = decomposition.MiniBatchNMF(n_components=n_components, init="nndsvda", random_state=seed)
+        for epoch in range(n_epochs):
+            for start, chunk in stack.chunks(minimum=n_components):
+                _check(cancelled)
+                if epoch == 0:
+                    n_negative += np.count_nonzero(chunk < 0)
+                nmf.partial_fit(np.maximum(chunk, 0))
+                if progress is not None:
+                    progress(0.8 * (epoch + (start + len(chunk)) / n_spectra) / n_epochs)
+    else:
+        # MiniBatchNMF is available since scikit-learn 1.1, older versions fit the whole stack at once
+        nmf = decomposition.NMF(n_components=n_components, init="nndsvda", random_state=seed)
+        n_negative = np.count_nonzero(stack.array < 0)
+        nmf.fit(np.maximum(stack.array, 0))
+
+    # scores and explained fraction of the data
+    scores = np.empty((n_spectra, n_components))
+    total = 0.0
+    residual = 0.0
+    for start, chunk in stack.chunks():
+        _check(cancelled)
+        chunk = np.maximum(chunk, 0)
+        scores[start:start + len(chunk)] = nmf.transform(chunk)
+        total += np.sum(chunk ** 2)
+        residual += np.sum((chunk - scores[start:start + len(chunk)] @ nmf.components_) ** 2)
+        if progress is not None:
+            progress(0.8 + 0.2 * (start + len(chunk)) / n_spectra)
+    explained = 1 - residual / total if total > 0 else 0.0
+    # contribution of every component, scaled so that the sum is the explained fraction
+    share = np.sum(scores ** 2, axis=0) * np.sum(nmf.components_ ** 2, axis=1)
+    if np.sum(share) > 0:
+        share = share / np.sum(share) * explained
+    order = np.argsort(share)[::-1]
+
+    message = None
+    if n_negative:
+        message = "{} negative values were set to zero for the NMF".format(n_negative)
+    return DecompositionResult("NMF (mini-batch)", nmf.components_[order], scores[:, order], share[order], message)
+
+
+# name -> (function, True if the first components of a fit are the same as a fit with less components)
+methods = {
+    "PCA (incremental)": (incremental_pca, True),
+    "PCA (randomized SVD)": (randomized_pca, True),
+    "NMF (mini-batch)": (minibatch_nmf, False),
+}
+
+
+def decompose(columns, method, n_components, progress=None, cancelled=None, directory=None):
+    """
+    fit a model to the spectra
+    @param columns: list of 1D arrays with the same length (the spectra)
+    @param method: name of the method (see methods)
+    @param n_components: number of components
+    @param progress: function called with the fraction of the work done
+    @param cancelled: function returning True, if the fit should be stopped
+    @param directory: directory of the memory-mapped file
+    @return: DecompositionResult or None if the fit was cancelled
+    """
+    stack = SpectrumStack.from_columns(columns, directory)
+    try:
+        return methods[method][0](stack, n_components, progress=progress, cancelled=cancelled)
+    except Cancelled:
+        return None
+    finally:
+        stack.close()
+
+
+class ModelCache:
+    """
+    fitted models of the columns of a spreadsheet, so that the loadings and scores can be shown again without fitting
+    Columns are stored by their data dictionary, models are removed, if one of their columns is changed.
+    """
+
+    def __init__(self):
+        self.models = []  # list of (data dictionaries of the columns, DecompositionResult)
+
+    def get(self, columns_data, method, n_components):
+        """
+        @return: cached DecompositionResult or None, for PCA a model with more components is truncated
+        """
+        for cached_columns, result in self.models:
+            if result.method != method or len(cached_columns) != len(columns_data) or \
+                    not all(a is b for a, b in zip(cached_columns, columns_data)):
+                continue
+            if result.n_components == n_components:
+                return result
+            if methods[method][1] and result.n_components > n_components:
+                return result.truncate(n_components)
+        return None
+
+    def add(self, columns_data, result):
+        self.models.append((list(columns_data), result))
+
+    def invalidate(self, columns_data=None):
+        """
+        remove the models using one of the columns
+        @param columns_data: data dictionaries of the changed columns, None for all columns
+        """
+        if columns_data is None:
+            self.models = []
+            return
+        self.models = [m for m in self.models if not any(c is d for c in m[0] for d in columns_data)]
+
+
+class DecompositionThread(QtCore.QThread):
+    """runs decompose in a background thread"""
+    progress = QtCore.pyqtSignal(int)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, columns, method, n_components, parent=None):
+        """
+        @param columns: list of 1D arrays with the same length
+        @param method: name of the method
+        @param n_components: number of components
+        @param parent: QObject
+        """
+        super(DecompositionThread, self).__init__(parent)
+        self.columns = columns
+        self.method = method
+        self.n_components = n_components
+        self.result = None
+
+    def run(self):
+        try:
+            self.result = decompose(self.columns, self.method, self.n_components,
+                                    progress=lambda fraction: self.progress.emit(int(100 * fraction)),
+                                    cancelled=self.isInterruptionRequested)
+        except Exception as e:
+            self.failed.emit(str(e))
@@ -0,0 +1,442 @@
+"""
+Helper classes for the spreadsheet (SpreadSheetWindow), which work on the column data and don't depend on Qt.
+"""
+import re
+import warnings
+
+import numpy as np
+
+
+class ColumnRoleIndex:
+    """
+    index of the column types (X, Y, Yerr) of a spreadsheet
+
+    The X column of a Y column is the closest X column left of it, its Yerr column is the closest Yerr column right of
+    it. Both are stored for every column, so that all lookups are O(1). Changing the type of a column only updates the
+    columns up to the next column of the same type.
+    """
+
+    def __init__(self, column_types):
+        """
+        @param column_types: list with the type of every column ('X', 'Y' or 'Yerr')
+        """
+        self.types = []
+        self.x_of = []  # closest X column left of every column, None if there is none
+        self.yerr_of = []  # closest Yerr column right of every column, None if there is none
+        self.rebuild(column_types)
+
+    def rebuild(self, column_types):
+        """build the index from scratch, e.g. after columns were loaded, moved or deleted"""
+        self.types = list(column_types)
+        n = len(self.types)
+        self.x_of = [None] * n
+        self.yerr_of = [None] * n
+        last_x = None
+        for c, t in enumerate(self.types):
+            self.x_of[c] = last_x
+            if t == "X":
+                last_x = c
+        next_yerr = None
+        for c in range(n - 1, -1, -1):
+            self.yerr_of[c] = next_yerr
+            if self.types[c] == "Yerr":
+                next_yerr = c
+
+    def __len__(self):
+        return len(self.types)
+
+    def set_type(self, col, column_type):
+        """
+        change the type of column col
+        @param col: index of the column
+        @param column_type: 'X', 'Y' or 'Yerr'
+        """
+        old_type = self.types[col]
+        self.types[col] = column_type
+        if "X" in (old_type, column_type):
+            new_x = col if column_type == "X" else self.x_of[col]
+            for c in range(col + 1, len(self.types)):
+                self.x_of[c] = new_x
+                if self.types[c] == "X":
+                    break
+        if "Yerr" in (old_type, column_type):
+            new_yerr = col if column_type == "Yerr" else self.yerr_of[col]
+            for c in range(col - 1, -1, -1):
+                self.yerr_of[c] = new_yerr
+                if self.types[c] == "Yerr":
+                    break
+
+    def append(self, column_type):
+        """add a column at the end"""
+        if self.types:
+            last = len(self.types) - 1
+            self.x_of.append(last if self.types[last] == "X" else self.x_of[last])
+        else:
+            self.x_of.append(None)
+        self.yerr_of.append(None)
+        self.types.append(None)
+        self.set_type(len(self.types) - 1, column_type)
+
+    def move(self, old_idx, new_idx):
+        """move a column from old_idx to new_idx"""
+        self.types.insert(new_idx, self.types.pop(old_idx))
+        self.rebuild(self.types)
+
+    def x_column(self, col):
+        """@return: index of the X column assigned to column col or None"""
+        return self.x_of[col]
+
+    def yerr_column(self, col):
+        """@return: index of the Yerr column assigned to column col or None"""
+        return self.yerr_of[col]
+
+    def columns(self, column_type):
+        """@return: indices of all columns of this type"""
+        return [c for c, t in enumerate(self.types) if t == column_type]
+
+    def groups(self):
+        """
+        @return: dictionary X column -> list of the Y columns assigned to it
+        """
+        groups = {}
+        for c, t in enumerate(self.types):
+            if t == "Y" and self.x_of[c] is not None:
+                groups.setdefault(self.x_of[c], []).append(c)
+        return groups
+
+
+def column_values(column_data, n_rows):
+    """
+    @param column_data: data dictionary of a column
+    @param n_rows: number of rows of the spreadsheet
+    @return: float array of length n_rows, missing values are NaN
+    """
+    values = np.full(n_rows, np.nan)
+    column = np.asarray(column_data["data"], dtype=float)[:n_rows]
+    values[:len(column)] = column
+    return values
+
+
+class RowView:
+    """
+    sort order and row filters of a spreadsheet
+
+    Sorting and filtering is computed on the column arrays (argsort and boolean masks), the result is the order of the
+    visible rows, so that the table only has to show the rows in another order instead of rebuilding its items. The
+    sort order of every column is cached until the column is invalidated, e.g. because its data changed.
+    Columns are stored by their data dictionary, so that sort and filters stay valid if columns are moved.
+    """
+
+    def __init__(self):
+        self.sort_column = None  # data dictionary of the sorted column, None if not sorted
+        self.descending = False
+        self.filters = []  # list of (data dictionary, lower limit, upper limit)
+        self.orders = {}  # id of data dictionary -> (data dictionary, number of rows, ascending order)
+
+    def is_active(self):
+        return self.sort_column is not None or bool(self.filters)
+
+    def reset(self):
+        """show all rows in their original order"""
+        self.sort_column = None
+        self.filters = []
+
+    def invalidate(self, columns_data=None):
+        """
+        remove the cached sort order of the columns
+        @param columns_data: data dictionaries of the changed columns, None for all columns
+        """
+        if columns_data is None:
+            self.orders = {}
+            return
+        for d in columns_data:
+            self.orders.pop(id(d), None)
+
+    def sort(self, column_data, descending=False):
+        self.sort_column = column_data
+        self.descending = descending
+
+    def add_filter(self, column_data, low, high):
+        """show only rows with low <= value <= high in this column, filters of the same column are replaced"""
+        self.filters = [f for f in self.filters if f[0] is not column_data]
+        self.filters.append((column_data, low, high))
+
+    def order(self, column_data, n_rows):
+        """
+        @return: cached ascending (stable) order of the rows of this column, missing values are at the end
+        """
+        cached = self.orders.get(id(column_data))
+        if cached is not None and cached[0] is column_data and cached[1] == n_rows:
+            return cached[2]
+        order = np.argsort(column_values(column_data, n_rows), kind="stable")
+        self.orders[id(column_data)] = (column_data, n_rows, order)
+        return order
+
+    def rows(self, data, n_rows):
+        """
+        @param data: spreadsheet data, list of dictionaries
+        @param n_rows: number of rows of the spreadsheet
+        @return: indices of the visible rows in the order they are shown
+        """
+        # forget columns, which were deleted
+        if self.sort_column is not None and not any(d is self.sort_column for d in data):
+            self.sort_column = None
+        self.filters = [f for f in self.filters if any(d is f[0] for d in data)]
+        self.orders = {key: value for key, value in self.orders.items() if any(d is value[0] for d in data)}
+
+        if self.sort_column is None:
+            order = np.arange(n_rows)
+        else:
+            order = self.order(self.sort_column, n_rows)
+            if self.descending:
+                n_valid = np.count_nonzero(~np.isnan(column_values(self.sort_column, n_rows)))
+                order = np.concatenate([order[:n_valid][::-1], order[n_valid:]])
+
+        if not self.filters:
+            return order
+        visible = np.ones(n_rows, dtype=bool)
+        for column_data, low, high in self.filters:
+            values = column_values(column_data, n_rows)
+            with np.errstate(invalid="ignore"):
+                visible &= (values >= low) & (values <= high)
+        return order[visible[order]]
+
+
+def find_value(data, text, n_rows):
+    """
+    find all cells containing a value with the precision it was typed with, e.g. '1234.5' finds all values between
+    1234.45 and 1234.55 and '12' all values between 11.5 and 12.5, values with exponent are compared exactly
+    @param data: spreadsheet data, list of dictionaries
+    @param text: value as typed by the user
+    @param n_rows: number of rows of the spreadsheet
+    @return: row and column indices of the matching cells
+    """
+    value = float(text)
+    text = text.strip().lower()
+    # the value is matched with the precision it was typed with
+    if "e" in text or not np.isfinite(value):
+        tolerance = 0
+    elif "." in text:
+        tolerance = 0.5 * 10.0 ** -len(text.split(".")[1])
+    else:
+        tolerance = 0.5
+    table = np.stack([column_values(d, n_rows) for d in data], axis=1) if data else np.empty((n_rows, 0))
+    if np.isnan(value):
+        match = np.isnan(table)
+    elif tolerance == 0:
+        match = np.isclose(table, value, rtol=1e-12, atol=0)
+    else:
+        with np.errstate(invalid="ignore"):
+            match = np.abs(table - value) < tolerance * (1 + 1e-9)
+    return np.nonzero(match)
+
+
+def parse_table(text):
+    """
+    parse a block of numbers copied from a spreadsheet program or a text file, e.g. from the clipboard
+    The delimiter (tab, semicolon, comma or whitespace) is detected. Without tabs and semicolons, a comma is the
+    delimiter if the text contains decimal points or if every line has the same number of commas, otherwise it is a
+    decimal comma. Empty and non numeric cells are NaN.
+    @param text: rows separated by line breaks, cells separated by the delimiter
+    @return: 2D float array (rows x columns)
+    @raise ValueError: if it is unclear whether the commas are delimiters or decimal commas
+    """
+    lines = text.splitlines()
+    while lines and not lines[-1].strip():
+        lines.pop()
+    if not lines:
+        return np.empty((0, 0))
+    if "\t" in text:
+        delimiter = "\t"
+    elif ";" in text:
+        delimiter = ";"
+    elif "," in text:
+        delimiter = comma_delimiter(lines)
+    else:
+        delimiter = None
+    if delimiter != "," and "," in text:
+        lines = [line.replace(",", ".") for line in lines]
+    rows = [line.split(delimiter) for line in lines]
+
+    n_cols = max(len(r) for r in rows)
+    cells = np.full((len(rows), n_cols), "", dtype=object)
+    lengths = np.array([len(r) for r in rows])
+    if np.all(lengths == n_cols):
+        cells[:] = rows
+    else:
+        for idx, r in enumerate(rows):
+            cells[idx, :len(r)] = r
+    cells = cells.astype(str)
+    cells[np.char.str_len(np.char.strip(cells)) == 0] = "nan"
+    try:
+        return cells.astype(float)
+    except ValueError:
+        # at least one cell isn't a number (e.g. a header line), convert every cell on its own
+        values = np.full(cells.shape, np.nan)
+        for idx, cell in np.ndenumerate(cells):
+            try:
+                values[idx] = float(cell)
+            except ValueError:
+                pass
+        return values
+
+
+def comma_delimiter(lines):
+    """
+    decide whether the commas of lines without tabs and semicolons are delimiters or decimal commas
+    @param lines: lines of the text
+    @return: "," if the commas are delimiters, None (whitespace delimiter) if they are decimal commas
+    @raise ValueError: if it can't be decided
+    """
+    text = "\n".join(lines)
+    if "." in text:
+        return ","
+    lines = [line.strip() for line in lines if line.strip()]
+    # header lines (text) don't count
+    lines = [line for line in lines if re.fullmatch(r"[\d\s,+\-eE]+", line)] or lines
+    text = "\n".join(lines)
+    if any(len(line.split()) > 1 for line in lines):
+        # several numbers per line separated by whitespace, e.g. 1,5 2,5
+        return None
+    counts = {line.count(",") for line in lines}
+    if len(counts) == 1 and counts != {0}:
+        # the same number of commas in every line: columns, unless a number looks like 1,234 (a decimal comma or a
+        # thousands separator could be meant as well)
+        if re.search(r"(^|[^\d])\d+,\d{3}($|[^\d])", text):
+            raise ValueError("Ambiguous commas (e.g. 1,234), please use tabs or semicolons as delimiter")
+        return ","
+    if max(counts) <= 1:
+        # one column with decimal commas, e.g. 1,5 and 2
+        return None
+    raise ValueError("Different number of commas in the lines, please use tabs or semicolons as delimiter")
+
+
+def format_table(values):
+    """
+    format a 2D array as tab separated text, which can be pasted into other spreadsheet programs, NaN is empty
+    @param values: 2D float array (rows x columns)
+    @return: text
+    """
+    # str() of Python floats is much faster than the string conversion of numpy, v != v is True for NaN
+    rows = np.asarray(values, dtype=float).tolist()
+    return "".join("\t".join("" if v != v else str(v) for v in row) + "\n" for row in rows)
+
+
+class ColumnStatistics:
+    """
+    cached statistics of the spreadsheet columns (number of values, NaN count, min, max, mean, standard deviation and
+    the spacing of the values, which shows if an x axis is uniform)
+
+    The statistics of every column are cached until the column is invalidated, e.g. because its data changed. Missing
+    statistics are computed together for all columns of the same length with vectorized reductions.
+    Columns are stored by their data dictionary, so that the cache stays valid if columns are moved.
+    """
+    names = ["Values", "NaN", "Min", "Max", "Mean", "Std", "Step", "Step deviation", "Monotonic"]
+
+    def __init__(self):
+        self.cache = {}  # id of data dictionary -> (data dictionary, statistics)
+
+    def invalidate(self, columns_data=None):
+        """
+        remove the cached statistics of the columns
+        @param columns_data: data dictionaries of the changed columns, None for all columns
+        """
+        if columns_data is None:
+            self.cache = {}
+            return
+        for d in columns_data:
+            self.cache.pop(id(d), None)
+
+    def get(self, data):
+        """
+        @param data: spreadsheet data, list of dictionaries
+        @return: list with the statistics (dictionary with the keys of ColumnStatistics.names) of every column
+        """
+        # forget columns, which were deleted
+        self.cache = {id(d): self.cache[id(d)] for d in data if self.cached(d) is not None}
+        missing = [d for d in data if self.cached(d) is None]
+        # columns with the same length are computed together
+        by_length = {}
+        for d in missing:
+            by_length.setdefault(len(d["data"]), []).append(d)
+        for columns in by_length.values():
+            table = np.stack([np.asarray(d["data"], dtype=float) for d in columns], axis=1)
+            for d, statistics in zip(columns, self.compute(table)):
+                self.cache[id(d)] = (d, statistics)
+        return [self.cached(d) for d in data]
+
+    def cached(self, column_data):
+        cached = self.cache.get(id(column_data))
+        if cached is not None and cached[0] is column_data:
+            return cached[1]
+        return None
+
+    @staticmethod
+    def compute(table):
+        """
+        @param table: 2D float array, one column for every spreadsheet column
+        @return: list with the statistics of every column
+        """
+        nan = np.isnan(table)
+        n_values = table.shape[0] - np.count_nonzero(nan, axis=0)
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            # columns containing only NaN give NaN (and a warning, which isn't needed here)
+            warnings.simplefilter("ignore", RuntimeWarning)
+            minimum = np.nanmin(table, axis=0) if table.size else np.full(table.shape[1], np.nan)
+            maximum = np.nanmax(table, axis=0) if table.size else np.full(table.shape[1], np.nan)
+            mean = np.nanmean(table, axis=0)
+            std = np.nanstd(table, axis=0)
+            step, deviation, increasing, decreasing = ColumnStatistics.spacing(table)
+            # the steps of columns containing NaN are computed without the NaN values
+            for c in np.flatnonzero(np.any(nan, axis=0)):
+                spacing = ColumnStatistics.spacing(table[~nan[:, c], c][:, None])
+                step[c], deviation[c], increasing[c], decreasing[c] = [v[0] for v in spacing]
+
+        statistics = []
+        for c in range(table.shape[1]):
+            if n_values[c] < 2:
+                monotonic = ""
+            elif increasing[c]:
+                monotonic = "increasing"
+            elif decreasing[c]:
+                monotonic = "decreasing"
+            else:
+                monotonic = "no"
+            statistics.append({"Values": int(n_values[c]), "NaN": int(table.shape[0] - n_values[c]),
+                               "Min": minimum[c], "Max": maximum[c], "Mean": mean[c], "Std": std[c],
+                               "Step": step[c], "Step deviation": deviation[c], "Monotonic": monotonic})
+        return statistics
+
+    @staticmethod
+    def spacing(table):
+        """
+        @param table: 2D float array without NaN values
+        @return: median step, maximal relative deviation from the median step, if the values are increasing, if the
+        values are decreasing (arrays with one value for every column)
+        """
+        steps = np.diff(table, axis=0)
+        if len(steps) == 0:
+            n = table.shape[1]
+            return np.full(n, np.nan), np.full(n, np.nan), np.zeros(n, dtype=bool), np.zeros(n, dtype=bool)
+        step = np.median(steps, axis=0)
+        deviation = np.max(np.abs(steps - step), axis=0) / np.abs(step)
+        return step, deviation, np.all(steps > 0, axis=0), np.all(steps < 0, axis=0)
+
+
+_number_pattern = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+def metadata_values(columns, key):
+    """
+    first number in a text entry of every column, e.g. 300 of the long name 'T = 300 K', used to color spectra
+    @param columns: list of column dictionaries
+    @param key: key of the text entry, e.g. 'longname', 'comments' or 'filename'
+    @return: float array or None if an entry doesn't contain a number
+    """
+    values = []
+    for c in columns:
+        match = _number_pattern.search(str(c.get(key) or ""))
+        if match is None:
+            return None
+        values.append(float(match.group()))
+    return np.array(values)
@@ -0,0 +1,253 @@
+"""
+Undo and redo of data changes in spreadsheets and plot windows
+
+An operation records the values it is going to change (e.g. the "y" entry of the data dictionary of a spectrum) in a
+Change before it changes them. When the operation is finished, every recorded value is compared with its new value:
+- unchanged values are dropped
+- arrays with only a few changed points are stored as delta (changed indices, old and new values)
+- all other values keep a reference to the old and the new object (copy-on-write: operations replacing an array, e.g.
+  y = y / y_max, don't need any copy)
+
+UndoStack holds the changes within a memory budget, the oldest changes are removed first.
+
+This module doesn't depend on Qt.
+"""
+import contextlib
+import sys
+
+import numpy as np
+
+
+def value_nbytes(value):
+    """memory used by a recorded value"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return sys.getsizeof(value)
+
+
+class _Entry:
+    """one value container[key] changed by an operation"""
+
+    def __init__(self, container, key, old, index=None):
+        self.container = container
+        self.key = key
+        # either old and new value (snapshot) or changed indices with the old and new values there (delta)
+        self.old = old
+        self.new = None
+        self.index = index
+
+    @property
+    def nbytes(self):
+        if self.index is not None:
+            return self.index.nbytes + self.old.nbytes + self.new.nbytes
+        # the new value is either the current value or the old value of a later change, so it doesn't need memory
+        # of its own
+        return value_nbytes(self.old)
+
+    def finish(self, delta_ratio):
+        """
+        get the new value and store the change compactly
+        @param delta_ratio: a delta is stored, if it needs less than this fraction of the memory of the array
+        @return: False if the value didn't change
+        """
+        current = self.container[self.key]
+        if self.index is not None:
+            # values changed in place at known indices
+            self.new = np.array(current.flat[self.index])
+            changed = self.old != self.new
+            if np.issubdtype(self.old.dtype, np.floating):
+                changed &= ~(np.isnan(self.old) & np.isnan(self.new))
+            return bool(np.any(changed))
+
+        old, new = self.old, current
+        if not (isinstance(old, np.ndarray) and isinstance(new, np.ndarray)):
+            self.new = new
+            if old is new:
+                return False
+            try:
+                return bool(old != new)
+            except (ValueError, TypeError):
+                # e.g. lists of arrays
+                return True
+        if old.shape != new.shape or old.dtype != new.dtype:
+            self.new = np.array(new) if np.may_share_memory(old, new) else new
+            return True
+
+        changed = old != new
+        if np.issubdtype(old.dtype, np.floating):
+            changed &= ~(np.isnan(old) & np.isnan(new))
+        index = np.flatnonzero(changed)
+        if index.size == 0:
+            return False
+        delta_nbytes = index.size * (index.itemsize + 2 * old.itemsize)
+        if delta_nbytes < delta_ratio * old.nbytes:
+            self.index = index
+            self.old = np.array(old.flat[index])
+            self.new = np.array(new.flat[index])
+        elif np.may_share_memory(old, new):
+            # e.g. np.flip returns a view of the old array
+            self.new = np.array(new)
+        else:
+            self.new = new
+        return True
+
+    def apply(self, value):
+        """set the old (undo) or the new (redo) value"""
+        if self.index is None:
+            self.container[self.key] = value
+        else:
+            # copy-on-write, the current array can be used somewhere else too
+            restored = np.array(self.container[self.key])
+            restored.flat[self.index] = value
+            self.container[self.key] = restored
+
+
+class Change:
+    """all values changed by one operation"""
+
+    def __init__(self, text, refresh=None, delta_ratio=0.5):
+        """
+        @param text: name of the operation, e.g. 'Normalize'
+        @param refresh: function called after undo and redo, e.g. to update the plot
+        @param delta_ratio: see _Entry.finish
+        """
+        self.text = text
+        self.refresh = refresh
+        self.delta_ratio = delta_ratio
+        self.entries = []
+
+    def save(self, container, key, in_place=False):
+        """
+        record container[key] before it is changed
+        @param container: dictionary (or list) containing the value
+        @param key: key of the value
+        @param in_place: True if the array is changed in place, then it has to be copied now
+        """
+        value = container[key]
+        if in_place:
+            value = np.array(value, copy=True)
+        self.entries.append(_Entry(container, key, value))
+
+    def save_values(self, container, key, index):
+        """
+        record only some values of the array container[key], which are changed in place afterwards. container[key] is
+        replaced by a copy (copy-on-write), because the array itself can be the old or new value of earlier changes.
+        @param container: dictionary (or list) containing the array
+        @param key: key of the array
+        @param index: flat indices of the values, which are changed
+        """
+        index = np.atleast_1d(np.asarray(index, dtype=np.intp))
+        container[key] = np.array(container[key])
+        self.entries.append(_Entry(container, key, np.array(container[key].flat[index]), index=index))
+
+    def finish(self):
+        """
+        compare all recorded values with their new values
+        @return: True if anything changed
+        """
+        self.entries = [e for e in self.entries if e.finish(self.delta_ratio)]
+        return bool(self.entries)
+
+    @property
+    def nbytes(self):
+        return sum(e.nbytes for e in self.entries)
+
+    def undo(self):
+        for e in reversed(self.entries):
+            e.apply(e.old)
+        if self.refresh is not None:
+            self.refresh()
+
+    def redo(self):
+        for e in self.entries:
+            e.apply(e.new)
+        if self.refresh is not None:
+            self.refresh()
+
+
+class UndoStack:
+    """undo and redo stack with a memory budget"""
+
+    def __init__(self, memory_budget=256 * 1024 ** 2):
+        """
+        @param memory_budget: maximal memory of all stored changes in bytes
+        """
+        self.memory_budget = memory_budget
+        self.undo_changes = []
+        self.redo_changes = []
+
+    @contextlib.contextmanager
+    def record(self, text, refresh=None):
+        """
+        record the changes of an operation, the values have to be saved with Change.save before they are changed:
+
+        with undo_stack.record("Normalize", refresh) as change:
+            change.save(d, "y")
+            d["y"] = d["y"] / np.max(d["y"])
+
+        @param text: name of the operation
+        @param refresh: function called after undo and redo
+        """
+        change = Change(text, refresh)
+        yield change
+        self.push(change)
+
+    def push(self, change):
+        """add a finished operation, the redo stack is cleared"""
+        if not change.finish():
+            return
+        self.undo_changes.append(change)
+        self.redo_changes = []
+        self.evict()
+
+    def evict(self):
+        """remove the oldest changes until the memory budget is kept, the newest change is always kept"""
+        nbytes = self.nbytes
+        while nbytes > self.memory_budget and len(self.undo_changes) + len(self.redo_changes) > 1:
+            if self.undo_changes:
+                nbytes -= self.undo_changes.pop(0).nbytes
+            else:
+                # the redo change farthest away from the current state
+                nbytes -= self.redo_changes.pop(0).nbytes
+
+    def set_memory_budget(self, memory_budget):
+        self.memory_budget = memory_budget
+        self.evict()
+
+    @property
+    def nbytes(self):
+        return sum(c.nbytes for c in self.undo_changes) + sum(c.nbytes for c in self.redo_changes)
+
+    def can_undo(self):
+        return bool(self.undo_changes)
+
+    def can_redo(self):
+        return bool(self.redo_changes)
+
+    def undo(self):
+        """
+        undo the last operation
+        @return: name of the operation or None if there is nothing to undo
+        """
+        if not self.undo_changes:
+            return None
+        change = self.undo_changes.pop()
+        change.undo()
+        self.redo_changes.append(change)
+        return change.text
+
+    def redo(self):
+        """
+        redo the last undone operation
+        @return: name of the operation or None if there is nothing to redo
+        """
+        if not self.redo_changes:
+            return None
+        change = self.redo_changes.pop()
+        change.redo()
+        self.undo_changes.append(change)
+        return change.text
+
+    def clear(self):
+        self.undo_changes = []
+        self.redo_changes = []
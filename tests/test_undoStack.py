@@ -0,0 +1,47 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import undoStack  # noqa: E402
+
+
+def edit_cell(stack, column, row, value):
+    """edit of a spreadsheet cell as done by SpreadSheetWindow.update_data"""
+    with stack.record("Edit cell") as change:
+        change.save_values(column, "data", row)
+        column["data"][row] = value
+
+
+def test_flip_then_edit_cell():
+    stack = undoStack.UndoStack()
+    column = {"data": np.arange(5.0)}
+    with stack.record("Flip column") as change:
+        change.save(column, "data")
+        column["data"] = np.flip(column["data"])
+    edit_cell(stack, column, 0, 99)
+    np.testing.assert_array_equal(column["data"], [99, 3, 2, 1, 0])
+    stack.undo()
+    np.testing.assert_array_equal(column["data"], [4, 3, 2, 1, 0])
+    stack.undo()
+    np.testing.assert_array_equal(column["data"], [0, 1, 2, 3, 4])
+    stack.redo()
+    stack.redo()
+    np.testing.assert_array_equal(column["data"], [99, 3, 2, 1, 0])
+
+
+def test_replace_then_edit_cell():
+    stack = undoStack.UndoStack()
+    column = {"data": np.arange(5.0)}
+    with stack.record("Multiply") as change:
+        change.save(column, "data")
+        column["data"] = column["data"] * 2
+    edit_cell(stack, column, 1, -1)
+    stack.undo()
+    stack.undo()
+    np.testing.assert_array_equal(column["data"], [0, 1, 2, 3, 4])
+    stack.redo()
+    np.testing.assert_array_equal(column["data"], [0, 2, 4, 6, 8])
+    stack.redo()
+    np.testing.assert_array_equal(column["data"], [0, -1, 4, 6, 8])